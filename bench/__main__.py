@@ -0,0 +1,125 @@
+"""Замеры производительности стека канала.
+
+Запуск из корня репозитория:
+    python -m bench                   # все замеры, сравнение с bench/baseline.json
+    python -m bench --quick           # сокращенный прогон
+    python -m bench --save-baseline   # записать результаты как новую базу
+    python -m bench --only codec      # только замеры, имя которых содержит строку
+
+Результаты пишутся в JSON (--output). Если есть база, каждое значение
+сравнивается с ней, и ухудшение больше порога (--threshold) считается
+регрессией: они печатаются, а код возврата становится 1.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from bench.link import bench_baud, bench_corpus, bench_handshake, bench_link, bench_message
+from bench.micro import bench_codec, bench_compress, bench_fec, bench_frame, bench_handshake_logic, bench_reorder
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+BAUDRATES = (9600, 115200)
+BIT_ERROR_RATES = (0.0, 1e-4, 1e-3)
+
+def collect(quick: bool, only: str | None) -> dict:
+    """Выполняет замеры и возвращает {имя: {value, unit, better}}."""
+    scale = 1 if quick else 4
+    suites = [
+        ('codec', lambda: bench_codec(64 * 1024 * scale)),
+        ('fec', lambda: bench_fec(261, 500 * scale)),
+        ('compress', lambda: bench_compress(200 * scale)),
+        ('frame', lambda: bench_frame(5000 * scale)),
+        ('handshake.logic', lambda: bench_handshake_logic(2000 * scale)),
+        ('reorder', lambda: bench_reorder(200 * scale)),
+        ('handshake.loopback', lambda: bench_handshake(10 * scale)),
+        ('message', lambda: bench_message(1024 * 1024)),
+    ]
+    for baudrate in BAUDRATES:
+        for ber in BIT_ERROR_RATES:
+            # Около scale секунд передачи: 2 байта в линии на байт данных, 10 бит на байт
+            total = int(baudrate / 10 / 2 * scale)
+            suites.append((f'link.{baudrate}.ber{ber:g}',
+                           lambda b=baudrate, e=ber, t=total: bench_link(b, e, t, 200, 10 * scale)))
+    for baudrate in BAUDRATES:
+        total = int(baudrate / 10 / 2 * scale)
+        suites.append((f'duplex.{baudrate}', lambda b=baudrate, t=total: bench_link(b, 0.0, t, 200, 10 * scale,
+                                                                                   threads=True)))
+    # Потери записей на линии: переход на новую скорость не должен оставлять узлы на разных скоростях
+    suites.append(('baud.9600-115200.drop0.3', lambda: bench_baud(0.3, 5 * scale)))
+    for corpus in ('chat', 'telemetry'):
+        # Около scale секунд передачи без сжатия на 9600 бод
+        suites.append((f'corpus.9600.{corpus}', lambda c=corpus: bench_corpus(9600, c, 10 * scale)))
+
+    results = {}
+    for name, suite in suites:
+        if only and only not in name:
+            continue
+        start = time.perf_counter()
+        for metric, (value, unit, better) in suite().items():
+            results[metric] = {'value': value, 'unit': unit, 'better': better}
+            print(f"  {metric:<40} {value:>14.3f} {unit}")
+        print(f"[{name}: {time.perf_counter() - start:.1f} с]")
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Возвращает описания регрессий относительно базы."""
+    regressions = []
+    for metric, entry in results.items():
+        base = baseline.get(metric)
+        if not base or not base['value']:
+            continue
+        change = (entry['value'] - base['value']) / base['value']
+        worse = -change if entry['better'] == 'higher' else change
+        if worse > threshold:
+            regressions.append(f"{metric}: {base['value']:.3f} -> {entry['value']:.3f} {entry['unit']} "
+                               f"(хуже на {worse:.0%})")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m bench', description="Замеры производительности стека канала")
+    parser.add_argument('--quick', action='store_true', help="сокращенный прогон")
+    parser.add_argument('--only', help="выполнить только замеры, имя которых содержит строку")
+    parser.add_argument('--output', default='bench_results.json', help="файл для результатов в JSON")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="файл базы для сравнения")
+    parser.add_argument('--save-baseline', action='store_true', help="сохранить результаты как базу")
+    parser.add_argument('--threshold', type=float, default=0.2, help="допустимое ухудшение (доля, по умолчанию 0.2)")
+    args = parser.parse_args()
+
+    results = collect(args.quick, args.only)
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': args.quick,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Результаты записаны в {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"База сохранена в {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("База не найдена, сравнение пропущено (см. --save-baseline)")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("Регрессии:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("Регрессий нет")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
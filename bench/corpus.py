@@ -0,0 +1,51 @@
+"""Типичный трафик канала для замеров сжатия: переписка и телеметрия.
+
+Генераторы детерминированы (seed), чтобы результаты были сравнимы между прогонами.
+"""
+import json
+import random
+
+_PHRASES = (
+    "Привет!", "Как дела?", "Все нормально, работаем.", "Связь есть, сигнал слабый.",
+    "Проверка связи", "Принял, спасибо.", "Да", "Нет", "Ок", "Буду через 10 минут.",
+    "Перезагружаю узел, подожди.", "Сообщение получил, отвечу позже.",
+    "Hello, how are you?", "See you later.", "Отправил файл, проверь.",
+    "Сегодня на линии много помех.", "Завтра продолжим настройку.", "Понял, пока!",
+)
+
+def chat_messages(count: int, seed: int = 1) -> list[bytes]:
+    """Короткие реплики чата: одна-три фразы, иногда с номером."""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        text = " ".join(rng.choice(_PHRASES) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.2:
+            text += f" #{rng.randint(1, 999)}"
+        messages.append(text.encode('utf-8'))
+    return messages
+
+def telemetry_messages(count: int, seed: int = 1) -> list[bytes]:
+    """JSON-записи датчика с медленно меняющимися значениями."""
+    rng = random.Random(seed)
+    temp, hum, volt = 21.0, 40.0, 3.3
+    messages = []
+    for i in range(count):
+        temp += rng.uniform(-0.2, 0.2)
+        hum += rng.uniform(-0.5, 0.5)
+        volt -= rng.uniform(0, 0.001)
+        record = {'id': 7, 'time': 1700000000 + i * 10, 'status': 'ok',
+                  'temp': round(temp, 1), 'hum': round(hum), 'volt': round(volt, 3),
+                  'rssi': rng.randint(-90, -60)}
+        messages.append(json.dumps(record).encode('utf-8'))
+    return messages
+
+def batch_messages(count: int, seed: int = 1) -> list[bytes]:
+    """Пачки по 40 записей телеметрии в одном сообщении (выгрузка журнала)."""
+    records = telemetry_messages(count * 40, seed)
+    return [b"\n".join(records[i:i + 40]) for i in range(0, len(records), 40)]
+
+CORPORA = {
+    'chat': chat_messages,
+    'telemetry': telemetry_messages,
+    'batch': batch_messages,
+}
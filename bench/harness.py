@@ -0,0 +1,133 @@
+import asyncio
+import statistics
+import time
+from connection import Connection
+from duplex import DuplexLink
+from engine import LinkEngine
+from message import MessageChannel
+
+class Peer:
+    """Узел для замеров: соединение, сборка сообщений и движок на заданном порту.
+
+    Соединение и сборку трогает только поток движка, сценарий обращается
+    к ним через engine.call_soon (для DuplexLink это другой поток).
+    """
+
+    def __init__(self, port, local_addr: int, remote_addr: int, nick: str, threads: bool = False,
+                 **connection_kwargs):
+        self.connection = Connection(local_addr, remote_addr, local_nick=nick, **connection_kwargs)
+        self.channel = MessageChannel(self.connection)
+        engine = DuplexLink if threads else LinkEngine
+        self.engine = engine(port, self.on_frame, self.on_tick)
+        self.received = []  # (время, сообщение)
+
+    def on_frame(self, frame):
+        response = self.connection.handle_frame(frame)
+        if response:
+            self.engine.send(response)
+        self.apply_baudrate()
+        now = time.perf_counter()
+        for message in self.channel.receive():
+            self.received.append((now, bytes(message)))
+
+    def on_tick(self):
+        retry = self.connection.check_timeout()
+        if retry:
+            self.engine.send(retry)
+        for frame in self.connection.poll_outgoing():
+            self.engine.send(frame)
+        self.apply_baudrate()
+        return self.connection.next_timeout()
+
+    def apply_baudrate(self):
+        """Переводит порт на скорость, согласованную или возвращенную соединением."""
+        rate = self.connection.take_baudrate()
+        if rate is not None:
+            self.engine.set_baudrate(rate)
+
+class LinkPair:
+    """Два узла, соединенные парой портов; сценарий идет в цикле asyncio.
+
+    threads=True - узлы работают на потоковом DuplexLink вместо LinkEngine.
+    """
+
+    def __init__(self, port_a, port_b, threads: bool = False, **connection_kwargs):
+        self.a = Peer(port_a, 0x42, 0x01, "A", threads, **connection_kwargs)
+        self.b = Peer(port_b, 0x01, 0x42, "B", threads, **connection_kwargs)
+
+    def run(self, scenario):
+        """Запускает оба движка, выполняет корутину scenario(pair) и останавливает их."""
+        async def main():
+            tasks = [asyncio.create_task(peer.engine.run()) for peer in (self.a, self.b)]
+            await asyncio.sleep(0)
+            try:
+                return await scenario(self)
+            finally:
+                for peer in (self.a, self.b):
+                    peer.engine.stop()
+                await asyncio.gather(*tasks)
+        return asyncio.run(main())
+
+    async def connect(self, timeout: float = 30.0) -> float:
+        """Устанавливает соединение A -> B и возвращает время до ACK в секундах."""
+        start = time.perf_counter()
+        self.a.engine.call_soon(lambda: self.a.engine.send(self.a.connection.connect()))
+        await self.wait(self.a.connection.is_connected, timeout)
+        return time.perf_counter() - start
+
+    async def transfer(self, messages: list[bytes], timeout: float = 300.0) -> dict:
+        """Отправляет сообщения A -> B; возвращает полезную скорость и задержки."""
+        self.b.received.clear()
+        sent_at = []
+        start = time.perf_counter()
+
+        def send_all():
+            for message in messages:
+                sent_at.append(time.perf_counter())
+                self.a.channel.send(message)
+        self.a.engine.call_soon(send_all)
+        await self.wait(lambda: len(self.b.received) >= len(messages), timeout)
+        elapsed = time.perf_counter() - start
+        if [m for _, m in self.b.received] != messages:
+            raise AssertionError("Сообщения доставлены с искажениями или не по порядку")
+        latencies = [t - s for (t, _), s in zip(self.b.received, sent_at)]
+        return {
+            'goodput': sum(map(len, messages)) / elapsed,
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99),
+        }
+
+    async def ping(self, count: int, size: int, timeout: float = 60.0) -> list[float]:
+        """Отправляет сообщения по одному, дожидаясь доставки каждого; возвращает задержки."""
+        samples = []
+        for _ in range(count):
+            self.b.received.clear()
+            start = time.perf_counter()
+            self.a.engine.call_soon(lambda: self.a.channel.send(bytes(size)))
+            await self.wait(lambda: self.b.received, timeout)
+            samples.append(self.b.received[0][0] - start)
+        return samples
+
+    @staticmethod
+    async def wait(predicate, timeout: float):
+        deadline = time.perf_counter() + timeout
+        while not predicate():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("Превышено время ожидания")
+            await asyncio.sleep(0.001)
+
+def percentile(values: list[float], q: float) -> float:
+    """Процентиль q (0-100) по методу ближайшего ранга."""
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[max(0, min(98, round(q) - 1))]
+
+def best_rate(func, count: int, repeat: int = 5) -> float:
+    """Лучшая из repeat попыток скорость вызова func (вызовов в секунду)."""
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            func()
+        best = max(best, count / (time.perf_counter() - start))
+    return best
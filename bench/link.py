@@ -0,0 +1,165 @@
+import os
+import time
+from compress import DEFAULT_COMPRESSIONS
+from fec import preferred_codecs
+from metrics import METRICS
+from transport import impaired_pair, loopback_pair
+from bench.corpus import CORPORA
+from bench.harness import LinkPair, percentile
+
+def bench_handshake(rounds: int) -> dict:
+    """Время connect() -> ACK через движки на паре портов без задержек линии."""
+    samples = []
+    for _ in range(rounds):
+        a, b = loopback_pair()
+        pair = LinkPair(a, b)
+        samples.append(pair.run(lambda p: p.connect()))
+        a.close()
+        b.close()
+    return {
+        'handshake.loopback_p50_ms': (percentile(samples, 50) * 1e3, 'ms', 'lower'),
+        'handshake.loopback_p99_ms': (percentile(samples, 99) * 1e3, 'ms', 'lower'),
+    }
+
+def bench_link(baudrate: int, bit_error_rate: float, total: int, message_size: int, pings: int,
+               seed: int = 1, threads: bool = False) -> dict:
+    """Полезная скорость и задержка доставки сообщений через эмулируемую линию.
+
+    Сначала передается поток сообщений общим объемом total (задержки в нем -
+    это в основном ожидание в очереди), затем pings коротких сообщений по
+    одному - по ним считаются p50/p99 задержки на свободной линии.
+    threads=True - то же на потоковом DuplexLink (замеры duplex.*).
+    """
+    a, b = impaired_pair(baudrate, bit_error_rate=bit_error_rate, seed=seed)
+    pair = LinkPair(a, b, threads, line_rate=baudrate / a.bits_per_byte)
+    # Схему кодирования выбираем так, как выбрал бы узел, уже измеривший эту линию
+    pair.a.connection.codecs = preferred_codecs(bit_error_rate)
+    messages = [os.urandom(message_size) for _ in range(max(1, total // message_size))]
+
+    async def scenario(p):
+        await p.connect()
+        result = await p.transfer(messages)
+        result['latency'] = await p.ping(pings, 32)
+        return result
+    try:
+        result = pair.run(scenario)
+    finally:
+        a.close()
+        b.close()
+    name = f"{'duplex' if threads else 'link'}.{baudrate}.ber{bit_error_rate:g}"
+    return {
+        f'{name}.goodput_bps': (result['goodput'], 'B/s', 'higher'),
+        f'{name}.efficiency': (result['goodput'] * 10 / baudrate, 'ratio', 'higher'),
+        f'{name}.bulk_p99_ms': (result['p99'] * 1e3, 'ms', 'lower'),
+        f'{name}.latency_p50_ms': (percentile(result['latency'], 50) * 1e3, 'ms', 'lower'),
+        f'{name}.latency_p99_ms': (percentile(result['latency'], 99) * 1e3, 'ms', 'lower'),
+    }
+
+def bench_baud(drop_rate: float, runs: int, count: int = 3, size: int = 200) -> dict:
+    """Согласование скорости 9600 -> 115200 на линии, теряющей записи.
+
+    В каждом прогоне (свой seed линии) A соединяется с B, узлы ждут исхода
+    проверки новой скорости, затем A передает count сообщений по size байт.
+    agreed - доля установленных соединений, где узлы остались на одной
+    скорости: иначе они перестают слышать друг друга, и передачу в таком
+    прогоне не начинаем. delivered - доля прогонов с доставленными сообщениями.
+    """
+    connected = agreed = delivered = switched = 0
+    settle = []
+    for seed in range(runs):
+        a, b = impaired_pair(9600, drop_rate=drop_rate, seed=seed)
+        pair = LinkPair(a, b, line_rate=9600 / a.bits_per_byte, baudrate=9600, baudrates=(9600, 115200))
+        messages = [os.urandom(size) for _ in range(count)]
+        outcome = {}
+
+        async def scenario(p):
+            start = time.perf_counter()
+            await p.connect(timeout=15.0)
+            outcome['connected'] = True
+            await p.wait(lambda: not (p.a.connection.is_switching_baudrate()
+                                      or p.b.connection.is_switching_baudrate()), 30.0)
+            settle.append(time.perf_counter() - start)
+            outcome['rates'] = (p.a.connection.baudrate, p.b.connection.baudrate)
+            if outcome['rates'][0] == outcome['rates'][1]:
+                await p.transfer(messages, timeout=60.0)
+                outcome['delivered'] = True
+        try:
+            pair.run(scenario)
+        except TimeoutError:
+            pass  # Соединение не установлено, проверка скорости не закончилась или сообщения не дошли
+        finally:
+            a.close()
+            b.close()
+        rates = outcome.get('rates', (None, 0))
+        connected += outcome.get('connected', False)
+        agreed += rates[0] == rates[1]
+        switched += rates == (115200, 115200)
+        delivered += outcome.get('delivered', False)
+    name = f'baud.9600-115200.drop{drop_rate:g}'
+    results = {
+        f'{name}.agreed': (agreed / max(1, connected), 'ratio', 'higher'),
+        f'{name}.delivered': (delivered / runs, 'ratio', 'higher'),
+        f'{name}.switched': (switched / runs, 'ratio', 'higher'),
+    }
+    if settle:
+        results[f'{name}.settle_p50_ms'] = (percentile(settle, 50) * 1e3, 'ms', 'lower')
+    return results
+
+def bench_message(size: int) -> dict:
+    """Одно сообщение size байт через MessageChannel: фрагментация, сборка и байты в линии.
+
+    Пара портов без задержек, поэтому время - это работа стека, а не линии;
+    на реальной линии передача займет около wire_bytes * 10 / baudrate секунд.
+    """
+    a, b = loopback_pair()
+    pair = LinkPair(a, b)
+    message = os.urandom(size)
+
+    async def scenario(p):
+        await p.connect()
+        METRICS.reset()  # Байты в линии считает encode_frame: только кадры передачи и их ACK
+        return await p.transfer([message])
+    enabled, METRICS.enabled = METRICS.enabled, True
+    try:
+        result = pair.run(scenario)
+        wire_bytes = METRICS.counters.get('wire.bytes_sent', 0)
+    finally:
+        METRICS.enabled = enabled
+        METRICS.reset()
+        a.close()
+        b.close()
+    name = f'message.{size >> 10}k'
+    return {
+        f'{name}.time_s': (size / result['goodput'], 's', 'lower'),
+        f'{name}.wire_bytes': (wire_bytes, 'B', 'lower'),
+        f'{name}.wire_ratio': (wire_bytes / size, 'ratio', 'lower'),
+    }
+
+def bench_corpus(baudrate: int, corpus: str, count: int) -> dict:
+    """Полезная скорость и темп доставки сообщений на типичном трафике.
+
+    Три варианта: без сжатия и пакетирования, только со сжатием, со сжатием
+    и пакетированием (несколько сообщений и попутный ACK в одном кадре).
+    """
+    messages = CORPORA[corpus](count)
+    results = {}
+    variants = (('plain', (), False), ('compressed', DEFAULT_COMPRESSIONS, False),
+                ('batched', DEFAULT_COMPRESSIONS, True))
+    for label, compressions, batching in variants:
+        a, b = impaired_pair(baudrate)
+        pair = LinkPair(a, b, line_rate=baudrate / a.bits_per_byte, compressions=compressions, batching=batching)
+        pair.a.connection.codecs = preferred_codecs(0.0)
+
+        async def scenario(p):
+            await p.connect()
+            return await p.transfer(messages)
+        try:
+            result = pair.run(scenario)
+        finally:
+            a.close()
+            b.close()
+        name = f'corpus.{baudrate}.{corpus}.{label}'
+        results[f'{name}.goodput_bps'] = (result['goodput'], 'B/s', 'higher')
+        results[f'{name}.messages_per_s'] = (result['goodput'] * len(messages) / sum(map(len, messages)),
+                                             'msg/s', 'higher')
+    return results
@@ -0,0 +1,99 @@
+import os
+from connection import Connection
+from frame import Frame
+from checksum import CRC16
+from compress import COMPRESS_LZMA, COMPRESSION_NAMES, LZMA_MIN_SIZE, compress, decompress
+from fec import CODEC_NAMES, decode_body, encode_body
+from hamming import decode_bytes, encode_bytes
+from reorder import ReorderWindow
+from wire import FrameDecoder, encode_frame
+from bench.corpus import CORPORA
+from bench.harness import best_rate
+
+def bench_codec(size: int) -> dict:
+    """Скорость кодирования и декодирования Хэмминга (7,4) на блоке size байт."""
+    data = os.urandom(size)
+    codes = encode_bytes(data)
+    nibbles = size * 2
+    encode = best_rate(lambda: encode_bytes(data), 10)
+    decode = best_rate(lambda: decode_bytes(codes), 10)
+    return {
+        'codec.encode_mbps': (encode * size / 1e6, 'MB/s', 'higher'),
+        'codec.decode_mbps': (decode * size / 1e6, 'MB/s', 'higher'),
+        'codec.encode_ns_per_nibble': (1e9 / (encode * nibbles), 'ns', 'lower'),
+        'codec.decode_ns_per_nibble': (1e9 / (decode * nibbles), 'ns', 'lower'),
+    }
+
+def bench_frame(count: int) -> dict:
+    """Упаковка и разбор полноразмерного I-кадра, а также полный путь через провод."""
+    frame = Frame(0x01, 0x42, Frame.TYPE_I, bytes(range(255)), CRC16)
+    raw = frame.to_bytes()
+    buffer = bytearray(frame.size())
+    wire = encode_frame(frame)
+    decoder = FrameDecoder()
+    return {
+        'frame.pack_ops': (best_rate(frame.to_bytes, count), 'ops/s', 'higher'),
+        'frame.pack_into_ops': (best_rate(lambda: frame.pack_into(buffer), count), 'ops/s', 'higher'),
+        'frame.parse_ops': (best_rate(lambda: Frame.parse(raw), count), 'ops/s', 'higher'),
+        'frame.wire_roundtrip_ops': (best_rate(lambda: list(decoder.feed(encode_frame(frame))), count // 10),
+                                     'ops/s', 'higher'),
+        'frame.wire_decode_ops': (best_rate(lambda: list(decoder.feed(wire)), count // 10), 'ops/s', 'higher'),
+    }
+
+def bench_handshake_logic(count: int) -> dict:
+    """LINK -> ACK между двумя объектами Connection без ввода-вывода."""
+    def handshake():
+        a = Connection(0x42, 0x01, "A")
+        b = Connection(0x01, 0x42, "B")
+        a.handle_frame(b.handle_frame(a.connect()))
+    rate = best_rate(handshake, count)
+    return {'handshake.logic_us': (1e6 / rate, 'us', 'lower')}
+
+def bench_fec(size: int, count: int) -> dict:
+    """Кодирование и декодирование тела кадра каждой схемой и ее избыточность на линии."""
+    data = os.urandom(size)
+    results = {}
+    for codec_id, name in CODEC_NAMES.items():
+        body = encode_body(codec_id, data)
+        rate = best_rate(lambda: decode_body(encode_body(codec_id, data)), count)
+        results[f'fec.{name}.roundtrip_us'] = (1e6 / rate, 'us', 'lower')
+        results[f'fec.{name}.expansion'] = (len(body) / size, 'ratio', 'lower')
+    return results
+
+def bench_compress(count: int) -> dict:
+    """Сжатие сообщений типичного трафика каждым методом: доля оставшихся байт и время на сообщение."""
+    results = {}
+    for corpus, generate in CORPORA.items():
+        messages = generate(count)
+        for method, name in COMPRESSION_NAMES.items():
+            if method == COMPRESS_LZMA and all(len(message) < LZMA_MIN_SIZE for message in messages):
+                continue  # Такие короткие сообщения LZMA не сжимает - замерять нечего
+            def roundtrip():
+                size = 0
+                for message in messages:
+                    packed = compress(message, (method,))
+                    if packed is not None:
+                        decompress(packed, len(message))
+                    size += len(packed or message)
+                return size
+            rate = best_rate(roundtrip, 1, repeat=3)
+            results[f'compress.{corpus}.{name}.ratio'] = (roundtrip() / sum(map(len, messages)), 'ratio', 'lower')
+            results[f'compress.{corpus}.{name}.roundtrip_us'] = (1e6 / (rate * count), 'us', 'lower')
+    return results
+
+def bench_reorder(count: int) -> dict:
+    """Окно приема: кадры по порядку и кадры, пришедшие парами в обратном порядке."""
+    window = ReorderWindow(8)
+
+    def in_order():
+        for seq in range(256):
+            window.add(seq, seq)
+
+    def swapped():
+        for seq in range(0, 256, 2):
+            window.add(seq + 1, seq)
+            window.add(seq, seq)
+    return {
+        'reorder.in_order_ns': (1e9 / (best_rate(in_order, count) * 256), 'ns', 'lower'),
+        'reorder.swapped_ns': (1e9 / (best_rate(swapped, count) * 256), 'ns', 'lower'),
+    }
@@ -0,0 +1,29 @@
+import binascii
+import zlib
+
+# Режимы контрольной суммы кадра
+CRC_NONE = 0
+CRC16 = 1  # CRC-16/CCITT-FALSE (binascii.crc_hqx, начальное значение 0xFFFF)
+CRC32 = 2  # CRC-32 (zlib.crc32)
+
+CRC_SIZES = {
+    CRC_NONE: 0,
+    CRC16: 2,
+    CRC32: 4,
+}
+
+CRC_NAMES = {
+    CRC_NONE: "нет",
+    CRC16: "CRC-16",
+    CRC32: "CRC-32",
+}
+
+def compute(mode: int, data) -> bytes:
+    """Вычисляет контрольную сумму данных в выбранном режиме (табличные реализации stdlib)."""
+    if mode == CRC16:
+        return binascii.crc_hqx(data, 0xFFFF).to_bytes(2, 'big')
+    if mode == CRC32:
+        return zlib.crc32(data).to_bytes(4, 'big')
+    if mode == CRC_NONE:
+        return b''
+    raise ValueError(f"Неизвестный режим контрольной суммы: {mode}")
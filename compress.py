@@ -0,0 +1,112 @@
+"""Сжатие сообщений перед разбиением на I-кадры (MessageChannel).
+
+Сжатое сообщение - байт метода, затем сжатые данные; первый фрагмент
+такого сообщения помечается флагом FLAG_COMPRESSED. Методы согласуются
+опцией OPT_COMPRESS при установке соединения. Отправитель пробует все
+согласованные методы и отправляет самый короткий результат, а если
+сжатие не окупилось - исходное сообщение без флага.
+"""
+import zlib
+try:
+    import lzma
+except ImportError:  # Python собран без liblzma
+    lzma = None
+
+COMPRESS_ZLIB = 1       # deflate без заголовка и контрольной суммы (их заменяет CRC кадра)
+COMPRESS_ZLIB_DICT = 2  # deflate с общим словарем PRESET_DICTIONARY: выигрыш на коротких сообщениях
+COMPRESS_LZMA = 3       # LZMA2 без заголовка: плотнее на длинных сообщениях, но медленнее
+
+MIN_SIZE = 4            # Короче - сжатие не окупит байт метода
+LZMA_MIN_SIZE = 512     # Короче - LZMA не выигрывает у deflate
+
+# Общий словарь для коротких сообщений: типичные слова переписки и поля
+# телеметрии. deflate ищет повторы с конца словаря, поэтому самое частое -
+# в конце. Словарь нельзя менять: другой словарь - другой номер метода.
+PRESET_DICTIONARY = (
+    "error warning status online offline battery signal firmware version uptime "
+    "latitude longitude altitude speed heading pressure humidity temperature "
+    "voltage current power level value count sensor device node time id "
+    '{"id": "time": "status": "ok", "value": "temp": "hum": "volt": "rssi": '
+    "https://www. .com .ru "
+    "Hello, how are you? Thank you, ok, yes, no, please, see you later. "
+    "сообщение соединение получил отправил проверка связи работает "
+    "сейчас сегодня завтра вчера потом пожалуйста спасибо хорошо "
+    "Привет! Как дела? Что нового? Да, нет, понял, ок. Пока! "
+    " и в на не что это как так но да нет уже еще "
+).encode('utf-8')
+
+_LZMA_FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': 6, 'dict_size': 1 << 20}] if lzma else None
+
+def _deflate(data: bytes, zdict: bytes | None = None) -> bytes:
+    options = {'zdict': zdict} if zdict else {}
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, **options)
+    return compressor.compress(data) + compressor.flush()
+
+def _inflate(data: bytes, limit: int, zdict: bytes | None = None) -> bytes:
+    options = {'zdict': zdict} if zdict else {}
+    decompressor = zlib.decompressobj(-15, **options)
+    try:
+        result = decompressor.decompress(data, limit + 1)
+    except zlib.error as e:
+        raise ValueError(f"Поврежденные сжатые данные: {e}") from None
+    if len(result) > limit:
+        raise ValueError(f"Распакованное сообщение длиннее {limit} байт")
+    if not decompressor.eof:
+        raise ValueError("Сжатые данные обрезаны")
+    return result
+
+def _lzma_compress(data: bytes) -> bytes:
+    return lzma.compress(data, format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+
+def _lzma_decompress(data: bytes, limit: int) -> bytes:
+    decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+    try:
+        result = decompressor.decompress(data, limit + 1)
+    except lzma.LZMAError as e:
+        raise ValueError(f"Поврежденные сжатые данные: {e}") from None
+    if len(result) > limit:
+        raise ValueError(f"Распакованное сообщение длиннее {limit} байт")
+    if not decompressor.eof:
+        raise ValueError("Сжатые данные обрезаны")
+    return result
+
+# Номер метода -> (имя, сжатие, распаковка с ограничением размера)
+COMPRESSORS = {
+    COMPRESS_ZLIB: ('zlib', _deflate, _inflate),
+    COMPRESS_ZLIB_DICT: ('zlib-dict',
+                         lambda data: _deflate(data, PRESET_DICTIONARY),
+                         lambda data, limit: _inflate(data, limit, PRESET_DICTIONARY)),
+}
+if lzma:
+    COMPRESSORS[COMPRESS_LZMA] = ('lzma', _lzma_compress, _lzma_decompress)
+
+COMPRESSION_NAMES = {method: entry[0] for method, entry in COMPRESSORS.items()}
+
+# Методы, предлагаемые по умолчанию, в порядке предпочтения
+DEFAULT_COMPRESSIONS = tuple(m for m in (COMPRESS_ZLIB_DICT, COMPRESS_ZLIB, COMPRESS_LZMA) if m in COMPRESSORS)
+
+def compress(data, methods) -> bytes | None:
+    """Сжимает сообщение лучшим из methods; None, если сжатие не окупается."""
+    data = bytes(data)
+    if len(data) < MIN_SIZE:
+        return None
+    best = None
+    for method in methods:
+        if method == COMPRESS_LZMA and len(data) < LZMA_MIN_SIZE:
+            continue
+        packed = COMPRESSORS[method][1](data)
+        if best is None or len(packed) + 1 < len(best):
+            best = bytes([method]) + packed
+    if best is None or len(best) >= len(data):
+        return None
+    return best
+
+def decompress(data, limit: int) -> bytes:
+    """Распаковывает сообщение (байт метода и данные); ValueError при ошибке."""
+    data = bytes(data)
+    if not data:
+        raise ValueError("Пустое сжатое сообщение")
+    entry = COMPRESSORS.get(data[0])
+    if entry is None:
+        raise ValueError(f"Неизвестный метод сжатия: {data[0]}")
+    return entry[2](data[1:], limit)
@@ -3,6 +3,8 @@ from typing import Optional
 import json
 import os
 
+BAUDRATES = (300, 1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200)
+
 @dataclass
 class SerialConfig:
     baudrate: int = 9600
@@ -10,6 +12,9 @@ class SerialConfig:
     parity: str = 'N'  # N - none, E - even, O - odd
     stopbits: float = 1.0
     timeout: float = 0.1
+    max_baudrate: int = 115200  # Предел скорости, согласуемой при установке соединения
+    rtscts: bool = False   # Аппаратное управление потоком (RTS/CTS)
+    xonxoff: bool = False  # Программное управление потоком (XON/XOFF); байты 0x11/0x13 заняты
     
     @classmethod
     def load(cls, filename: str = 'serial_config.json') -> 'SerialConfig':
@@ -32,9 +37,20 @@ class SerialConfig:
             'bytesize': self.bytesize,
             'parity': self.parity,
             'stopbits': self.stopbits,
-            'timeout': self.timeout
+            'timeout': self.timeout,
+            'rtscts': self.rtscts,
+            'xonxoff': self.xonxoff
         }
 
+    def line_rate(self) -> float:
+        """Байт в секунду на линии: старт-бит, биты данных, бит четности и стоп-биты."""
+        bits = 1 + self.bytesize + (0 if self.parity == 'N' else 1) + self.stopbits
+        return self.baudrate / bits
+
+    def supported_baudrates(self) -> tuple[int, ...]:
+        """Скорости, которые узел предлагает при установке соединения: от baudrate до max_baudrate."""
+        return tuple(rate for rate in BAUDRATES if self.baudrate <= rate <= self.max_baudrate) or (self.baudrate,)
+
 def print_serial_config(config: SerialConfig):
     """Выводит текущую конфигурацию в консоль."""
     print("\n=== Настройки COM-порта ===")
@@ -43,6 +59,9 @@ def print_serial_config(config: SerialConfig):
     print(f"Четность: \033[1;36m{config.parity}\033[0m")
     print(f"Стоп-биты: \033[1;36m{config.stopbits}\033[0m")
     print(f"Таймаут: \033[1;36m{config.timeout}\033[0m сек")
+    print(f"Согласование скорости: до \033[1;36m{config.max_baudrate}\033[0m бод")
+    flow = [name for name, on in (("RTS/CTS", config.rtscts), ("XON/XOFF", config.xonxoff)) if on]
+    print(f"Управление потоком: \033[1;36m{', '.join(flow) or 'нет'}\033[0m")
     print("=" * 25 + "\n")
 
 def configure_port() -> Optional[SerialConfig]:
@@ -56,14 +75,21 @@ def configure_port() -> Optional[SerialConfig]:
     print("\nВведите новые значения (или Enter для сохранения текущего):")
     
     # Скорость обмена
-    baudrates = [300, 1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200]
     print("\nДоступные скорости:")
-    for i, rate in enumerate(baudrates, 1):
+    for i, rate in enumerate(BAUDRATES, 1):
         print(f"{i}: {rate}")
     try:
-        choice = input(f"Выберите скорость (1-{len(baudrates)}): ").strip()
+        choice = input(f"Выберите скорость (1-{len(BAUDRATES)}): ").strip()
+        if choice:
+            config.baudrate = BAUDRATES[int(choice) - 1]
+    except (ValueError, IndexError):
+        print("Оставляем текущее значение")
+
+    # Предел согласования: узлы поднимают скорость до общей максимальной
+    try:
+        choice = input(f"Максимальная скорость при согласовании (1-{len(BAUDRATES)}): ").strip()
         if choice:
-            config.baudrate = baudrates[int(choice) - 1]
+            config.max_baudrate = BAUDRATES[int(choice) - 1]
     except (ValueError, IndexError):
         print("Оставляем текущее значение")
     
@@ -98,6 +124,20 @@ def configure_port() -> Optional[SerialConfig]:
     except ValueError:
         print("Оставляем текущее значение")
     
+    # Управление потоком
+    print("\nУправление потоком:")
+    print("N: Нет")
+    print("H: Аппаратное (RTS/CTS)")
+    print("S: Программное (XON/XOFF)")
+    flow = input("Выберите режим (N/H/S): ").strip().upper()
+    if flow in ['N', 'H', 'S']:
+        config.rtscts = flow == 'H'
+        config.xonxoff = flow == 'S'
+        if config.xonxoff:
+            # Коды кадров на линии содержат байты 0x11 и 0x13, драйвер примет их за XON/XOFF
+            print("Внимание: XON/XOFF годится, только если адаптер передает кадры прозрачно; "
+                  "иначе выберите RTS/CTS")
+
     # Таймаут
     try:
         timeout = input("Таймаут в секундах (например, 0.1): ").strip()
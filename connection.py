@@ -1,6 +1,31 @@
+from collections import deque
 from enum import Enum
+import os
 import time
+from checksum import CRC_NONE, CRC16, CRC32
+from compress import COMPRESSORS, DEFAULT_COMPRESSIONS
+from fec import CODEC_HAMMING74, CODECS, preferred_codecs
 from frame import Frame
+from metrics import METRICS
+from options import (OPT_BATCH, OPT_BAUD, OPT_CODEC, OPT_COMPRESS, OPT_CREDIT, OPT_CRC, OPT_MTU,
+                     OPT_SESSION, OPT_WINDOW, pack_baudrates, pack_link_data, parse_baudrates, parse_link_data)
+from quality import MIN_MTU, LinkQuality, choose_profile, is_weaker
+from reorder import ReorderWindow
+
+SEQ_MODULO = 256        # Номера последовательности занимают один байт
+SESSION_ID_SIZE = 4     # Идентификатор сеанса в опции OPT_SESSION
+MAX_WINDOW = SEQ_MODULO // 2  # Selective Repeat требует окно не больше половины пространства номеров
+MAX_PAYLOAD = 255 - 1   # Один байт данных I-кадра занят номером последовательности
+ACK_DATA_MARK = 0x00    # Первый байт ACK на I-кадр (никнейм в ACK на LINK не начинается с NUL)
+
+# Имена типов кадров в метриках
+_METRIC_TYPES = {Frame.TYPE_I: 'i', Frame.TYPE_LINK: 'link', Frame.TYPE_UPLINK: 'uplink',
+                 Frame.TYPE_ACK: 'ack', Frame.TYPE_RET: 'ret', Frame.TYPE_PARAM: 'param',
+                 Frame.TYPE_BATCH: 'batch'}
+
+def seq_diff(a: int, b: int) -> int:
+    """Расстояние от номера b до номера a по модулю пространства номеров."""
+    return (a - b) % SEQ_MODULO
 
 class ConnectionState(Enum):
     DISCONNECTED = "DISCONNECTED"   # Нет соединения
@@ -9,7 +34,15 @@ class ConnectionState(Enum):
     DISCONNECTING = "DISCONNECTING" # Идёт разрыв соединения
 
 class Connection:
-    def __init__(self, local_addr: int, remote_addr: int, local_nick: str = None, remote_nick: str = None):
+    def __init__(self, local_addr: int, remote_addr: int, local_nick: str = None, remote_nick: str = None,
+                 window_size: int = 8, crc_modes: tuple[int, ...] = (CRC16, CRC32),
+                 idle_timeout: float = 30.0, line_rate: float | None = None,
+                 codecs: tuple[int, ...] | None = None,
+                 compressions: tuple[int, ...] = DEFAULT_COMPRESSIONS, batching: bool = True,
+                 baudrate: int | None = None, baudrates: tuple[int, ...] = (), credits: bool = True,
+                 sessions: bool = True):
+        if not 1 <= window_size < MAX_WINDOW:
+            raise ValueError(f"Размер окна должен быть в диапазоне 1-{MAX_WINDOW - 1}")
         self.local_addr = local_addr
         self.remote_addr = remote_addr
         self.local_nick = local_nick or f"0x{local_addr:02X}"
@@ -17,77 +50,664 @@ class Connection:
         self.state = ConnectionState.DISCONNECTED
         self.last_activity = None
         self.retry_count = 0
-        self.max_retries = 3
-        self.timeout = 30.0  # таймаут в секундах
+        self.max_retries = 6               # Повторов одного кадра до признания узла недоступным
+        self.idle_timeout = idle_timeout   # Разрыв соединения без активности, секунды
+        # Таймер повтора (RTO) по оценке времени подтверждения (Jacobson/Karn)
+        self.initial_rto = 1.0  # RTO до первого замера
+        self.min_rto = 0.2
+        self.max_rto = 30.0
+        self.srtt = None        # Сглаженное время подтверждения
+        self.rttvar = None      # Разброс времени подтверждения
+        self.rto = self.initial_rto
+        # Байт в секунду на линии (None - неизвестно). Позволяет отсчитывать время
+        # подтверждения от момента, когда кадр фактически ушел в линию, а не от
+        # постановки в очередь за другими кадрами.
+        self.line_rate = line_rate
+        self._line_free_at = 0.0     # Когда линия освободится от уже отправленных кадров
+        self._control_sent_at = None # Когда ушел последний LINK/UPLINK
+        # Selective Repeat; 1 - режим stop-and-wait. Предлагаем max_window, работаем
+        # с window_size - меньшим из своего и окна узла
+        self.max_window = window_size
+        self.window_size = window_size
+        self.send_queue = deque()       # Данные, ожидающие места в окне
+        self.crc_modes = crc_modes      # Поддерживаемые контрольные суммы в порядке предпочтения
+        self.crc = CRC_NONE             # Контрольная сумма, согласованная при установке соединения
+        self.crc_errors = 0             # Принятые кадры с неверной контрольной суммой
+        # Схемы кодирования на линии в порядке предпочтения (по умолчанию - для линии
+        # с неизвестной частотой ошибок) и схема, согласованная при установке соединения
+        self.codecs = codecs if codecs is not None else preferred_codecs(None)
+        self.codec = CODEC_HAMMING74
+        self.peer_codecs = {CODEC_HAMMING74}  # Схемы, которые разбирает узел
+        self.mtu = MAX_PAYLOAD                # Текущий размер данных I-кадра
+        # Подстройка схемы и размера кадра под качество линии во время сеанса
+        self.adaptive = True
+        self.adapt_interval = 2.0         # Не чаще, секунды
+        self.rx_quality = LinkQuality()   # Ошибки в кадрах от узла
+        self.tx_quality = LinkQuality()   # Повторы наших кадров
+        self.control_queue = deque()      # Служебные кадры (TYPE_PARAM) к отправке
+        # Методы сжатия сообщений (compress.py) в порядке предпочтения и
+        # согласованные с узлом; пустой кортеж - сообщения не сжимаются
+        self.compressions = compressions
+        self.agreed_compressions = ()
+        # Пакетирование (TYPE_BATCH): короткие данные собираются в один кадр,
+        # подтверждение едет в попутном кадре данных или откладывается
+        self.batching = batching
+        self.batch_agreed = False
+        self.batch_delay = 0.05  # Сколько короткие данные ждут попутчиков, пока есть неподтвержденные кадры
+        self.ack_delay = 0.05    # Сколько ACK ждет попутного кадра данных
+        self.ack_every = 2       # ACK не реже, чем на каждый второй принятый по порядку кадр
+        self._queue_since = None # Когда в пустую очередь отправки попали данные
+        # Согласование скорости порта: текущая скорость и скорости, которые порт
+        # поддерживает. Без них (None или пустой кортеж) скорость не меняется
+        self.baudrate = baudrate
+        self.baudrates = baudrates
+        self.baud_probes = 3          # Проверок новой скорости до возврата к прежней
+        self.baud_probe_interval = 0.5
+        # Кредит: в подтверждениях узел сообщает, сколько кадров сверх подтвержденных
+        # готов принять, - окно за вычетом данных, которые приложение еще не забрало
+        # (poll_incoming). Отправитель не выходит за кредит, и медленный получатель
+        # не захлебывается
+        self.credits = credits
+        self.credit_agreed = False
+        # Байт в incoming, при которых кредит падает до нуля. Два окна: ACK строится
+        # до того, как приложение забрало только что принятое, и полное окно
+        # не должно урезаться из-за этого
+        self.receive_buffer = 2 * window_size * MAX_PAYLOAD
+        # Сеанс: идентификатор выдает отвечающая сторона при установке соединения.
+        # После обрыва (но не после разрыва) соединение в течение session_grace
+        # секунд с последнего кадра от узла возобновляется одним кадром LINK:
+        # никнеймы, параметры и номера сохраняются, повторяются только кадры,
+        # которых узел не получил
+        self.sessions = sessions
+        self.session_grace = 120.0
+        self.session_id = None
+        self.resumed = False     # Соединение установлено возобновлением сеанса
+        self._resuming = False   # Наш LINK предлагает возобновить сеанс
+        self._heard_at = None    # Когда пришел последний кадр от узла
+        self._reset_window()
+        self._reset_adaptation()
+        self._reset_baudrate()
+
+    def _reset_window(self):
+        """Сбрасывает состояние скользящего окна (новый сеанс)."""
+        self.send_base = 0     # Самый старый неподтвержденный номер
+        self.next_seq = 0      # Номер для следующего нового I-кадра
+        self.in_flight = {}    # seq -> [фрейм, время отправки, число повторов]
+        self.recv_window = ReorderWindow(self.window_size, SEQ_MODULO)  # Прием по порядку и отсев дубликатов
+        self.ret_requested = None  # Номер, для которого уже отправлен TYPE_RET
+        self.incoming = deque()    # Данные, готовые к выдаче приложению
+        self._incoming_bytes = 0
+        self._ack_pending = 0      # Принятые кадры, подтверждение которых отложено
+        self._ack_due = None       # Срок отложенного ACK
+        self.peer_credit = self.window_size  # Сколько кадров от send_base разрешил узел
+        self._credit_at = 0.0      # Когда пришел последний кредит
+        self._credit_sent = self.window_size  # Последний объявленный узлу кредит
     
+    def _reset_adaptation(self):
+        """Возвращает параметры канала к согласованным при установке соединения."""
+        self.mtu = MAX_PAYLOAD
+        self.control_queue.clear()
+        self._peer_adaptive = False  # Узел понимает TYPE_PARAM
+        self._peer_codec = None      # Схема последнего I-кадра от узла
+        self._recommended = None     # Последний рекомендованный узлу профиль (схема, размер кадра)
+        self._last_review = 0.0
+
+    def _reset_baudrate(self):
+        """Забывает незавершенную смену скорости."""
+        self._baud_pending = None   # Скорость, которую нужно применить к порту (take_baudrate)
+        self._baud_fallback = None  # Прежняя скорость, пока новая не проверена
+        self._baud_probing = False  # Мы проверяем скорость (инициатор) или ждем проверки
+        self._baud_probes_sent = 0  # Проверки или подтверждения инициатора, повторы эха второго узла
+        self._baud_echoed = False   # Эхо отправлено (второй узел) или получено (инициатор), ждем подтверждения
+        self._baud_answers = 0      # Второй узел: сколько раз еще повторить ответ на подтверждение
+        self._baud_deadline = None  # Срок следующей проверки или возврата к прежней скорости
+
     def create_frame(self, frame_type: int, data: bytes = b'') -> Frame:
         """Создает фрейм с учетом адресов отправителя и получателя."""
         # Если это информационный фрейм или запрос соединения, добавляем никнейм
         if frame_type in [Frame.TYPE_I, Frame.TYPE_LINK]:
-            # Добавляем никнейм к данным при установке соединения
+            # Добавляем никнейм и предлагаемые параметры к данным при установке соединения
             if frame_type == Frame.TYPE_LINK:
-                data = self.local_nick.encode('utf-8')
+                options = {OPT_CRC: bytes(self.crc_modes), OPT_CODEC: bytes(self.codecs)}
+                if self.compressions:
+                    options[OPT_COMPRESS] = bytes(self.compressions)
+                if self.batching:
+                    options[OPT_BATCH] = b'\x01'
+                if self.credits:
+                    options[OPT_CREDIT] = b'\x01'
+                if self.sessions:
+                    options[OPT_SESSION] = self._session_state() if self._resuming else b''
+                options[OPT_WINDOW] = bytes([self.max_window])
+                if self.baudrate and self.baudrates:
+                    options[OPT_BAUD] = pack_baudrates(sorted(self.baudrates, reverse=True))
+                data = pack_link_data(self.local_nick, options)
         return Frame(
             receiver=self.remote_addr,
             sender=self.local_addr,
             frame_type=frame_type,
-            data=data
+            data=data,
+            crc=self.crc,
+            codec=self.codec
         )
     
     def handle_frame(self, frame: Frame) -> Frame | None:
         """Обрабатывает входящий фрейм и возвращает ответный фрейм если нужен."""
-        if frame.sender != self.remote_addr or frame.receiver != self.local_addr:
+        if frame.sender != self.remote_addr or frame.receiver not in (self.local_addr, Frame.BROADCAST_ADDR):
             return None  # игнорируем фреймы не для этого соединения
+
+        if METRICS.enabled:
+            METRICS.inc(f"connection.rx.{_METRIC_TYPES.get(frame.frame_type, 'other')}")
+        self._record_received(frame)
+        if not frame.crc_ok:
+            # Поврежденный кадр не доставляем, а просим повторить
+            self.crc_errors += 1
+            return self._handle_corrupt(frame)
             
         self.last_activity = time.time()
+        heard_at, self._heard_at = self._heard_at, self.last_activity
         
         if frame.frame_type == Frame.TYPE_LINK:
             # Получен запрос на соединение с никнеймом
-            try:
-                self.remote_nick = frame.data.decode('utf-8')
-            except:
-                self.remote_nick = f"0x{frame.sender:02X}"
+            nick, options = parse_link_data(frame.data)
+            session = options.get(OPT_SESSION, b'')
+            if (self._session_matches(session) and heard_at is not None
+                    and self.last_activity - heard_at <= self.session_grace):
+                # Узел возобновляет сеанс после обрыва: параметры остаются прежними
+                self._resume_session(session[SESSION_ID_SIZE])
+                reply = {OPT_SESSION: self._session_state()}
+                self._choose_baudrate(options, reply)
+                return self.create_frame(Frame.TYPE_ACK, pack_link_data(self.local_nick, reply))
+            self.remote_nick = nick or f"0x{frame.sender:02X}"
             self.state = ConnectionState.CONNECTED
-            # Отправляем в ответе свой никнейм
-            return Frame(
-                receiver=self.remote_addr,
-                sender=self.local_addr,
-                frame_type=Frame.TYPE_ACK,
-                data=self.local_nick.encode('utf-8')
-            )
+            self.resumed = False
+            self.window_size = self._agree_window(options)
+            self._reset_window()
+            # Выбираем первую из предложенных контрольных сумм, которую поддерживаем сами
+            offered = options.get(OPT_CRC, b'')
+            self.crc = next((mode for mode in offered if mode in self.crc_modes), CRC_NONE)
+            # Схема кодирования - тоже первая подходящая из предложенных; старые узлы
+            # схем не предлагают и понимают только исходный Хэмминг (7,4).
+            # Ответ уже кодируется выбранной схемой: инициатор ее предложил, значит, разберет
+            offered = options.get(OPT_CODEC, b'')
+            self.codec = next((codec for codec in offered if codec in self.codecs and codec in CODECS),
+                              CODEC_HAMMING74)
+            self._reset_adaptation()
+            self.peer_codecs = set(offered) or {CODEC_HAMMING74}
+            self._peer_adaptive = OPT_CODEC in options
+            # Отправляем в ответе свой никнейм и выбранные параметры: выбранная схема
+            # первой, за ней остальные, которые мы разбираем
+            codecs = bytes([self.codec]) + bytes(c for c in self.codecs if c != self.codec)
+            reply = {OPT_CRC: bytes([self.crc]), OPT_CODEC: codecs}
+            # Сжатие - методы, которые поддерживают обе стороны, в порядке предпочтения инициатора
+            self.agreed_compressions = tuple(m for m in options.get(OPT_COMPRESS, b'')
+                                             if m in self.compressions and m in COMPRESSORS)
+            if OPT_COMPRESS in options:
+                reply[OPT_COMPRESS] = bytes(self.agreed_compressions)
+            self.batch_agreed = self.batching and options.get(OPT_BATCH) == b'\x01'
+            if OPT_BATCH in options:
+                reply[OPT_BATCH] = bytes([self.batch_agreed])
+            self.credit_agreed = self.credits and options.get(OPT_CREDIT) == b'\x01'
+            if OPT_CREDIT in options:
+                reply[OPT_CREDIT] = bytes([self.credit_agreed])
+            if OPT_WINDOW in options:
+                reply[OPT_WINDOW] = bytes([self.window_size])
+            if self.sessions and OPT_SESSION in options:
+                self.session_id = os.urandom(SESSION_ID_SIZE)
+                reply[OPT_SESSION] = self._session_state()
+            else:
+                self.session_id = None
+            # Скорость - самая высокая из общих; ответ уходит еще на прежней
+            self._choose_baudrate(options, reply)
+            return self.create_frame(Frame.TYPE_ACK, pack_link_data(self.local_nick, reply))
             
         elif frame.frame_type == Frame.TYPE_UPLINK:
-            # Получен запрос на разрыв соединения
+            # Получен запрос на разрыв соединения: сеанс завершен
             self.state = ConnectionState.DISCONNECTED
+            self.session_id = None
             return self.create_frame(Frame.TYPE_ACK)
             
         elif frame.frame_type == Frame.TYPE_ACK:
             # Получено подтверждение
-            if self.state == ConnectionState.CONNECTING:
-                # Если это ответ на TYPE_LINK, извлекаем никнейм
-                try:
-                    self.remote_nick = frame.data.decode('utf-8')
-                except:
-                    self.remote_nick = f"0x{frame.sender:02X}"
+            if frame.data[:1] == bytes([ACK_DATA_MARK]):
+                # Подтверждение I-кадров
+                if self.state == ConnectionState.CONNECTED:
+                    self._handle_ack(frame.data[1:])
+            elif self.state == ConnectionState.CONNECTING:
+                # Если это ответ на TYPE_LINK, извлекаем никнейм и выбранные параметры
+                nick, options = parse_link_data(frame.data)
+                session = options.get(OPT_SESSION, b'')
+                if self._resuming and self._session_matches(session):
+                    self._resuming = False
+                    self._resume_session(session[SESSION_ID_SIZE])
+                    self._accept_baudrate(options)
+                    if self.retry_count == 0:
+                        self._rtt_sample(self.last_activity - self._control_sent_at)
+                    return None
+                if self._resuming:
+                    # Узел не знает сеанса - это новое соединение, неподтвержденное потеряно
+                    self._resuming = False
+                    self._reset_window()
+                self.resumed = False
+                self.session_id = (bytes(session[:SESSION_ID_SIZE])
+                                   if self.sessions and len(session) == SESSION_ID_SIZE + 1 else None)
+                self.remote_nick = nick or f"0x{frame.sender:02X}"
+                chosen = options.get(OPT_CRC, bytes([CRC_NONE]))[:1]
+                self.crc = chosen[0] if chosen and chosen[0] in self.crc_modes else CRC_NONE
+                codecs = options.get(OPT_CODEC, bytes([CODEC_HAMMING74]))
+                self.codec = codecs[0] if codecs and codecs[0] in self.codecs else CODEC_HAMMING74
+                self._reset_adaptation()
+                self.peer_codecs = set(codecs) or {CODEC_HAMMING74}
+                self._peer_adaptive = OPT_CODEC in options
+                self.agreed_compressions = tuple(m for m in options.get(OPT_COMPRESS, b'')
+                                                 if m in self.compressions and m in COMPRESSORS)
+                self.batch_agreed = self.batching and options.get(OPT_BATCH) == b'\x01'
+                self.credit_agreed = self.credits and options.get(OPT_CREDIT) == b'\x01'
+                window = self._agree_window(options)
+                if window != self.window_size:
+                    self.window_size = window
+                    self._reset_window()  # Данные еще не отправлялись: окно приема - под согласованный размер
+                self._accept_baudrate(options)
                 self.state = ConnectionState.CONNECTED
+                if self.retry_count == 0:
+                    self._rtt_sample(self.last_activity - self._control_sent_at)
             elif self.state == ConnectionState.DISCONNECTING:
                 self.state = ConnectionState.DISCONNECTED
                 
         elif frame.frame_type == Frame.TYPE_I and self.state == ConnectionState.CONNECTED:
             # Получен информационный фрейм, отправляем подтверждение
-            return self.create_frame(Frame.TYPE_ACK)
+            if not frame.data:
+                return None
+            return self._handle_data(frame.data[0], [frame.data[1:]])
+
+        elif frame.frame_type == Frame.TYPE_BATCH and self.state == ConnectionState.CONNECTED:
+            return self._handle_batch(frame.data)
+
+        elif frame.frame_type == Frame.TYPE_RET and self.state == ConnectionState.CONNECTED:
+            # Запрос повтора: подтверждает все до запрошенного номера, сам номер - немедленно повторяем
+            return self._handle_ret(frame.data)
+
+        elif frame.frame_type == Frame.TYPE_PARAM and self.state == ConnectionState.CONNECTED:
+            # Узел видит, как до него доходят наши кадры, и советует схему и размер кадра
+            self._apply_params(frame.data)
             
         return None
+
+    def _handle_data(self, seq: int, payloads: list[bytes]) -> Frame | None:
+        """Принимает кадр данных в окно приема и возвращает ACK, TYPE_RET или None (ACK отложен)."""
+        ready = self.recv_window.add(seq, payloads)
+        if ready:
+            for delivered in ready:
+                self.incoming.extend(delivered)
+                self._incoming_bytes += sum(map(len, delivered))
+            if self.batch_agreed and len(ready) == 1:
+                # Узел понимает попутные подтверждения: ACK откладываем в надежде
+                # отправить его с данными, но не дольше ack_delay и ack_every кадров.
+                # Закрытую дыру подтверждаем сразу
+                self._ack_pending += 1
+                if self._ack_pending < self.ack_every:
+                    if self._ack_due is None:
+                        self._ack_due = time.time() + self.ack_delay
+                    return None
+        elif ready is not None:
+            if self.ret_requested != self.recv_window.next:
+                # Обнаружена дыра - просим повторить недостающий кадр
+                self.ret_requested = self.recv_window.next
+                self.rx_quality.record(0, 2)  # Кадр потерян целиком
+                if METRICS.enabled:
+                    METRICS.inc('connection.ret_sent')
+                return self.create_frame(Frame.TYPE_RET, self._take_ack_state())
+        elif METRICS.enabled:
+            METRICS.inc('connection.duplicates')
+        # Дубликаты и кадры вне окна не выдаются, но подтверждаются,
+        # чтобы отправитель перестал их повторять
+        return self.create_frame(Frame.TYPE_ACK, bytes([ACK_DATA_MARK]) + self._take_ack_state())
+
+    def _handle_batch(self, data: bytes) -> Frame | None:
+        """Разбирает TYPE_BATCH: номер, попутное подтверждение и порции данных с длиной."""
+        if len(data) < 2 or len(data) < 2 + data[1]:
+            return None
+        seq, ack_length = data[0], data[1]
+        if ack_length:
+            self._handle_ack(data[2:2 + ack_length])
+        payloads = []
+        pos = 2 + ack_length
+        while pos < len(data):
+            end = pos + 1 + data[pos]
+            if end > len(data):
+                return None
+            payloads.append(data[pos + 1:end])
+            pos = end
+        return self._handle_data(seq, payloads)
+
+    def _handle_corrupt(self, frame: Frame) -> Frame | None:
+        """Отвечает на кадр данных (TYPE_I или TYPE_BATCH) с неверной контрольной суммой запросом повтора."""
+        if self.state != ConnectionState.CONNECTED or frame.frame_type not in (Frame.TYPE_I, Frame.TYPE_BATCH):
+            return None
+        self.ret_requested = self.recv_window.next
+        if METRICS.enabled:
+            METRICS.inc('connection.ret_sent')
+        return self.create_frame(Frame.TYPE_RET, self._take_ack_state())
+
+    def _take_ack_state(self) -> bytes:
+        """Состояние приема для отправки узлу; снимает отложенное подтверждение."""
+        self._ack_pending = 0
+        self._ack_due = None
+        return self._ack_state()
+
+    def _ack_state(self) -> bytes:
+        """Кумулятивный номер, кредит (если согласован) и битовая карта принятых вне очереди кадров."""
+        bitmap = self.recv_window.sack()
+        sack = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+        if not self.credit_agreed:
+            return bytes([self.recv_window.next]) + sack
+        self._credit_sent = self._credit()
+        return bytes([self.recv_window.next, self._credit_sent]) + sack
+
+    def _credit(self) -> int:
+        """Сколько кадров сверх подтвержденных мы готовы принять."""
+        free = (self.receive_buffer - self._incoming_bytes) // MAX_PAYLOAD
+        return max(0, min(self.window_size, free))
+
+    def _handle_ack(self, data: bytes):
+        """Снимает с отправки кадры, подтвержденные кумулятивно или выборочно."""
+        if not data:
+            return
+        ack_seq = data[0]
+        if seq_diff(ack_seq, self.send_base) > seq_diff(self.next_seq, self.send_base):
+            return  # Устаревшее подтверждение
+        if self.credit_agreed:
+            if len(data) < 2:
+                return
+            self.peer_credit = data[1]
+            self._credit_at = time.time()
+            data = data[1:]  # Дальше битовая карта, как без кредита
+        acked = []
+        while self.send_base != ack_seq:
+            acked.append(self.in_flight.pop(self.send_base, None))
+            self.send_base = (self.send_base + 1) % SEQ_MODULO
+        bitmap = int.from_bytes(data[1:], 'little')
+        while bitmap:
+            low = bitmap & -bitmap
+            acked.append(self.in_flight.pop((ack_seq + low.bit_length()) % SEQ_MODULO, None))
+            bitmap ^= low
+        # Замер по самому свежему подтвержденному кадру. Время подтверждения
+        # повторенного кадра неоднозначно, такие кадры не учитываем (Karn)
+        sent = [entry[1] for entry in acked if entry is not None and entry[2] == 0]
+        if sent:
+            self._rtt_sample(time.time() - max(sent))
+
+    def _handle_ret(self, data: bytes) -> Frame | None:
+        """Обрабатывает TYPE_RET и немедленно повторяет запрошенный кадр."""
+        if not data:
+            return None
+        self._handle_ack(data)
+        entry = self.in_flight.get(data[0])
+        if entry is None:
+            return None
+        entry[1] = self._departure(entry[0])
+        entry[2] += 1
+        self.tx_quality.record(0, 2)
+        if METRICS.enabled:
+            METRICS.inc('connection.fast_retransmits')
+        return entry[0]
     
+    def _record_received(self, frame: Frame):
+        """Учитывает принятый кадр в оценке качества приема."""
+        errors = frame.corrected + (0 if frame.crc_ok else 2)
+        self.rx_quality.record(8 * CODECS[frame.codec].expansion * frame.size(), errors)
+        if frame.crc_ok and frame.frame_type == Frame.TYPE_I:
+            self._peer_codec = frame.codec
+
+    def _review_quality(self):
+        """Пересматривает схему и размер кадра по накопленной статистике.
+
+        По ошибкам приема советует узлу профиль кадром TYPE_PARAM (повторно -
+        пока узел шлет другой схемой). По повторам своих кадров только
+        усиливает свой профиль: ослабить его может лишь совет узла.
+        """
+        now = time.time()
+        if not self.adaptive or now - self._last_review < self.adapt_interval:
+            return
+        self._last_review = now
+
+        ber = self.rx_quality.bit_error_rate()
+        if ber is not None and self._peer_adaptive:
+            profile = choose_profile(ber, self.codecs, self._recommended)
+            if profile != self._recommended or (self._peer_codec is not None and self._peer_codec != profile[0]):
+                self._recommended = profile
+                self.control_queue.append(self.create_frame(Frame.TYPE_PARAM, pack_link_data(
+                    '', {OPT_CODEC: bytes([profile[0]]), OPT_MTU: bytes([profile[1]])})))
+                if METRICS.enabled:
+                    METRICS.inc('connection.param_sent')
+
+        self._switch_profile(*self._escalate((self.codec, self.mtu)))
+
+    def _escalate(self, profile: tuple[int, int]) -> tuple[int, int]:
+        """Усиливает profile, если этого требуют повторы наших кадров."""
+        ber = self.tx_quality.bit_error_rate()
+        if ber is None:
+            return profile
+        local = choose_profile(ber, self.peer_codecs)
+        return local if is_weaker(profile, local) else profile
+
+    def _apply_params(self, data: bytes):
+        """Применяет профиль, присланный узлом в TYPE_PARAM."""
+        _, options = parse_link_data(data)
+        if OPT_BAUD in options:
+            self._handle_baud_probe(parse_baudrates(options[OPT_BAUD])[:1])
+        codec = options.get(OPT_CODEC, b'')[:1]
+        mtu = options.get(OPT_MTU, b'')[:1]
+        profile = (codec[0] if codec and codec[0] in CODECS else self.codec,
+                   max(MIN_MTU, min(MAX_PAYLOAD, mtu[0])) if mtu else self.mtu)
+        self._switch_profile(*self._escalate(profile))
+
+    def _switch_profile(self, codec: int, mtu: int):
+        """Меняет схему кодирования и размер кадра для новых кадров."""
+        if (codec, mtu) == (self.codec, self.mtu):
+            return
+        self.codec, self.mtu = codec, mtu
+        if METRICS.enabled:
+            METRICS.inc('connection.profile_switches')
+
+    def _agree_window(self, options: dict[int, bytes]) -> int:
+        """Меньшее из своего окна и окна узла; узел без OPT_WINDOW - свое окно, как раньше."""
+        value = options.get(OPT_WINDOW, b'')[:1]
+        if value and 1 <= value[0] < MAX_WINDOW:
+            return min(self.max_window, value[0])
+        return self.max_window
+
+    def _choose_baudrate(self, options: dict[int, bytes], reply: dict[int, bytes]):
+        """Отвечающая сторона: выбирает самую высокую общую скорость и готовится к переходу."""
+        self._reset_baudrate()
+        if OPT_BAUD in options and self.baudrate and self.baudrates:
+            rate = max((r for r in parse_baudrates(options[OPT_BAUD]) if r in self.baudrates),
+                       default=self.baudrate)
+            reply[OPT_BAUD] = pack_baudrates([rate])
+            if rate > self.baudrate:
+                self._begin_baud_switch(rate, probing=False)
+
+    def _accept_baudrate(self, options: dict[int, bytes]):
+        """Инициатор: переходит на скорость, выбранную узлом, и проверяет ее."""
+        self._reset_baudrate()
+        chosen = parse_baudrates(options.get(OPT_BAUD, b''))[:1]
+        if chosen and self.baudrate and chosen[0] != self.baudrate and chosen[0] in self.baudrates:
+            self._begin_baud_switch(chosen[0], probing=True)
+
+    def _begin_baud_switch(self, rate: int, probing: bool):
+        """Переходит на скорость rate; до проверки помнит прежнюю.
+
+        Инициатор после перехода шлет проверки (TYPE_PARAM с OPT_BAUD), второй
+        узел отвечает на них эхом. Получив эхо, инициатор шлет подтверждение
+        (пустой OPT_BAUD); второй узел остается на новой скорости, получив
+        его, отвечает таким же пустым OPT_BAUD на каждое подтверждение и еще
+        baud_probes раз сам. Инициатор остается на новой скорости только после
+        этого ответа, а до тех пор повторяет подтверждение. Не дождавшись
+        ответа, каждая сторона возвращается к прежней скорости; инициатор ждет
+        ответа дольше, чем второй узел может его слать, поэтому потерянные
+        подтверждения или ответы не оставляют узлы на разных скоростях.
+        """
+        self._baud_fallback = self.baudrate
+        self._baud_probing = probing
+        self._baud_probes_sent = 0
+        if probing:
+            self._baud_deadline = time.time()
+        else:
+            self._baud_deadline = time.time() + (self.baud_probes + 1) * self.baud_probe_interval
+        self.set_baudrate(rate)
+
+    def _handle_baud_probe(self, rate: list[int]):
+        """Проверка новой скорости от инициатора, ее эхо, подтверждение или ответ на него (пустой список)."""
+        if not rate:
+            if self._baud_probing:
+                # Ответ на подтверждение: второй узел остался на новой скорости
+                if self._baud_echoed:
+                    self._commit_baudrate()
+                return
+            # Подтверждение: отвечаем на каждое - ответ мог потеряться
+            if self._baud_echoed:
+                self._commit_baudrate()
+            self.control_queue.append(self._baud_frame([]))
+            return
+        if rate[0] != self.baudrate:
+            return
+        if self._baud_probing:
+            # Эхо: скорость работает в обе стороны. Подтверждаем на каждое эхо - подтверждение могло потеряться
+            if self._baud_fallback is None:
+                return
+            self.control_queue.append(self._baud_frame([]))
+            if not self._baud_echoed:
+                self._baud_echoed = True
+                self._baud_probes_sent = 0
+                self._baud_deadline = time.time() + self.baud_probe_interval
+            return
+        # Отвечаем на каждую проверку: эхо могло потеряться
+        self.control_queue.append(self._baud_frame(rate))
+        if self._baud_fallback is not None and not self._baud_echoed:
+            self._baud_echoed = True
+            self._baud_probes_sent = 0
+            self._baud_deadline = time.time() + self.baud_probe_interval
+
+    def _commit_baudrate(self):
+        """Остается на новой скорости."""
+        if self._baud_fallback is None:
+            return
+        self._baud_fallback = None
+        self._baud_echoed = False
+        self._baud_deadline = None
+        if not self._baud_probing:
+            # Ответ на подтверждение мог потеряться, а инициатор без него вернется к прежней скорости
+            self._baud_answers = self.baud_probes
+            self._baud_deadline = time.time() + self.baud_probe_interval
+        if METRICS.enabled:
+            METRICS.inc('connection.baud_switches')
+
+    def _baud_frame(self, rates: list[int]) -> Frame:
+        return self.create_frame(Frame.TYPE_PARAM, pack_link_data('', {OPT_BAUD: pack_baudrates(rates)}))
+
+    def _check_baudrate(self, now: float) -> list[Frame]:
+        """Шлет очередную проверку (повтор эха, подтверждения, ответа) либо возвращается к прежней скорости."""
+        if self._baud_deadline is None or now < self._baud_deadline:
+            return []
+        if self._baud_fallback is None:
+            self._baud_answers -= 1
+            self._baud_deadline = now + self.baud_probe_interval if self._baud_answers > 0 else None
+            return [self._baud_frame([])]  # Повтор ответа на подтверждение
+        limit = self.baud_probes
+        if self._baud_probing and self._baud_echoed:
+            # Второй узел принимает подтверждение до baud_probes интервалов после эха
+            # и потом еще baud_probes раз повторяет ответ: ждем дольше
+            limit = 2 * self.baud_probes + 1
+        if (not self._baud_probing and not self._baud_echoed) or self._baud_probes_sent >= limit:
+            fallback = self._baud_fallback
+            self._reset_baudrate()
+            self.set_baudrate(fallback)
+            if METRICS.enabled:
+                METRICS.inc('connection.baud_fallbacks')
+            return []
+        self._baud_probes_sent += 1
+        self._baud_deadline = now + self.baud_probe_interval
+        if self._baud_probing and self._baud_echoed:
+            return [self._baud_frame([])]  # Повтор подтверждения
+        return [self._baud_frame([self.baudrate])]
+
+    def is_switching_baudrate(self) -> bool:
+        """Новая скорость еще проверяется: возможен возврат к прежней."""
+        return self._baud_fallback is not None
+
+    def _verifying_baudrate(self) -> bool:
+        """Инициатор ждет эха проверки или ответа на подтверждение: новые данные пока не отправляются."""
+        return self._baud_probing and self._baud_fallback is not None
+
+    def set_baudrate(self, rate: int):
+        """Меняет скорость порта для соединения: пересчитывает line_rate и просит применить ее к порту."""
+        if self.line_rate and self.baudrate:
+            self.line_rate *= rate / self.baudrate
+        self.baudrate = rate
+        self._baud_pending = rate
+
+    def take_baudrate(self) -> int | None:
+        """Скорость, на которую нужно перевести порт после уже отправленных кадров, или None."""
+        rate, self._baud_pending = self._baud_pending, None
+        return rate
+
+    def _departure(self, frame: Frame) -> float:
+        """Оценивает момент, когда кадр целиком уйдет в линию, и резервирует под него линию."""
+        now = time.time()
+        if not self.line_rate:
+            return now
+        # Избыточность схемы кодирования, плюс разделители и маркер схемы
+        wire_size = CODECS[frame.codec].expansion * frame.size() + 3
+        self._line_free_at = max(now, self._line_free_at) + wire_size / self.line_rate
+        return self._line_free_at
+
+    def _rtt_sample(self, rtt: float):
+        """Обновляет SRTT/RTTVAR по замеру и пересчитывает RTO (RFC 6298)."""
+        rtt = max(rtt, 0.0)
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + 4 * self.rttvar))
+        if METRICS.enabled:
+            METRICS.observe('connection.rtt', rtt)
+
+    def _backoff(self):
+        """Удваивает RTO после истечения таймера повтора."""
+        self.rto = min(self.max_rto, self.rto * 2)
+
+    def _control_deadline(self) -> float:
+        """Срок повтора LINK/UPLINK: RTO с экспоненциальной отсрочкой по числу попыток."""
+        return self._control_sent_at + min(self.max_rto, self.rto * 2 ** self.retry_count)
+
     def connect(self) -> Frame:
         """Инициирует установку соединения."""
         if self.state != ConnectionState.DISCONNECTED:
             raise ValueError("Попытка установить соединение в неверном состоянии")
             
+        self._resuming = self.sessions and self.can_resume()
         self.state = ConnectionState.CONNECTING
         self.last_activity = time.time()
         self.retry_count = 0
-        return self.create_frame(Frame.TYPE_LINK)
+        if self._resuming:
+            # Параметры и окно остаются от сеанса; LINK несет его идентификатор
+            self._reset_baudrate()
+            frame = self.create_frame(Frame.TYPE_LINK)
+            self._control_sent_at = self._departure(frame)
+            return frame
+        self.session_id = None
+        self.crc = CRC_NONE
+        self.codec = CODEC_HAMMING74
+        self.agreed_compressions = ()
+        self.batch_agreed = False
+        self.credit_agreed = False
+        self.window_size = self.max_window
+        self._reset_window()
+        self._reset_baudrate()
+        frame = self.create_frame(Frame.TYPE_LINK)
+        self._control_sent_at = self._departure(frame)
+        return frame
     
     def disconnect(self) -> Frame:
         """Инициирует разрыв соединения."""
@@ -95,39 +715,247 @@ class Connection:
             raise ValueError("Попытка разорвать несуществующее соединение")
             
         self.state = ConnectionState.DISCONNECTING
+        self.session_id = None
         self.last_activity = time.time()
         self.retry_count = 0
-        return self.create_frame(Frame.TYPE_UPLINK)
+        frame = self.create_frame(Frame.TYPE_UPLINK)
+        self._control_sent_at = self._departure(frame)
+        return frame
     
+    def enqueue(self, data: bytes):
+        """Ставит данные в очередь на отправку I-кадрами."""
+        if len(data) > MAX_PAYLOAD:
+            raise ValueError(f"Слишком длинные данные: {len(data)} байт, максимум {MAX_PAYLOAD}")
+        if not self.send_queue:
+            self._queue_since = time.time()
+        self.send_queue.append(bytes(data))
+
+    def poll_outgoing(self) -> list[Frame]:
+        """Возвращает фреймы, которые нужно отправить сейчас.
+
+        Сначала повторы кадров, не подтвержденных за RTO, затем новые
+        кадры из очереди, пока в окне есть место, и отложенный ACK, если
+        его срок истек, а попутного кадра данных не нашлось.
+        """
+        if self.state != ConnectionState.CONNECTED:
+            return []
+
+        self._review_quality()
+        frames = list(self.control_queue)
+        self.control_queue.clear()
+        control = len(frames)
+        now = time.time()
+        for seq, entry in self.in_flight.items():
+            if now - entry[1] > self.rto:
+                if entry[2] >= self.max_retries:
+                    # Кадр так и не доставлен - считаем соединение потерянным
+                    self.state = ConnectionState.DISCONNECTED
+                    if METRICS.enabled:
+                        METRICS.inc('connection.lost')
+                    return []
+                entry[1] = self._departure(entry[0])
+                entry[2] += 1
+                frames.append(entry[0])
+        retransmits = len(frames) - control
+        if retransmits:
+            self._backoff()
+            self.tx_quality.record(0, 2 * retransmits)
+            if METRICS.enabled:
+                METRICS.inc('connection.retransmits', retransmits)
+        frames += self._check_baudrate(now)
+
+        limit = self._send_limit(now)
+        if (METRICS.enabled and self.send_queue and not self.in_flight and limit == 1
+                and self.peer_credit == 0):
+            METRICS.inc('connection.credit_probes')
+        while (self.send_queue and seq_diff(self.next_seq, self.send_base) < limit
+               and not self._verifying_baudrate() and not self._hold_data(now)):
+            frame = self._next_data_frame()
+            self.in_flight[self.next_seq] = [frame, self._departure(frame), 0]
+            self.tx_quality.record(8 * CODECS[frame.codec].expansion * frame.size())
+            self.next_seq = (self.next_seq + 1) % SEQ_MODULO
+            frames.append(frame)
+        if self._ack_due is not None and now >= self._ack_due:
+            frames.append(self.create_frame(Frame.TYPE_ACK, bytes([ACK_DATA_MARK]) + self._take_ack_state()))
+            if METRICS.enabled:
+                METRICS.inc('connection.delayed_acks')
+        if METRICS.enabled:
+            METRICS.gauge('connection.send_queue', len(self.send_queue))
+            METRICS.gauge('connection.in_flight', len(self.in_flight))
+        return frames
+
+    def _send_limit(self, now: float) -> int:
+        """Сколько кадров от send_base можно держать в полете: окно, урезанное кредитом узла."""
+        if self.peer_credit >= self.window_size:
+            return self.window_size
+        if self.peer_credit == 0 and not self.in_flight and now - self._credit_at >= self.rto:
+            # Проба нулевого кредита: обновление кредита могло потеряться, а без
+            # кадров в полете новых подтверждений не будет
+            return 1
+        return self.peer_credit
+
+    def _hold_data(self, now: float) -> bool:
+        """Придержать ли короткие данные в очереди (как алгоритм Нейгла).
+
+        Пока линия занята предыдущими кадрами, данные, которых не хватает
+        на полный кадр, ждут попутчиков - но не дольше batch_delay. Ждать
+        подтверждения, как в TCP, нельзя: вместе с отложенным ACK это
+        задерживало бы каждое короткое сообщение на ack_delay.
+        """
+        if (not self.batch_agreed or not self.line_rate or self._line_free_at <= now
+                or now - self._queue_since >= self.batch_delay):
+            return False
+        size = 0
+        for payload in self.send_queue:
+            size += 1 + len(payload)
+            if size >= self.mtu - 1:
+                return False
+        return True
+
+    def _next_data_frame(self) -> Frame:
+        """Новый кадр данных из очереди.
+
+        Если узел понимает TYPE_BATCH, в кадр собираются несколько порций
+        из очереди и попутное подтверждение; одиночная порция без
+        подтверждения и порция, которая не помещается, идут обычным I-кадром.
+        """
+        payload = self.send_queue.popleft()
+        if self.batch_agreed:
+            ack = self._ack_state() if self._ack_pending else b''
+            # Номер, длина подтверждения, подтверждение и порции - не больше mtu + 1 байт
+            budget = self.mtu - 1 - len(ack)
+            if len(payload) < budget and (ack or (self.send_queue and len(payload) + len(self.send_queue[0]) + 2 <= budget)):
+                records = bytearray([len(payload)]) + payload
+                while self.send_queue and len(records) + 1 + len(self.send_queue[0]) <= budget:
+                    payload = self.send_queue.popleft()
+                    records.append(len(payload))
+                    records += payload
+                if ack:
+                    self._take_ack_state()
+                if METRICS.enabled:
+                    METRICS.inc('link.payload_sent', len(records))
+                    if ack:
+                        METRICS.inc('connection.piggybacked_acks')
+                return self.create_frame(Frame.TYPE_BATCH, bytes([self.next_seq, len(ack)]) + ack + records)
+        if METRICS.enabled:
+            METRICS.inc('link.payload_sent', len(payload))
+        return self.create_frame(Frame.TYPE_I, bytes([self.next_seq]) + payload)
+
+    def poll_incoming(self) -> list[bytes]:
+        """Возвращает принятые по порядку данные и очищает очередь."""
+        data = list(self.incoming)
+        self.incoming.clear()
+        self._incoming_bytes = 0
+        if self.credit_agreed and self._credit_sent * 2 < self.window_size and self.state == ConnectionState.CONNECTED:
+            # Узел стоит или почти стоит без кредита - сообщаем, что место освободилось
+            self._ack_due = time.time()
+            if METRICS.enabled:
+                METRICS.inc('connection.window_updates')
+        if METRICS.enabled:
+            METRICS.inc('link.payload_received', sum(map(len, data)))
+        return data
+
+    def unacked_count(self) -> int:
+        """Количество отправленных, но еще не подтвержденных кадров."""
+        return len(self.in_flight)
+
     def check_timeout(self) -> Frame | None:
-        """Проверяет таймаут и возвращает фрейм для повторной отправки если нужно."""
-        if self.last_activity is None:
+        """Повторяет LINK/UPLINK по истечении RTO; возвращает фрейм для повторной отправки."""
+        if self.last_activity is None or self.state not in (ConnectionState.CONNECTING,
+                                                            ConnectionState.DISCONNECTING):
             return None
-            
-        if time.time() - self.last_activity > self.timeout:
-            if self.retry_count >= self.max_retries:
-                self.state = ConnectionState.DISCONNECTED
-                return None
-                
-            self.retry_count += 1
-            self.last_activity = time.time()
-            
-            if self.state == ConnectionState.CONNECTING:
-                return self.create_frame(Frame.TYPE_LINK)
-            elif self.state == ConnectionState.DISCONNECTING:
-                return self.create_frame(Frame.TYPE_UPLINK)
-                
-        return None
+        if time.time() <= self._control_deadline():
+            return None
+
+        if self.retry_count >= self.max_retries:
+            self.state = ConnectionState.DISCONNECTED
+            if METRICS.enabled:
+                METRICS.inc('connection.timeouts')
+            return None
+
+        self.retry_count += 1
+        if METRICS.enabled:
+            METRICS.inc('connection.control_retries')
+        frame_type = Frame.TYPE_LINK if self.state == ConnectionState.CONNECTING else Frame.TYPE_UPLINK
+        frame = self.create_frame(frame_type)
+        self._control_sent_at = self._departure(frame)
+        return frame
     
+    def next_timeout(self) -> float | None:
+        """Время (time.time()), когда нужно снова вызвать check_timeout/poll_outgoing."""
+        if self.last_activity is None:
+            return None
+        if self.state == ConnectionState.DISCONNECTED:
+            # Сохраненный сеанс: когда его можно забыть
+            return self._heard_at + self.session_grace if self.can_resume() else None
+        if self.state != ConnectionState.CONNECTED:
+            return self._control_deadline()
+        if self.control_queue:
+            return time.time()
+        deadline = self.last_activity + self.idle_timeout
+        if self._baud_deadline is not None:
+            deadline = min(deadline, self._baud_deadline)
+        if self._ack_due is not None:
+            deadline = min(deadline, self._ack_due)
+        if self.adaptive and self.last_activity > self._last_review:
+            # Пересмотр качества идет в poll_outgoing: принимающей стороне без своих кадров иначе его не дождаться
+            deadline = min(deadline, self._last_review + self.adapt_interval)
+        now = time.time()
+        if (self.send_queue and seq_diff(self.next_seq, self.send_base) < self._send_limit(now)
+                and not self._verifying_baudrate()):
+            # Данные в очереди и место в окне: отправлять сейчас или по окончании удержания
+            if not self._hold_data(now):
+                return now
+            deadline = min(deadline, self._line_free_at, self._queue_since + self.batch_delay)
+        elif self.send_queue and self.peer_credit == 0 and not self.in_flight:
+            deadline = min(deadline, self._credit_at + self.rto)  # Проба нулевого кредита
+        for entry in self.in_flight.values():
+            deadline = min(deadline, entry[1] + self.rto)
+        return deadline
+
     def is_connection_timeout(self) -> bool:
-        """Проверяет, истек ли таймаут соединения."""
+        """Проверяет, истек ли таймаут простоя соединения."""
         if self.last_activity is None or self.state != ConnectionState.CONNECTED:
             return False
-        return time.time() - self.last_activity > self.timeout
+        return time.time() - self.last_activity > self.idle_timeout
     
     def is_connected(self) -> bool:
         """Проверяет, установлено ли соединение."""
         return self.state == ConnectionState.CONNECTED
+
+    def can_resume(self) -> bool:
+        """Можно ли после обрыва возобновить сеанс вместо новой установки соединения."""
+        return (self.session_id is not None and self._heard_at is not None
+                and time.time() - self._heard_at <= self.session_grace)
+
+    def _session_state(self) -> bytes:
+        """Значение OPT_SESSION: идентификатор сеанса и номер следующего ожидаемого кадра."""
+        return self.session_id + bytes([self.recv_window.next])
+
+    def _session_matches(self, value) -> bool:
+        return (self.session_id is not None and len(value) == SESSION_ID_SIZE + 1
+                and bytes(value[:SESSION_ID_SIZE]) == self.session_id)
+
+    def _resume_session(self, peer_next: int):
+        """Продолжает сеанс: снимает кадры, которые узел уже получил, и сразу повторяет остальные."""
+        self.state = ConnectionState.CONNECTED
+        self.resumed = True
+        self.ret_requested = None
+        self._ack_pending = 0
+        self._ack_due = None
+        for entry in self.in_flight.values():
+            entry[2] = 1  # Подтверждение через обрыв не замеряем (Karn), счет повторов - заново
+        self._handle_ack(bytes([peer_next, self.window_size]) if self.credit_agreed else bytes([peer_next]))
+        if self.srtt is not None:
+            # Отсрочка, накопленная до обрыва, больше не нужна
+            self.rto = min(self.max_rto, max(self.min_rto, self.srtt + 4 * self.rttvar))
+        for seq in sorted(self.in_flight, key=lambda seq: seq_diff(seq, self.send_base)):
+            entry = self.in_flight[seq]
+            entry[1] = self._departure(entry[0])
+            self.control_queue.append(entry[0])
+        if METRICS.enabled:
+            METRICS.inc('connection.resumed')
+            METRICS.inc('connection.replayed', len(self.in_flight))
     
     def __str__(self) -> str:
         return f"Connection {self.local_nick}↔{self.remote_nick} [{self.state.value}]" 
\ No newline at end of file
@@ -0,0 +1,108 @@
+import heapq
+import itertools
+import time
+from connection import Connection
+from frame import Frame
+
+MAX_ADDR = 0x7F  # Адреса узлов 7-битные
+
+class ConnectionTable:
+    """Таблица соединений узла с диспетчеризацией за O(1) и очередью сроков.
+
+    Соединения индексируются парой (адрес отправителя кадра, адрес получателя),
+    то есть (remote_addr, local_addr), поэтому один процесс может обслуживать
+    любые из 128 адресов одновременно. Широковещательный кадр раздается всем
+    соединениям с его отправителем. Сроки таймаутов хранятся в куче с ленивой
+    отменой: перепланирование - это новая запись, устаревшие записи
+    отбрасываются при извлечении, и полного обхода таблицы не бывает.
+    """
+
+    def __init__(self):
+        self._by_pair = {}    # (remote, local) -> Connection
+        self._by_remote = {}  # remote -> {local: Connection}, для широковещательной рассылки
+        self._deadlines = {}  # (remote, local) -> актуальный срок
+        self._heap = []       # (срок, порядковый номер, (remote, local))
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._by_pair)
+
+    def __iter__(self):
+        return iter(list(self._by_pair.values()))
+
+    def __contains__(self, key: tuple[int, int]) -> bool:
+        return key in self._by_pair
+
+    def get(self, remote_addr: int, local_addr: int) -> Connection | None:
+        """Возвращает соединение по паре адресов."""
+        return self._by_pair.get((remote_addr, local_addr))
+
+    def add(self, connection: Connection) -> Connection:
+        """Добавляет соединение в таблицу."""
+        for addr in (connection.remote_addr, connection.local_addr):
+            if not 0 <= addr <= MAX_ADDR:
+                raise ValueError(f"Адрес 0x{addr:02X} вне диапазона 0x00-0x{MAX_ADDR:02X}")
+        key = (connection.remote_addr, connection.local_addr)
+        if key in self._by_pair:
+            raise ValueError(f"Соединение 0x{key[1]:02X}↔0x{key[0]:02X} уже существует")
+        self._by_pair[key] = connection
+        self._by_remote.setdefault(connection.remote_addr, {})[connection.local_addr] = connection
+        return connection
+
+    def remove(self, connection: Connection):
+        """Удаляет соединение и его срок."""
+        key = (connection.remote_addr, connection.local_addr)
+        if self._by_pair.pop(key, None) is None:
+            return
+        peers = self._by_remote[connection.remote_addr]
+        del peers[connection.local_addr]
+        if not peers:
+            del self._by_remote[connection.remote_addr]
+        self._deadlines.pop(key, None)
+
+    def lookup(self, frame: Frame) -> list[Connection]:
+        """Находит соединения, которым адресован фрейм."""
+        if frame.receiver == Frame.BROADCAST_ADDR:
+            return list(self._by_remote.get(frame.sender, {}).values())
+        connection = self._by_pair.get((frame.sender, frame.receiver))
+        return [connection] if connection is not None else []
+
+    def schedule(self, connection: Connection, deadline: float | None):
+        """Назначает (или снимает при None) срок следующей проверки соединения."""
+        key = (connection.remote_addr, connection.local_addr)
+        if key not in self._by_pair:
+            return
+        if deadline is None:
+            self._deadlines.pop(key, None)
+            return
+        if self._deadlines.get(key) == deadline:
+            return
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._compact()
+
+    def _compact(self):
+        """Перестраивает кучу без устаревших записей (амортизированно O(1) на вызов schedule)."""
+        self._heap = [(deadline, next(self._counter), key) for key, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
+
+    def expired(self, now: float = None) -> list[Connection]:
+        """Извлекает соединения, срок которых наступил; их срок снимается."""
+        now = time.time() if now is None else now
+        result = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(heap)
+            if self._deadlines.get(key) != deadline:
+                continue  # Запись устарела: срок перенесен или соединение удалено
+            del self._deadlines[key]
+            result.append(self._by_pair[key])
+        return result
+
+    def next_deadline(self) -> float | None:
+        """Ближайший актуальный срок среди всех соединений."""
+        heap = self._heap
+        while heap and self._deadlines.get(heap[0][2]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
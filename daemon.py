@@ -0,0 +1,440 @@
+"""Фоновый узел канала: один процесс владеет портом и соединениями, приложения
+работают с ним через Unix-сокет.
+
+Протокол API - строки JSON: одна строка - один запрос, на каждый запрос
+приходит строка-ответ с тем же id и полем ok (при ошибке - error). Запросы:
+  {"cmd": "connect", "addr": 1}              - установить соединение (или взять готовое)
+  {"cmd": "send", "addr": 1, "text": "..."}  - отправить сообщение (или "data" в base64; первый
+                                               байт 0x00 занят передачей файлов); соединение
+                                               устанавливается при необходимости
+  {"cmd": "subscribe", "addr": 1}            - получать сообщения и смену состояний
+                                               (без addr - от всех узлов)
+  {"cmd": "unsubscribe"}
+  {"cmd": "disconnect", "addr": 1}
+  {"cmd": "status"}                          - список соединений
+  {"cmd": "stats", "arg": "on"}              - метрики, как команда stats в CLI
+Подписчикам приходят события без id:
+  {"event": "message", "addr": 1, "nick": "...", "data": "<base64>", "text": "..."}
+  {"event": "state", "addr": 1, "nick": "...", "state": "CONNECTED"}
+
+Соединения общие для всех клиентов: установленное одним приложением
+соединение другие используют без повторного рукопожатия, а оборвавшееся
+возобновляется с сохраненным сеансом (событие state с "resumed": true). Скорость порта не
+согласуется - порт общий для всех узлов линии.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import signal
+import socket
+from connection import Connection, ConnectionState
+from connection_table import ConnectionTable
+from engine import create_engine
+from filetransfer import FileTransfers, is_transfer_message
+from frame import Frame
+from message import MessageChannel
+from metrics import METRICS, dump_settings, stats_command
+
+MAX_REQUEST = 16 * 1024 * 1024 * 4 // 3 + 4096  # Строка запроса: сообщение в base64 и поля
+MAX_CLIENT_BUFFER = 4 * 1024 * 1024               # Неотправленные события клиента; больше - клиент отключается
+
+class LinkDaemon:
+    """Узел канала с API для многих клиентов.
+
+    Соединения и сборку сообщений трогает только поток движка (engine.call_soon),
+    сокеты клиентов - только цикл asyncio (loop.call_soon_threadsafe). Для
+    LinkEngine это один поток, для DuplexLink - два.
+    """
+
+    def __init__(self, ser, my_addr: int, nickname: str, socket_path: str, line_rate: float | None = None):
+        self.my_addr = my_addr
+        self.nickname = nickname
+        self.socket_path = socket_path
+        self.line_rate = line_rate
+        self.connections = ConnectionTable()
+        self.channels = {}   # Сборка сообщений для каждого узла
+        self.transfers = {}  # Служебные сообщения передачи файлов: прием файлов выключен, предложения отклоняются
+        self.waiters = {}    # Адрес -> futures запросов, ждущих установки соединения
+        self.clients = set()
+        self.engine = create_engine(ser, self.on_frame, self.on_tick)
+        self._loop = None
+
+    async def run(self, handle_signals: bool = True):
+        """Работает до SIGINT/SIGTERM (handle_signals=False - до engine.stop(), например не в главном потоке)."""
+        self._loop = asyncio.get_running_loop()
+        dump = dump_settings()
+
+        def on_start():
+            if dump:
+                self.engine.every(dump[1], lambda: METRICS.dump(dump[0]))
+        engine = asyncio.create_task(self.engine.run(on_start=on_start))
+        await asyncio.sleep(0)  # Движок запомнил цикл - можно принимать запросы
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)  # Сокет остался от прошлого запуска
+        server = await asyncio.start_unix_server(self._serve_client, self.socket_path, limit=MAX_REQUEST)
+        if handle_signals:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                self._loop.add_signal_handler(sig, self.engine.stop)
+        try:
+            await engine
+        finally:
+            server.close()
+            for client in list(self.clients):
+                client.close()
+            # Обработчики клиентов завершатся сами, получив конец потока
+            await asyncio.gather(*(client.task for client in self.clients), return_exceptions=True)
+            await server.wait_closed()
+            os.remove(self.socket_path)
+            if dump:
+                METRICS.dump(dump[0])
+
+    # Поток движка: соединения
+
+    def on_frame(self, frame: Frame):
+        """Раздает входящий фрейм соединениям; для нового узла создает соединение."""
+        if frame.receiver != self.my_addr and frame.receiver != Frame.BROADCAST_ADDR:
+            return
+        connections = self.connections.lookup(frame)
+        if not connections:
+            if not frame.crc_ok or frame.receiver == Frame.BROADCAST_ADDR:
+                return
+            connections = [self._add_connection(frame.sender)]
+        for connection in connections:
+            old_state = connection.state
+            response = connection.handle_frame(frame)
+            if response:
+                self.engine.send(response)
+            self._deliver(connection)
+            self._state_changed(connection, old_state)
+            if connection.remote_addr in self.channels:
+                self.reschedule(connection)
+
+    def on_tick(self) -> float | None:
+        """Обслуживает соединения, срок которых наступил."""
+        for connection in self.connections.expired():
+            channel = self.channels[connection.remote_addr]
+            old_state = connection.state
+            if old_state == ConnectionState.DISCONNECTED:
+                if connection.can_resume():
+                    self.reschedule(connection)
+                else:
+                    self._forget(connection)  # Срок сохраненного сеанса истек
+                continue
+            if connection.is_connection_timeout():
+                connection.state = ConnectionState.DISCONNECTED
+                self._state_changed(connection, old_state)
+                continue
+            retry = connection.check_timeout()
+            if retry:
+                self.engine.send(retry)
+            channel.check_timeout()
+            for frame in connection.poll_outgoing():
+                self.engine.send(frame)
+            self._state_changed(connection, old_state)
+            if connection.remote_addr in self.channels:
+                self.reschedule(connection)
+        return self.connections.next_deadline()
+
+    def reschedule(self, connection: Connection):
+        channel = self.channels[connection.remote_addr]
+        deadlines = [d for d in (connection.next_timeout(), channel.next_timeout()) if d is not None]
+        self.connections.schedule(connection, min(deadlines, default=None))
+
+    def _add_connection(self, remote_addr: int) -> Connection:
+        connection = self.connections.add(Connection(self.my_addr, remote_addr, local_nick=self.nickname,
+                                                     line_rate=self.line_rate))
+        self.channels[remote_addr] = MessageChannel(connection)
+        self.transfers[remote_addr] = FileTransfers(self.channels[remote_addr], lambda text, status: None)
+        return connection
+
+    def _deliver(self, connection: Connection):
+        """Раздает собранные сообщения подписчикам."""
+        for data in self.channels[connection.remote_addr].receive():
+            if self.transfers[connection.remote_addr].handle_message(data):
+                continue
+            event = {'event': 'message', 'addr': connection.remote_addr, 'nick': connection.remote_nick,
+                     'data': base64.b64encode(data).decode('ascii')}
+            try:
+                event['text'] = str(data, 'utf-8')
+            except UnicodeDecodeError:
+                pass
+            self._publish(connection.remote_addr, event)
+
+    def _state_changed(self, connection: Connection, old_state: ConnectionState):
+        """Сообщает подписчикам о смене состояния и будит ждущие запросы; забывает разорванные соединения."""
+        state = connection.state
+        if state == old_state:
+            return
+        event = {'event': 'state', 'addr': connection.remote_addr, 'nick': connection.remote_nick,
+                 'state': state.value}
+        if state == ConnectionState.CONNECTED:
+            event['resumed'] = connection.resumed
+        self._publish(connection.remote_addr, event)
+        if state in (ConnectionState.CONNECTED, ConnectionState.DISCONNECTED):
+            error = None if state == ConnectionState.CONNECTED else f"Узел 0x{connection.remote_addr:02X} недоступен"
+            for future in self.waiters.pop(connection.remote_addr, []):
+                self._loop.call_soon_threadsafe(_resolve, future, error)
+        if state == ConnectionState.DISCONNECTED:
+            self.transfers[connection.remote_addr].close()
+            if not connection.can_resume():
+                self._forget(connection)
+            # Иначе соединение ждет возобновления сеанса до конца срока
+
+    def _forget(self, connection: Connection):
+        self.connections.remove(connection)
+        self.channels.pop(connection.remote_addr, None)
+        self.transfers.pop(connection.remote_addr).close()
+
+    def _connect(self, remote_addr: int, future: asyncio.Future):
+        """Берет готовое соединение или устанавливает новое; future завершится по итогу."""
+        connection = self.connections.get(remote_addr, self.my_addr)
+        if connection is not None and connection.state == ConnectionState.CONNECTED:
+            self._loop.call_soon_threadsafe(_resolve, future, None)
+            return
+        self.waiters.setdefault(remote_addr, []).append(future)
+        if connection is None:
+            connection = self._add_connection(remote_addr)
+        if connection.state == ConnectionState.DISCONNECTED:
+            self.engine.send(connection.connect())
+            self._state_changed(connection, ConnectionState.DISCONNECTED)
+            self.reschedule(connection)
+
+    def _send(self, remote_addr: int, data: bytes):
+        connection = self.connections.get(remote_addr, self.my_addr)
+        if connection is None or not connection.is_connected():
+            raise ValueError(f"Нет соединения с 0x{remote_addr:02X}")
+        if is_transfer_message(data):
+            raise ValueError("Сообщения, начинающиеся с байта 0x00, зарезервированы для передачи файлов")
+        self.channels[remote_addr].send(data)
+        self.reschedule(connection)
+
+    def _disconnect(self, remote_addr: int):
+        connection = self.connections.get(remote_addr, self.my_addr)
+        if connection is None:
+            raise ValueError(f"Нет соединения с 0x{remote_addr:02X}")
+        old_state = connection.state
+        self.engine.send(connection.disconnect())
+        self._state_changed(connection, old_state)
+        self.reschedule(connection)
+
+    def _status(self) -> list[dict]:
+        return [{'addr': c.remote_addr, 'nick': c.remote_nick, 'state': c.state.value,
+                 'unacked': c.unacked_count(), 'queued': len(c.send_queue)} for c in self.connections]
+
+    def _publish(self, remote_addr: int, event: dict):
+        line = (json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8')
+        self._loop.call_soon_threadsafe(self._broadcast, remote_addr, line)
+
+    # Цикл asyncio: клиенты
+
+    def _broadcast(self, remote_addr: int, line: bytes):
+        for client in list(self.clients):
+            if client.subscribed and (not client.peers or remote_addr in client.peers):
+                client.write(line)
+
+    async def _in_engine(self, func, *args):
+        """Выполняет func в потоке движка и возвращает результат (или поднимает ее исключение)."""
+        future = self._loop.create_future()
+
+        def run():
+            try:
+                result = func(*args)
+            except Exception as e:  # Любая ошибка должна дойти до клиента, иначе запрос повиснет
+                self._loop.call_soon_threadsafe(_fail, future, e)
+            else:
+                self._loop.call_soon_threadsafe(future.set_result, result)
+        self.engine.call_soon(run)
+        return await future
+
+    async def _ensure_connected(self, remote_addr: int, timeout: float = 60.0):
+        future = self._loop.create_future()
+        self.engine.call_soon(lambda: self._connect(remote_addr, future))
+        await asyncio.wait_for(future, timeout)
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _Client(writer)
+        self.clients.add(client)
+        try:
+            while line := await reader.readline():
+                reply = await self._handle_request(client, line)
+                if reply is not None:
+                    client.write((json.dumps(reply, ensure_ascii=False) + '\n').encode('utf-8'))
+        except (ConnectionError, ValueError):
+            pass  # Клиент отключился или прислал слишком длинную строку
+        finally:
+            self.clients.discard(client)
+            client.close()
+
+    async def _handle_request(self, client: '_Client', line: bytes) -> dict | None:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {'ok': False, 'error': "Запрос должен быть строкой JSON"}
+        if not isinstance(request, dict):
+            return {'ok': False, 'error': "Запрос должен быть объектом JSON"}
+        reply = {'ok': True}
+        if 'id' in request:
+            reply['id'] = request['id']
+        try:
+            result = await self._execute(client, request)
+        except (ValueError, TypeError, KeyError) as e:
+            reply.update(ok=False, error=str(e))
+        except asyncio.TimeoutError:
+            reply.update(ok=False, error="Превышено время ожидания")
+        except Exception as e:
+            reply.update(ok=False, error=f"{type(e).__name__}: {e}")
+        else:
+            if result:
+                reply.update(result)
+        return reply
+
+    async def _execute(self, client: '_Client', request: dict) -> dict | None:
+        command = request.get('cmd')
+        if command in ('connect', 'send', 'disconnect'):
+            addr = _parse_addr(request.get('addr'))
+        if command == 'connect':
+            await self._ensure_connected(addr, request.get('timeout', 60.0))
+        elif command == 'send':
+            if 'text' in request:
+                data = str(request['text']).encode('utf-8')
+            else:
+                data = base64.b64decode(request['data'], validate=True)
+            await self._ensure_connected(addr, request.get('timeout', 60.0))
+            await self._in_engine(self._send, addr, data)
+        elif command == 'subscribe':
+            client.subscribed = True
+            if request.get('addr') is not None:
+                client.peers.add(_parse_addr(request['addr']))
+        elif command == 'unsubscribe':
+            client.subscribed = False
+            client.peers.clear()
+        elif command == 'disconnect':
+            await self._in_engine(self._disconnect, addr)
+        elif command == 'status':
+            return {'connections': await self._in_engine(self._status), 'addr': self.my_addr}
+        elif command == 'stats':
+            return {'stats': await self._in_engine(stats_command, str(request.get('arg', '')))}
+        else:
+            raise ValueError(f"Неизвестная команда: {command}")
+        return None
+
+class _Client:
+    """Подключенное приложение: поток записи и подписка."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.task = asyncio.current_task()
+        self.subscribed = False
+        self.peers = set()  # Адреса, на которые подписан клиент; пусто - все
+
+    def write(self, line: bytes):
+        if self.writer.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+            self.close()  # Клиент не читает события - не копим их бесконечно
+            return
+        self.writer.write(line)
+
+    def close(self):
+        if not self.writer.is_closing():
+            self.writer.close()
+
+def _resolve(future: asyncio.Future, error: str | None):
+    if not future.done():
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(ValueError(error))
+
+def _fail(future: asyncio.Future, error: Exception):
+    if not future.done():
+        future.set_exception(error)
+
+def _parse_addr(value) -> int:
+    if isinstance(value, str):
+        value = int(value, 16)
+    if not isinstance(value, int) or not 0 <= value <= 0x7F or value == Frame.BROADCAST_ADDR:
+        raise ValueError("Адрес узла должен быть в диапазоне 0x00-0x7F")
+    return value
+
+class DaemonClient:
+    """Простой синхронный клиент API для приложений.
+
+        with DaemonClient('/tmp/link-ttyUSB0.sock') as link:
+            link.request('send', addr=0x12, text='Привет')
+            link.request('subscribe')
+            for event in link.events():
+                ...
+    """
+
+    def __init__(self, socket_path: str, timeout: float | None = None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self.file = self.sock.makefile('rwb')
+        self._events = []  # События, пришедшие, пока ждали ответа на запрос
+        self._next_id = 0
+
+    def request(self, cmd: str, **args) -> dict:
+        """Выполняет запрос; ValueError, если демон ответил ошибкой."""
+        self._next_id += 1
+        self.file.write((json.dumps({'id': self._next_id, 'cmd': cmd, **args}) + '\n').encode('utf-8'))
+        self.file.flush()
+        while True:
+            message = self._read()
+            if message.get('id') == self._next_id:
+                if not message.get('ok'):
+                    raise ValueError(message.get('error'))
+                return message
+            self._events.append(message)
+
+    def events(self):
+        """События подписки по мере поступления."""
+        while True:
+            yield self._events.pop(0) if self._events else self._read()
+
+    def _read(self) -> dict:
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Демон закрыл соединение")
+        return json.loads(line)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    from config import SerialConfig
+    import serial
+
+    parser = argparse.ArgumentParser(description="Фоновый узел канала с API на Unix-сокете")
+    parser.add_argument('port', help="путь к порту, например /dev/ttyUSB0")
+    parser.add_argument('--addr', default='0x01', help="адрес узла (0x00-0x7F), по умолчанию 0x01")
+    parser.add_argument('--nick', help="никнейм узла, по умолчанию - адрес")
+    parser.add_argument('--socket', help="путь к сокету API, по умолчанию /tmp/link-<порт>.sock")
+    args = parser.parse_args()
+
+    try:
+        addr = _parse_addr(args.addr)
+    except ValueError as e:
+        parser.error(str(e))
+    socket_path = args.socket or f"/tmp/link-{os.path.basename(args.port)}.sock"
+    config = SerialConfig.load()
+    ser = serial.Serial(args.port, **config.to_dict())
+    daemon = LinkDaemon(ser, addr, args.nick or f"0x{addr:02X}", socket_path, config.line_rate())
+    print(f"Узел 0x{addr:02X} на {args.port}, API: {socket_path}")
+    try:
+        asyncio.run(daemon.run())
+    finally:
+        ser.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import asyncio
+import queue
+import select
+import threading
+import time
+from frame import Frame
+from metrics import METRICS
+from wire import FrameDecoder, encode_frame
+
+class DuplexLink:
+    """Потоковый движок канала: отдельные потоки чтения и записи порта.
+
+    Поток записи берет готовые буферы из ограниченной очереди outbound, поток
+    чтения декодирует кадры и кладет их в ограниченную очередь inbound, так
+    что прием и передача идут по линии одновременно и не ждут друг друга.
+    Полные очереди притормаживают производителя, а не копят память.
+
+    Все обработчики клиента (on_frame, on_tick, call_soon, every, add_reader)
+    выполняются в одном потоке-диспетчере, поэтому Connection и остальное
+    состояние клиента блокировок не требуют: из других потоков с ними
+    работают только через call_soon. Интерфейс совпадает с LinkEngine.
+    """
+
+    def __init__(self, ser, on_frame, on_tick, max_outbound: int = 64, max_inbound: int = 256):
+        self.ser = ser
+        self.on_frame = on_frame
+        self.on_tick = on_tick
+        self.decoder = FrameDecoder()
+        self._outbound = queue.Queue(max_outbound)  # Закодированные кадры, смена настроек порта; None - конец работы
+        self._inbound = queue.Queue(max_inbound)    # Кадры и вызовы для диспетчера
+        self._stopping = threading.Event()
+        self._threads = []
+        self._periodic = []  # [срок, интервал, callback]
+        self._deadline = None
+
+    def send(self, frame: Frame, timeout: float | None = None):
+        """Ставит фрейм в очередь записи; ждет места, если очередь полна.
+
+        После stop() или ошибки записи в порт не ждет: кадр, не поместившийся
+        в очередь, отбрасывается.
+        """
+        self._put(encode_frame(frame), timeout)
+        if METRICS.enabled:
+            METRICS.gauge('engine.write_queue', self._outbound.qsize())
+
+    def set_baudrate(self, rate: int):
+        """Меняет скорость порта, когда уже поставленные в очередь фреймы уйдут в линию."""
+        self._put(lambda: self.ser.apply_settings({'baudrate': rate}))
+
+    def _put(self, item, timeout: float | None = None):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if self._stopping.is_set():
+                wait = 0.0
+            else:
+                wait = 0.2 if deadline is None else min(0.2, max(0.0, deadline - time.time()))
+            try:
+                self._outbound.put(item, timeout=wait)
+                return
+            except queue.Full:
+                if self._stopping.is_set():
+                    # Писатель может быть уже остановлен: ждать места бесполезно
+                    if METRICS.enabled:
+                        METRICS.inc('engine.write_dropped')
+                    return
+                if deadline is not None and time.time() >= deadline:
+                    raise
+
+    def call_soon(self, callback):
+        """Выполняет callback в потоке диспетчера и обслуживает соединения (можно вызывать из любого потока)."""
+        self._inbound.put(callback)
+
+    def wakeup(self):
+        """Просит обслужить соединения на ближайшей итерации диспетчера."""
+        self.call_soon(None)
+
+    def every(self, interval: float, callback):
+        """Вызывает callback каждые interval секунд, пока движок работает."""
+        self._periodic.append([time.time() + interval, interval, callback])
+
+    def add_reader(self, fileobj, callback):
+        """Вызывает callback в диспетчере, когда fileobj готов к чтению (например, stdin; только POSIX)."""
+        done = threading.Event()
+
+        def read():
+            try:
+                callback()
+            finally:
+                done.set()
+
+        def watch():
+            while not self._stopping.is_set():
+                ready, _, _ = select.select([fileobj], [], [], 0.2)
+                if ready:
+                    # Ждем, пока диспетчер прочитает данные, иначе select сработает снова
+                    done.clear()
+                    self.call_soon(read)
+                    while not done.wait(0.2) and not self._stopping.is_set():
+                        pass
+        self._start_thread(watch, 'link-stdin')
+
+    def stop(self):
+        """Останавливает движок после отправки уже поставленных в очередь фреймов."""
+        self._stopping.set()
+        try:
+            self._inbound.put_nowait(None)
+        except queue.Full:
+            pass  # Диспетчер и так проснется на ближайшем элементе очереди
+
+    def serve(self, on_start=None):
+        """Запускает потоки ввода-вывода и работает диспетчером до вызова stop()."""
+        self._start_thread(self._read_loop, 'link-reader')
+        writer = self._start_thread(self._write_loop, 'link-writer')
+        try:
+            if on_start is not None:
+                on_start()
+            self._tick()
+            while not self._stopping.is_set():
+                self._dispatch()
+        finally:
+            self._stopping.set()
+            # Писатель дописывает очередь и выходит; если он уже упал на ошибке порта, места не будет
+            while writer.is_alive():
+                try:
+                    self._outbound.put(None, timeout=0.2)
+                    break
+                except queue.Full:
+                    pass
+            writer.join()
+            cancel = getattr(self.ser, 'cancel_read', None)
+            if cancel is not None:
+                cancel()
+            for thread in self._threads:
+                thread.join(timeout=1.0)
+
+    async def run(self, on_start=None):
+        """То же, что serve(), для кода, написанного под LinkEngine.run()."""
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(None, self.serve, on_start)
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            self.stop()
+            await task
+            raise
+
+    def _start_thread(self, target, name: str) -> threading.Thread:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return thread
+
+    def _dispatch(self):
+        """Обрабатывает очередной кадр или вызов; по сроку обслуживает соединения."""
+        now = time.time()
+        deadlines = [entry[0] for entry in self._periodic]
+        if self._deadline is not None:
+            deadlines.append(self._deadline)
+        timeout = max(0.0, min(deadlines) - now) if deadlines else None
+        try:
+            self._handle(self._inbound.get(timeout=timeout))
+            # Забираем все, что уже накопилось, и только потом обслуживаем соединения
+            while True:
+                self._handle(self._inbound.get_nowait())
+        except queue.Empty:
+            pass
+        now = time.time()
+        for entry in self._periodic:
+            if now >= entry[0]:
+                entry[0] = now + entry[1]
+                entry[2]()
+        self._tick()
+
+    def _handle(self, item):
+        if isinstance(item, Frame):
+            self.on_frame(item)
+        elif item is not None:
+            item()
+
+    def _tick(self):
+        self._deadline = self.on_tick()
+
+    def _read_loop(self):
+        """Поток чтения: байты из порта -> кадры в очередь inbound."""
+        while not self._stopping.is_set():
+            try:
+                data = self.ser.read(max(1, self.ser.in_waiting))
+            except (OSError, TypeError, ValueError):
+                break  # Порт закрыт
+            for frame in self.decoder.feed(data):
+                while not self._stopping.is_set():
+                    try:
+                        self._inbound.put(frame, timeout=0.2)
+                        break
+                    except queue.Full:
+                        pass
+
+    def _write_loop(self):
+        """Поток записи: буферы из очереди outbound -> порт."""
+        while True:
+            data = self._outbound.get()
+            if data is None:
+                return
+            try:
+                if callable(data):
+                    data()  # Смена настроек порта (set_baudrate): предыдущие записи уже ушли
+                    continue
+                self.ser.write(data)
+                self.ser.flush()
+            except OSError:
+                # Порт закрыт или отключен: писать больше некуда, движок останавливается
+                if METRICS.enabled:
+                    METRICS.inc('engine.write_errors')
+                self.stop()
+                return
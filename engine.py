@@ -0,0 +1,162 @@
+import asyncio
+import os
+import sys
+import time
+from duplex import DuplexLink
+from frame import Frame
+from metrics import METRICS
+from wire import FrameDecoder, encode_frame
+
+class LinkEngine:
+    """Событийный движок канала на asyncio.
+
+    Чтение порта запускается по готовности его дескриптора (как
+    asyncio.Protocol.data_received), отправка идет через очередь записи,
+    а таймауты соединений обслуживаются одним таймером, взведенным на
+    ближайший срок. В простое движок не просыпается вообще.
+
+    Клиент передает два обработчика:
+      on_frame(frame) - вызывается для каждого принятого фрейма;
+      on_tick() -> float | None - обслуживает таймауты и очереди соединений
+        и возвращает время (time.time()) следующего срока или None.
+    """
+
+    def __init__(self, ser, on_frame, on_tick):
+        self.ser = ser
+        self.on_frame = on_frame
+        self.on_tick = on_tick
+        self.decoder = FrameDecoder()
+        self._loop = None
+        self._queue = None
+        self._timer = None
+        self._stopped = None
+        self._writer = None
+        self._fd = None  # Дескриптор порта, который слушает цикл
+        self._periodic = []  # Таймеры every(); в списке - текущий handle каждого
+
+    def send(self, frame: Frame):
+        """Ставит фрейм в очередь записи."""
+        self._queue.put_nowait(encode_frame(frame))
+        if METRICS.enabled:
+            METRICS.gauge('engine.write_queue', self._queue.qsize())
+
+    def set_baudrate(self, rate: int):
+        """Меняет скорость порта, когда уже поставленные в очередь фреймы уйдут в линию."""
+        self._queue.put_nowait(lambda: self.ser.apply_settings({'baudrate': rate}))
+
+    def wakeup(self):
+        """Просит обслужить соединения на ближайшей итерации цикла."""
+        self._loop.call_soon(self._tick)
+
+    def call_soon(self, callback):
+        """Выполняет callback в цикле движка и обслуживает соединения (можно вызывать из любого потока)."""
+        def run():
+            callback()
+            self._tick()
+        self._loop.call_soon_threadsafe(run)
+
+    def every(self, interval: float, callback):
+        """Вызывает callback каждые interval секунд, пока движок работает."""
+        def tick():
+            callback()
+            handle[0] = self._loop.call_later(interval, tick)
+        handle = [self._loop.call_later(interval, tick)]
+        self._periodic.append(handle)
+
+    def add_reader(self, fileobj, callback):
+        """Подписывает callback на готовность произвольного дескриптора (например, stdin)."""
+        self._loop.add_reader(fileobj, callback)
+
+    def stop(self):
+        """Останавливает движок после отправки уже поставленных в очередь фреймов."""
+        if self._stopped is not None:
+            self._stopped.set()
+
+    async def run(self, on_start=None):
+        """Запускает движок и работает до вызова stop()."""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._stopped = asyncio.Event()
+        self._fd = self.ser.fileno()
+        self._loop.add_reader(self._fd, self._on_readable)
+        self._writer = asyncio.create_task(self._write_loop())
+        try:
+            if on_start is not None:
+                on_start()
+            self._tick()
+            await self._stopped.wait()
+            await self._queue.join()
+        finally:
+            self._loop.remove_reader(self._fd)
+            if self._timer is not None:
+                self._timer.cancel()
+            for handle in self._periodic:
+                handle[0].cancel()
+            self._writer.cancel()
+
+    def data_received(self, data: bytes):
+        """Разбирает принятые байты и передает фреймы клиенту."""
+        for frame in self.decoder.feed(data):
+            self.on_frame(frame)
+        self._tick()
+
+    def _on_readable(self):
+        """Забирает из порта все накопившиеся байты.
+
+        Порт, готовый к чтению без данных (обрыв или EOF у pty), не отдаст ни
+        байта и дальше: движок перестает его слушать и останавливается, иначе
+        цикл крутился бы вхолостую.
+        """
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except (OSError, TypeError, ValueError):
+            data = b''  # Порт закрыт
+        if not data:
+            self._loop.remove_reader(self._fd)
+            self.stop()
+            return
+        self.data_received(data)
+
+    def _tick(self):
+        """Вызывает on_tick и перевзводит таймер на следующий срок."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        deadline = self.on_tick()
+        if deadline is not None:
+            # Небольшой запас: сроки в Connection сравниваются строго
+            self._timer = self._loop.call_later(max(0.0, deadline - time.time()) + 0.001, self._tick)
+
+    async def _write_loop(self):
+        """Отправляет буферы из очереди записи; блокирующая запись идет в отдельном потоке."""
+        while True:
+            data = await self._queue.get()
+            try:
+                await self._loop.run_in_executor(None, self._write, data)
+            except OSError:
+                self.stop()  # Порт закрыт или отключен; остаток очереди только снимается, чтобы run() завершился
+            finally:
+                self._queue.task_done()
+
+    def _write(self, data):
+        if callable(data):
+            data()  # Смена настроек порта (set_baudrate): предыдущие записи уже ушли
+            return
+        self.ser.write(data)
+        self.ser.flush()
+
+# Выбор движка: LINK_IO=threads - потоковый DuplexLink, asyncio - LinkEngine
+IO_MODE_ENV = 'LINK_IO'
+
+def create_engine(ser, on_frame, on_tick):
+    """Создает движок для порта.
+
+    LinkEngine нужен дескриптор порта, с которым работает цикл asyncio;
+    на Windows и для портов без fileno() используется DuplexLink.
+    """
+    mode = os.environ.get(IO_MODE_ENV, '')
+    if mode not in ('', 'threads', 'asyncio'):
+        raise ValueError(f"{IO_MODE_ENV} должен быть threads или asyncio")
+    if mode == 'threads' or (not mode and (sys.platform == 'win32' or not hasattr(ser, 'fileno'))):
+        return DuplexLink(ser, on_frame, on_tick)
+    return LinkEngine(ser, on_frame, on_tick)
@@ -0,0 +1,251 @@
+"""Сменные схемы помехоустойчивого кодирования кадра (FEC).
+
+Тело кадра на линии лежит между разделителями 0xFF. Исходная схема -
+Хэмминг (7,4), по коду в байте: такой код никогда не равен 0xFF и не
+имеет старшего бита, поэтому тело передается как есть. Остальные схемы
+дают произвольные байты, и тело начинается с маркера схемы:
+
+    0x80 | encode_4bit(номер схемы), затем закодированный кадр с байт-стаффингом
+
+Маркер - код Хэмминга с установленным старшим битом, поэтому одиночная
+ошибка в нем исправляется, а со старым форматом он не путается.
+Стаффинг (как в SLIP): 0xFE -> 0xFE 0x00, 0xFF -> 0xFE 0x01.
+
+Схема определяется по самому телу, так что приемник разбирает любую
+известную ему схему, а какой кодировать - решает отправитель (схема
+согласуется опцией OPT_CODEC при установке соединения).
+"""
+from functools import lru_cache
+from hamming import ENCODE_TABLE, DECODE_TABLE, SYNDROME_TABLE, decode_7bit, encode_bytes, decode_bytes
+
+CODEC_NONE = 0             # Без кодирования, только контрольная сумма кадра
+CODEC_HAMMING74 = 1        # Хэмминг (7,4), код в байте (исходный формат)
+CODEC_HAMMING74_PACKED = 2 # Хэмминг (7,4), коды упакованы по 7 бит
+CODEC_HAMMING84 = 3        # Расширенный Хэмминг (8,4): исправляет одну ошибку, обнаруживает две
+CODEC_INTERLEAVED = 4      # Хэмминг (8,4) с чередованием бит блоками по 8 кодов: пакеты ошибок до 8 бит
+
+MARKER_FLAG = 0x80
+
+class Codec:
+    """Схема кодирования: преобразует байты кадра в тело и обратно."""
+
+    codec_id = None
+    name = None
+    expansion = 1.0  # Байт на линии на байт кадра (без стаффинга)
+
+    def encode(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, body: bytes) -> tuple[bytes, int]:
+        """Возвращает (данные, число исправленных кодов); ValueError, если не исправить."""
+        raise NotImplementedError
+
+class NoneCodec(Codec):
+    codec_id = CODEC_NONE
+    name = 'none'
+
+    def encode(self, data: bytes) -> bytes:
+        return bytes(data)
+
+    def decode(self, body: bytes) -> tuple[bytes, int]:
+        return bytes(body), 0
+
+class Hamming74Codec(Codec):
+    codec_id = CODEC_HAMMING74
+    name = 'hamming74'
+    expansion = 2.0
+
+    def encode(self, data: bytes) -> bytes:
+        return encode_bytes(data)
+
+    def decode(self, body: bytes) -> tuple[bytes, int]:
+        data, corrected, _ = decode_bytes(body)
+        return data, corrected
+
+@lru_cache(maxsize=1024)
+def _repeat(pattern: int, width: int, total: int) -> int:
+    """Длинное целое из total бит, в котором pattern повторяется через каждые width бит."""
+    return int.from_bytes(pattern.to_bytes(width // 8, 'big') * (total // width), 'big')
+
+# Упаковка 7-битных кодов: каждые 8 байт (64 бита) сжимаются в 56 бит за три
+# шага (сдвиг, маска старшей части, маска младшей части), и все восьмерки
+# длинного целого обрабатываются одновременно.
+_PACK_STEPS = ((1, 0x3F80, 0x007F, 16),
+               (2, 0x0FFFC000, 0x00003FFF, 32),
+               (4, 0x00FFFFFFF0000000, 0x000000000FFFFFFF, 64))
+
+class Hamming74PackedCodec(Codec):
+    """Хэмминг (7,4) без пустого старшего бита: 8 кодов занимают 7 байт."""
+
+    codec_id = CODEC_HAMMING74_PACKED
+    name = 'hamming74-packed'
+    expansion = 1.75
+
+    def encode(self, data: bytes) -> bytes:
+        codes = encode_bytes(data)
+        lanes = (len(codes) + 7) // 8
+        x = int.from_bytes(codes + bytes(lanes * 8 - len(codes)), 'big')
+        for shift, high, low, width in _PACK_STEPS:
+            x = ((x >> shift) & _repeat(high, width, lanes * 64)) | (x & _repeat(low, width, lanes * 64))
+        packed = x.to_bytes(lanes * 8, 'big')
+        out = bytearray(lanes * 7)
+        for k in range(7):
+            out[k::7] = packed[k + 1::8]  # Старший байт каждой восьмерки пуст
+        return bytes(out[:(7 * len(data) + 3) // 4])
+
+    def decode(self, body: bytes) -> tuple[bytes, int]:
+        n = 4 * len(body) // 7  # Байт исходных данных: хвост меньше байта - заполнение
+        lanes = (len(body) + 6) // 7
+        body = bytes(body) + bytes(lanes * 7 - len(body))
+        packed = bytearray(lanes * 8)
+        for k in range(7):
+            packed[k + 1::8] = body[k::7]
+        x = int.from_bytes(packed, 'big')
+        for shift, high, low, width in reversed(_PACK_STEPS):
+            x = ((x & _repeat(high, width, lanes * 64)) << shift) | (x & _repeat(low, width, lanes * 64))
+        codes = x.to_bytes(lanes * 8, 'big')[:2 * n]
+        data, corrected, _ = decode_bytes(codes)
+        return data, corrected
+
+def _parity(value: int) -> int:
+    return bin(value).count('1') & 1
+
+# Расширенный код (8,4): код (7,4) плюс бит общей четности в старшем разряде.
+# Коды складываются по модулю 2 с константой, чтобы ни один не был равен
+# 0xFE/0xFF и не требовал стаффинга; расстояние между кодами от этого не меняется.
+_H84_WHITEN = 0x02
+_H84_ENCODE = bytes((code | (_parity(code) << 7)) ^ _H84_WHITEN for code in ENCODE_TABLE)
+_H84_ENC_HI = bytes(_H84_ENCODE[b >> 4] for b in range(256))
+_H84_ENC_LO = bytes(_H84_ENCODE[b & 0x0F] for b in range(256))
+_H84_DEC_HI = bytes(DECODE_TABLE[(c ^ _H84_WHITEN) & 0x7F] << 4 for c in range(256))
+_H84_DEC_LO = bytes(DECODE_TABLE[(c ^ _H84_WHITEN) & 0x7F] for c in range(256))
+# Ненулевой синдром при четной общей четности - две ошибки, исправить нельзя
+_H84_FIXED = bytes(_parity(c ^ _H84_WHITEN) for c in range(256))
+_H84_BAD = bytes(1 if SYNDROME_TABLE[(c ^ _H84_WHITEN) & 0x7F] and not _parity(c ^ _H84_WHITEN) else 0
+                 for c in range(256))
+
+class Hamming84Codec(Codec):
+    codec_id = CODEC_HAMMING84
+    name = 'hamming84'
+    expansion = 2.0
+
+    def encode(self, data: bytes) -> bytes:
+        data = bytes(data)
+        out = bytearray(2 * len(data))
+        out[0::2] = data.translate(_H84_ENC_HI)
+        out[1::2] = data.translate(_H84_ENC_LO)
+        return bytes(out)
+
+    def decode(self, body: bytes) -> tuple[bytes, int]:
+        codes = bytes(body)
+        if len(codes) % 2:
+            raise ValueError("Нечетное количество кодов Хэмминга")
+        if codes.translate(_H84_BAD).count(1):
+            raise ValueError("Неисправимая ошибка в коде Хэмминга (8,4)")
+        n = len(codes) // 2
+        hi = int.from_bytes(codes[0::2].translate(_H84_DEC_HI), 'little')
+        lo = int.from_bytes(codes[1::2].translate(_H84_DEC_LO), 'little')
+        return (hi | lo).to_bytes(n, 'little'), codes.translate(_H84_FIXED).count(1)
+
+def transpose_blocks(data: bytes) -> bytes:
+    """Транспонирует битовую матрицу 8x8 в каждом 8-байтном блоке (операция обратна сама себе)."""
+    bits = len(data) * 8
+    x = int.from_bytes(data, 'big')
+    for shift, pattern in ((7, 0x00AA00AA00AA00AA), (14, 0x0000CCCC0000CCCC), (28, 0x00000000F0F0F0F0)):
+        mask = _repeat(pattern, 64, bits)
+        t = (x ^ (x >> shift)) & mask
+        x = x ^ t ^ (t << shift)
+    return x.to_bytes(len(data), 'big')
+
+class InterleavedCodec(Codec):
+    """Хэмминг (8,4) с чередованием: бит i байта j на линии - бит j i-го кода блока.
+
+    Соседние биты на линии принадлежат разным кодам, поэтому пакет ошибок
+    длиной до 8 бит дает не больше одной ошибки на код и исправляется.
+    Первый байт - число байт заполнения до целого блока.
+    """
+
+    codec_id = CODEC_INTERLEAVED
+    name = 'interleaved'
+    expansion = 2.0
+
+    def __init__(self):
+        self._inner = Hamming84Codec()
+
+    def encode(self, data: bytes) -> bytes:
+        pad = -(len(data) + 1) % 4  # 4 байта - 8 кодов - один блок
+        return transpose_blocks(self._inner.encode(bytes([pad]) + bytes(data) + bytes(pad)))
+
+    def decode(self, body: bytes) -> tuple[bytes, int]:
+        if len(body) % 8:
+            raise ValueError("Длина не кратна блоку чередования")
+        data, corrected = self._inner.decode(transpose_blocks(bytes(body)))
+        pad = data[0] if data else 4
+        if pad > 3 or pad >= len(data):
+            raise ValueError("Неверное заполнение блока чередования")
+        return data[1:len(data) - pad], corrected
+
+CODECS = {}
+
+def register_codec(codec: Codec):
+    """Добавляет схему в реестр. Номер должен помещаться в маркер (0-14)."""
+    if not 0 <= codec.codec_id < 15:
+        raise ValueError(f"Номер схемы кодирования вне диапазона 0-14: {codec.codec_id}")
+    CODECS[codec.codec_id] = codec
+
+for _codec in (NoneCodec(), Hamming74Codec(), Hamming74PackedCodec(), Hamming84Codec(), InterleavedCodec()):
+    register_codec(_codec)
+
+CODEC_NAMES = {codec_id: codec.name for codec_id, codec in CODECS.items()}
+
+def stuff(data: bytes) -> bytes:
+    """Экранирует байты 0xFE и 0xFF."""
+    return data.replace(b'\xfe', b'\xfe\x00').replace(b'\xff', b'\xfe\x01')
+
+def unstuff(data: bytes) -> bytes:
+    """Снимает экранирование (каждый 0xFE в теле начинает пару)."""
+    return data.replace(b'\xfe\x01', b'\xff').replace(b'\xfe\x00', b'\xfe')
+
+def encode_body(codec_id: int, data: bytes) -> bytes:
+    """Кодирует байты кадра в тело между разделителями."""
+    if codec_id == CODEC_HAMMING74:
+        return encode_bytes(data)
+    codec = CODECS[codec_id]
+    return bytes([MARKER_FLAG | ENCODE_TABLE[codec_id]]) + stuff(codec.encode(data))
+
+def decode_body(body) -> tuple[int, bytes, int]:
+    """Декодирует тело кадра; возвращает (схема, данные, число исправленных кодов)."""
+    body = bytes(body)
+    if not body:
+        raise ValueError("Пустое тело кадра")
+    if not body[0] & MARKER_FLAG:
+        data, corrected, _ = decode_bytes(body)
+        return CODEC_HAMMING74, data, corrected
+    codec_id = decode_7bit(body[0] & 0x7F)
+    codec = CODECS.get(codec_id)
+    if codec is None:
+        raise ValueError(f"Неизвестная схема кодирования: {codec_id}")
+    data, corrected = codec.decode(unstuff(body[1:]))
+    return codec_id, data, corrected
+
+# Схемы от самой слабой защиты к самой сильной
+CODEC_STRENGTH = (CODEC_NONE, CODEC_HAMMING74_PACKED, CODEC_HAMMING74, CODEC_HAMMING84, CODEC_INTERLEAVED)
+
+# Порядок предпочтения в зависимости от оценки частоты битовых ошибок
+# (верхняя граница BER, схемы); при отсутствии оценки - исходная схема.
+CODEC_PREFERENCES = (
+    (1e-6, (CODEC_NONE, CODEC_HAMMING74_PACKED, CODEC_HAMMING74, CODEC_HAMMING84, CODEC_INTERLEAVED)),
+    (1e-4, (CODEC_HAMMING74_PACKED, CODEC_HAMMING74, CODEC_HAMMING84, CODEC_INTERLEAVED, CODEC_NONE)),
+    (1e-3, (CODEC_HAMMING84, CODEC_INTERLEAVED, CODEC_HAMMING74, CODEC_HAMMING74_PACKED, CODEC_NONE)),
+)
+_NOISY = (CODEC_INTERLEAVED, CODEC_HAMMING84, CODEC_HAMMING74, CODEC_HAMMING74_PACKED, CODEC_NONE)
+_UNKNOWN = (CODEC_HAMMING74, CODEC_HAMMING84, CODEC_INTERLEAVED, CODEC_HAMMING74_PACKED, CODEC_NONE)
+
+def preferred_codecs(bit_error_rate: float | None) -> tuple[int, ...]:
+    """Схемы в порядке предпочтения для линии с данной частотой ошибок (None - неизвестна)."""
+    if bit_error_rate is None:
+        return _UNKNOWN
+    for limit, order in CODEC_PREFERENCES:
+        if bit_error_rate < limit:
+            return order
+    return _NOISY
@@ -0,0 +1,513 @@
+"""Передача файлов поверх MessageChannel с докачкой после разрыва.
+
+Служебные сообщения передачи начинаются с нулевого байта (текст с него не
+начинается) и байта вида. Отправитель предлагает файл (OFFER: идентификатор -
+начало SHA-256 содержимого, размер, размер куска, полный SHA-256 и имя),
+получатель отвечает смещением, с которого продолжать (ACCEPT), или отказом
+(REJECT). Дальше идут куски с CRC-32 (CHUNK), получатель подтверждает каждое
+записанное смещение (PROGRESS) или просит повторить с нужного места (NACK),
+а после проверки SHA-256 всего файла сообщает итог (DONE).
+
+Обе стороны держат журнал смещений (JSON в каталоге journal_dir) и после
+разрыва соединения продолжают с подтвержденного места: получатель дописывает
+файл <имя>.<идентификатор>.part, отправитель заново предлагает незавершенные
+передачи тому же узлу. Файл читается кусками через readinto и целиком в память
+не попадает; SHA-256 отправляемого файла тоже считается кусками между тактами.
+"""
+import hashlib
+import json
+import os
+import struct
+import time
+import zlib
+
+SERVICE = 0x00  # Первый байт служебного сообщения передачи
+
+KIND_OFFER = ord('O')
+KIND_ACCEPT = ord('A')
+KIND_REJECT = ord('R')
+KIND_CHUNK = ord('C')
+KIND_PROGRESS = ord('K')
+KIND_NACK = ord('N')
+KIND_DONE = ord('D')
+
+CHUNK_SIZE = 1024        # Данных в одном куске
+WINDOW_CHUNKS = 8        # Кусков, отправленных без подтверждения
+REPORT_INTERVAL = 2.0    # Секунд между строками прогресса
+JOURNAL_BYTES = 64 * 1024  # Журнал пишется не чаще, чем через столько подтвержденных байт
+JOURNAL_INTERVAL = 1.0     # или секунд
+HASH_STEP = 1024 * 1024    # Байт SHA-256 за один такт отправителя
+JOURNAL_DIR = 'transfers'
+RECEIVE_DIR = 'received'
+
+_HEAD = struct.Struct('>BB8s')              # Служебный байт, вид, идентификатор
+_OFFER = struct.Struct('>BB8sQI32s')        # + размер, размер куска, SHA-256; дальше имя
+_POSITION = struct.Struct('>BB8sQ')         # ACCEPT, PROGRESS, NACK: смещение
+_CHUNK = struct.Struct('>BB8sQI')           # + смещение, CRC-32; дальше данные
+_DONE = struct.Struct('>BB8sB')             # + признак успешной проверки
+
+def is_transfer_message(data) -> bool:
+    """Служебное ли это сообщение передачи файла."""
+    return len(data) >= _HEAD.size and data[0] == SERVICE
+
+def file_digest(path: str, buffer_size: int = 64 * 1024) -> bytes:
+    """SHA-256 файла, прочитанного кусками через readinto."""
+    digest = hashlib.sha256()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with open(path, 'rb') as f:
+        while n := f.readinto(buffer):
+            digest.update(view[:n])
+    return digest.digest()
+
+def format_size(size: float) -> str:
+    """Размер в байтах, КиБ или МиБ."""
+    if size < 1024:
+        return f"{size:.0f} Б"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} КиБ"
+    return f"{size / (1024 * 1024):.1f} МиБ"
+
+class Transfer:
+    """Состояние одной передачи и ее запись в журнале."""
+
+    def __init__(self, record: dict, journal_path: str):
+        self.record = record  # Поля журнала: role, id, name, size, sha256, chunk, offset, ...
+        self.journal_path = journal_path
+        self.id = bytes.fromhex(record['id'])
+        self.file = None
+        self.started = time.time()
+        self.start_offset = record['offset']
+        self.last_report = 0.0
+        self.next_offset = record['offset']  # Отправитель: следующий кусок
+        self.sending = False                 # Отправитель: получатель принял предложение
+        self.rewinding = False               # Получатель: ждем повтора после NACK
+        self.saved_offset = record['offset']  # Смещение в журнале на диске
+        self.saved_at = time.time()
+
+    @property
+    def name(self) -> str:
+        return self.record['name']
+
+    @property
+    def size(self) -> int:
+        return self.record['size']
+
+    @property
+    def offset(self) -> int:
+        """Подтвержденное смещение: до него данные у получателя на диске."""
+        return self.record['offset']
+
+    def save(self, offset: int | None = None):
+        """Записывает журнал атомарно (через временный файл)."""
+        if offset is not None:
+            self.record['offset'] = offset
+        if self.file is not None and self.file.writable():
+            self.file.flush()  # Журнал не должен обгонять данные
+        temp = self.journal_path + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(self.record, f, indent=4)
+        os.replace(temp, self.journal_path)
+        self.saved_offset = self.record['offset']
+        self.saved_at = time.time()
+
+    def advance(self, offset: int):
+        """Сдвигает подтвержденное смещение; журнал - раз в JOURNAL_BYTES или JOURNAL_INTERVAL.
+
+        Отставший журнал безопасен: после разрыва передача продолжится с
+        более раннего места, и получатель отрежет данные за ним.
+        """
+        self.record['offset'] = offset
+        if (offset - self.saved_offset >= JOURNAL_BYTES or offset >= self.size
+                or time.time() - self.saved_at >= JOURNAL_INTERVAL):
+            self.save()
+
+    def remove(self):
+        """Закрывает файл и удаляет журнал."""
+        self.close()
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def restart(self, offset: int):
+        """Начинает замер скорости заново (после установки или возобновления)."""
+        self.started = time.time()
+        self.start_offset = offset
+        self.last_report = 0.0
+
+    def progress(self) -> str:
+        """Строка прогресса: процент, объем, скорость и оставшееся время."""
+        done = self.offset
+        percent = 100.0 * done / self.size if self.size else 100.0
+        elapsed = time.time() - self.started
+        rate = (done - self.start_offset) / elapsed if elapsed > 0 else 0.0
+        line = f"{self.name}: {percent:.1f}% ({format_size(done)} из {format_size(self.size)}), {format_size(rate)}/с"
+        if rate > 0 and done < self.size:
+            line += f", осталось ~{(self.size - done) / rate:.0f} с"
+        return line
+
+class PendingFile:
+    """Файл, для которого еще считается SHA-256: по HASH_STEP байт за такт, чтобы не останавливать канал."""
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.name = os.path.basename(path)
+        self.size = os.path.getsize(path)
+        self.mtime = os.path.getmtime(path)
+        self.file = open(path, 'rb')
+        self.digest = hashlib.sha256()
+        self.buffer = bytearray(min(HASH_STEP, max(1, self.size)))
+
+    def step(self) -> bool:
+        """Читает следующую часть файла; True - файл прочитан целиком."""
+        n = self.file.readinto(self.buffer)
+        if n:
+            self.digest.update(memoryview(self.buffer)[:n])
+            return False
+        self.close()
+        return True
+
+    def close(self):
+        self.file.close()
+
+class FileTransfers:
+    """Передачи файлов одного соединения: отправка, прием и журналы докачки.
+
+    Все методы вызываются из потока, обслуживающего соединение. handle_message
+    разбирает служебные сообщения, pump() считает SHA-256 новых файлов и
+    досылает куски, пока у получателя не больше window_chunks
+    неподтвержденных, и вызывается на каждом такте; next_timeout() просит
+    такт, пока SHA-256 не досчитан. notify(текст, статус) выводит события и
+    прогресс.
+    """
+
+    def __init__(self, channel, notify, receive_dir: str | None = None, journal_dir: str = JOURNAL_DIR,
+                 chunk_size: int = CHUNK_SIZE, window_chunks: int = WINDOW_CHUNKS,
+                 report_interval: float = REPORT_INTERVAL):
+        self.channel = channel
+        self.notify = notify
+        self.receive_dir = receive_dir  # None - входящие файлы отклоняются
+        self.journal_dir = journal_dir
+        self.chunk_size = chunk_size
+        self.window_chunks = window_chunks
+        self.report_interval = report_interval
+        self.outgoing = {}  # Идентификатор -> Transfer
+        self.incoming = {}
+        self.hashing = []   # PendingFile, ждущие SHA-256 перед предложением
+        self._buffer = bytearray(chunk_size)
+
+    @property
+    def peer(self) -> int:
+        return self.channel.connection.remote_addr
+
+    def _journal_path(self, role: str, transfer_id: bytes) -> str:
+        return os.path.join(self.journal_dir, f"{role}-{transfer_id.hex()}.json")
+
+    def _load(self, role: str, transfer_id: bytes) -> Transfer | None:
+        path = self._journal_path(role, transfer_id)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return Transfer(json.load(f), path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _send(self, *parts):
+        self.channel.send(b''.join(parts))
+
+    def send_file(self, path: str) -> PendingFile:
+        """Ставит файл в очередь: после подсчета SHA-256 в pump() он будет предложен узлу.
+
+        Незавершенная передача того же содержимого продолжится.
+        """
+        if any(pending.path == os.path.abspath(path) for pending in self.hashing):
+            raise ValueError(f"Файл {os.path.basename(path)} уже передается")
+        pending = PendingFile(path)
+        self.hashing.append(pending)
+        return pending
+
+    def _start_send(self, pending: PendingFile):
+        digest = pending.digest.digest()
+        transfer_id = digest[:8]
+        if transfer_id in self.outgoing:
+            self.notify(f"Файл {pending.name} уже передается", "error")
+            return
+        transfer = self._load('send', transfer_id)
+        if transfer is None:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            transfer = Transfer({'role': 'send', 'id': transfer_id.hex(), 'name': pending.name,
+                                 'path': pending.path, 'size': pending.size, 'sha256': digest.hex(),
+                                 'mtime': pending.mtime, 'chunk': self.chunk_size, 'offset': 0},
+                                self._journal_path('send', transfer_id))
+        transfer.record.update(peer=self.peer, path=pending.path, mtime=pending.mtime)
+        transfer.save()
+        self._offer(transfer)
+
+    def next_timeout(self) -> float | None:
+        """Сейчас, если SHA-256 какого-то файла еще считается, иначе None."""
+        return time.time() if self.hashing else None
+
+    def resume(self) -> list[Transfer]:
+        """Заново предлагает узлу незавершенные передачи из журнала (после переподключения)."""
+        resumed = []
+        if not os.path.isdir(self.journal_dir):
+            return resumed
+        for entry in sorted(os.listdir(self.journal_dir)):
+            if not entry.startswith('send-') or not entry.endswith('.json'):
+                continue
+            transfer = self._load('send', bytes.fromhex(entry[5:-5]))
+            if transfer is None or transfer.record.get('peer') != self.peer or transfer.id in self.outgoing:
+                continue
+            record = transfer.record
+            try:
+                changed = (os.path.getsize(record['path']) != record['size']
+                           or os.path.getmtime(record['path']) != record['mtime'])
+            except OSError:
+                changed = True
+            if changed:
+                self.notify(f"Файл {record['path']} изменился или удален, передача отменена", "warning")
+                transfer.remove()
+                continue
+            self._offer(transfer)
+            resumed.append(transfer)
+        return resumed
+
+    def _offer(self, transfer: Transfer):
+        self.outgoing[transfer.id] = transfer
+        record = transfer.record
+        self._send(_OFFER.pack(SERVICE, KIND_OFFER, transfer.id, record['size'], record['chunk'],
+                               bytes.fromhex(record['sha256'])), record['name'].encode('utf-8'))
+
+    def pump(self):
+        """Считает очередную часть SHA-256 и досылает куски, пока окно передачи не заполнено."""
+        if self.hashing:
+            pending = self.hashing[0]
+            try:
+                done = pending.step()
+            except OSError as e:
+                pending.close()
+                self.hashing.pop(0)
+                self.notify(f"Ошибка чтения файла {pending.name}: {e}", "error")
+            else:
+                if done:
+                    self.hashing.pop(0)
+                    try:
+                        self._start_send(pending)
+                    except OSError as e:
+                        self.notify(f"Ошибка: {e}", "error")
+        for transfer in self.outgoing.values():
+            if not transfer.sending:
+                continue
+            chunk = transfer.record['chunk']
+            limit = min(transfer.size, transfer.offset + self.window_chunks * chunk)
+            view = memoryview(self._buffer)
+            while transfer.next_offset < limit:
+                offset = transfer.next_offset
+                transfer.file.seek(offset)
+                n = transfer.file.readinto(view[:min(chunk, limit - offset)])
+                if not n:
+                    self.notify(f"Файл {transfer.name} укоротился во время передачи", "error")
+                    transfer.sending = False
+                    break
+                data = view[:n]
+                self._send(_CHUNK.pack(SERVICE, KIND_CHUNK, transfer.id, offset, zlib.crc32(data)), data)
+                transfer.next_offset = offset + n
+
+    def _on_accept(self, transfer: Transfer, offset: int):
+        if offset > transfer.size:
+            offset = 0
+        if offset:
+            self.notify(f"Передача {transfer.name} продолжается с {format_size(offset)}", "info")
+        else:
+            self.notify(f"Узел принимает файл {transfer.name} ({format_size(transfer.size)})", "info")
+        transfer.save(offset)
+        transfer.restart(offset)
+        transfer.close()
+        transfer.file = open(transfer.record['path'], 'rb')
+        transfer.next_offset = offset
+        transfer.sending = True
+
+    def _on_progress(self, transfer: Transfer, offset: int):
+        if transfer.offset < offset <= transfer.size:
+            transfer.advance(offset)
+            self._report(transfer)
+
+    def _on_nack(self, transfer: Transfer, offset: int):
+        if offset <= transfer.size and offset < transfer.next_offset:
+            transfer.next_offset = offset
+            if offset < transfer.offset:
+                transfer.save(offset)
+
+    def _on_done(self, transfer: Transfer, ok: bool):
+        del self.outgoing[transfer.id]
+        transfer.remove()
+        if ok:
+            elapsed = time.time() - transfer.started
+            self.notify(f"Файл {transfer.name} передан и проверен ({format_size(transfer.size)} за {elapsed:.1f} с)",
+                        "success")
+        else:
+            self.notify(f"Файл {transfer.name} не прошел проверку у получателя", "error")
+
+    def _on_offer(self, data: memoryview):
+        _, _, transfer_id, size, chunk, digest = _OFFER.unpack_from(data)
+        name = os.path.basename(str(data[_OFFER.size:], 'utf-8', errors='replace').replace('\\', '/'))
+        if self.receive_dir is None:
+            self._reject(transfer_id, "прием файлов выключен")
+            return
+        if not name or name in ('.', '..') or not 0 < chunk <= 16 * 1024 * 1024:
+            self._reject(transfer_id, "некорректное предложение")
+            return
+
+        previous = self.incoming.pop(transfer_id, None)
+        if previous is not None:
+            previous.close()
+        transfer = self._load('recv', transfer_id)
+        if transfer is None or transfer.record['size'] != size or transfer.record['sha256'] != digest.hex():
+            os.makedirs(self.journal_dir, exist_ok=True)
+            os.makedirs(self.receive_dir, exist_ok=True)
+            transfer = Transfer({'role': 'recv', 'id': transfer_id.hex(), 'name': name, 'size': size,
+                                 'sha256': digest.hex(), 'chunk': chunk, 'offset': 0,
+                                 'part': os.path.abspath(os.path.join(self.receive_dir,
+                                                                      f"{name}.{transfer_id.hex()}.part"))},
+                                self._journal_path('recv', transfer_id))
+        part = transfer.record['part']
+        try:
+            transfer.file = open(part, 'r+b' if os.path.exists(part) else 'w+b')
+            # Данные за подтвержденным смещением могли не попасть в журнал - отрезаем
+            transfer.file.seek(0, os.SEEK_END)
+            offset = min(transfer.offset, transfer.file.tell())
+            transfer.file.truncate(offset)
+            transfer.save(offset)
+        except OSError as e:
+            transfer.close()
+            self._reject(transfer_id, f"не удалось открыть файл: {e.strerror}")
+            return
+
+        transfer.restart(offset)
+        self.incoming[transfer_id] = transfer
+        if offset:
+            self.notify(f"Прием {name} продолжается с {format_size(offset)} из {format_size(size)}", "info")
+        else:
+            self.notify(f"Прием файла {name} ({format_size(size)})", "info")
+        self._send(_POSITION.pack(SERVICE, KIND_ACCEPT, transfer_id, offset))
+        if offset >= size:
+            self._finish(transfer)
+
+    def _reject(self, transfer_id: bytes, reason: str):
+        self._send(_HEAD.pack(SERVICE, KIND_REJECT, transfer_id), reason.encode('utf-8'))
+
+    def _on_chunk(self, transfer: Transfer, data: memoryview):
+        _, _, _, offset, crc = _CHUNK.unpack_from(data)
+        body = data[_CHUNK.size:]
+        if offset != transfer.offset:
+            # Кусок из окна, отправленного до NACK, или повтор после возобновления
+            if offset > transfer.offset and not transfer.rewinding:
+                transfer.rewinding = True
+                self._send(_POSITION.pack(SERVICE, KIND_NACK, transfer.id, transfer.offset))
+            return
+        if zlib.crc32(body) != crc or offset + len(body) > transfer.size or not body:
+            transfer.rewinding = True
+            self._send(_POSITION.pack(SERVICE, KIND_NACK, transfer.id, transfer.offset))
+            return
+        transfer.rewinding = False
+        transfer.file.seek(offset)
+        transfer.file.write(body)
+        transfer.advance(offset + len(body))
+        self._send(_POSITION.pack(SERVICE, KIND_PROGRESS, transfer.id, transfer.offset))
+        self._report(transfer)
+        if transfer.offset >= transfer.size:
+            self._finish(transfer)
+
+    def _finish(self, transfer: Transfer):
+        """Проверяет SHA-256 принятого файла и переименовывает его."""
+        del self.incoming[transfer.id]
+        transfer.close()
+        part = transfer.record['part']
+        ok = file_digest(part).hex() == transfer.record['sha256']
+        if ok:
+            target = os.path.join(os.path.dirname(part), transfer.record['name'])
+            base, ext = os.path.splitext(target)
+            copy = 1
+            while os.path.exists(target):
+                target = f"{base}.{copy}{ext}"
+                copy += 1
+            os.replace(part, target)
+            elapsed = time.time() - transfer.started
+            self.notify(f"Файл принят: {target} ({format_size(transfer.size)} за {elapsed:.1f} с)", "success")
+        else:
+            os.remove(part)
+            self.notify(f"Файл {transfer.name} не совпал по SHA-256 и удален", "error")
+        transfer.remove()
+        self._send(_DONE.pack(SERVICE, KIND_DONE, transfer.id, int(ok)))
+
+    def handle_message(self, data) -> bool:
+        """Обрабатывает служебное сообщение передачи; False - это обычное сообщение."""
+        if not is_transfer_message(data):
+            return False
+        data = memoryview(data)
+        try:
+            _, kind, transfer_id = _HEAD.unpack_from(data)
+            if kind == KIND_OFFER:
+                self._on_offer(data)
+            elif kind == KIND_CHUNK:
+                transfer = self.incoming.get(transfer_id)
+                if transfer is not None:
+                    self._on_chunk(transfer, data)
+            elif kind in (KIND_ACCEPT, KIND_PROGRESS, KIND_NACK):
+                transfer = self.outgoing.get(transfer_id)
+                if transfer is not None:
+                    _, _, _, offset = _POSITION.unpack_from(data)
+                    if kind == KIND_ACCEPT:
+                        self._on_accept(transfer, offset)
+                    elif kind == KIND_PROGRESS:
+                        self._on_progress(transfer, offset)
+                    else:
+                        self._on_nack(transfer, offset)
+            elif kind == KIND_REJECT:
+                transfer = self.outgoing.pop(transfer_id, None)
+                if transfer is not None:
+                    transfer.remove()
+                    reason = str(data[_HEAD.size:], 'utf-8', errors='replace')
+                    self.notify(f"Узел отклонил файл {transfer.name}: {reason}", "error")
+            elif kind == KIND_DONE:
+                transfer = self.outgoing.get(transfer_id)
+                if transfer is not None:
+                    self._on_done(transfer, bool(_DONE.unpack_from(data)[3]))
+        except struct.error:
+            pass  # Обрезанное служебное сообщение
+        except OSError as e:
+            self.notify(f"Ошибка файла при передаче: {e}", "error")
+        return True
+
+    def _report(self, transfer: Transfer):
+        now = time.time()
+        if now - transfer.last_report >= self.report_interval:
+            transfer.last_report = now
+            self.notify(transfer.progress(), "info")
+
+    def status(self) -> list[str]:
+        """Строки прогресса всех текущих передач."""
+        lines = [f"→ {p.name}: подсчет SHA-256 ({format_size(p.size)})" for p in self.hashing]
+        lines += [f"→ {t.progress()}" for t in self.outgoing.values()]
+        lines += [f"← {t.progress()}" for t in self.incoming.values()]
+        return lines
+
+    def close(self):
+        """Закрывает файлы (соединение потеряно); журналы остаются для докачки."""
+        for transfer in (*self.outgoing.values(), *self.incoming.values()):
+            if transfer.offset != transfer.saved_offset:
+                try:
+                    transfer.save()
+                except OSError:
+                    pass  # Докачка начнется с последнего записанного смещения
+            transfer.close()
+        for pending in self.hashing:
+            pending.close()
+        self.outgoing.clear()
+        self.incoming.clear()
+        self.hashing.clear()
@@ -1,3 +1,7 @@
+import struct
+from checksum import CRC_NONE, CRC16, CRC32, CRC_SIZES, compute
+from fec import CODEC_HAMMING74
+
 class Frame:
     START_BYTE = 0xFF
     STOP_BYTE = 0xFF
@@ -9,6 +13,13 @@ class Frame:
     TYPE_UPLINK = 0x03 # Разрыв соединения
     TYPE_ACK = 0x04    # Подтверждение
     TYPE_RET = 0x05    # Запрос повтора
+    TYPE_PARAM = 0x06  # Рекомендация параметров канала
+    TYPE_BATCH = 0x07  # Пакет данных: несколько порций и попутное подтверждение
+
+    # Старшие биты байта типа - флаги наличия контрольной суммы
+    TYPE_MASK = 0x3F
+    FLAG_CRC16 = 0x40
+    FLAG_CRC32 = 0x80
 
     # Описания типов фреймов
     FRAME_TYPES = {
@@ -16,44 +27,96 @@ class Frame:
         TYPE_LINK: "Установка соединения",
         TYPE_UPLINK: "Разрыв соединения",
         TYPE_ACK: "Подтверждение",
-        TYPE_RET: "Запрос повтора"
+        TYPE_RET: "Запрос повтора",
+        TYPE_PARAM: "Параметры канала",
+        TYPE_BATCH: "Пакет данных"
     }
 
-    def __init__(self, receiver: int, sender: int, frame_type: int, data: bytes = b''):
+    __slots__ = ('receiver', 'sender', 'frame_type', 'data', 'crc', 'crc_ok', 'codec', 'corrected')
+
+    # Заголовок: старт-байт, получатель, отправитель, тип с флагами, длина данных
+    _HEADER = struct.Struct('5B')
+
+    def __init__(self, receiver: int, sender: int, frame_type: int, data: bytes = b'', crc: int = CRC_NONE,
+                 codec: int = CODEC_HAMMING74):
         self.receiver = receiver
         self.sender = sender
         self.frame_type = frame_type
-        self.data = data
+        self.data = data      # bytes или memoryview в буфер приема
+        self.crc = crc        # Режим контрольной суммы кадра
+        self.crc_ok = True    # False, если контрольная сумма принятого кадра не сошлась
+        self.codec = codec    # Схема кодирования на линии (fec.py); не входит в байты кадра
+        self.corrected = 0    # Сколько кодов исправлено при приеме
 
-    def to_bytes(self) -> bytes:
+    def size(self) -> int:
+        """Размер фрейма в байтах."""
+        return 6 + len(self.data) + CRC_SIZES[self.crc]
+
+    def pack_into(self, buffer, offset: int = 0) -> int:
+        """Записывает фрейм в буфер вызывающего (bytearray/memoryview), возвращает число байт."""
         length = len(self.data)
-        result = bytes([
-            self.START_BYTE,
-            self.receiver,
-            self.sender,
-            self.frame_type,
-            length
-        ]) + self.data + bytes([self.STOP_BYTE])
-        return result
+        self._HEADER.pack_into(buffer, offset, self.START_BYTE, self.receiver, self.sender,
+                               self.frame_type | _CRC_FLAGS[self.crc], length)
+        end = offset + 5 + length
+        buffer[offset + 5:end] = self.data
+        if self.crc != CRC_NONE:
+            # Контрольная сумма покрывает заголовок и данные
+            checksum = compute(self.crc, memoryview(buffer)[offset:end])
+            buffer[end:end + len(checksum)] = checksum
+            end += len(checksum)
+        buffer[end] = self.STOP_BYTE
+        return end + 1 - offset
+
+    def to_bytes(self) -> bytes:
+        head = self._HEADER.pack(self.START_BYTE, self.receiver, self.sender,
+                                 self.frame_type | _CRC_FLAGS[self.crc], len(self.data))
+        result = head + self.data
+        # Контрольная сумма покрывает заголовок и данные
+        return result + compute(self.crc, result) + _STOP
 
     @staticmethod
-    def from_bytes(raw: bytes) -> 'Frame':
-        if len(raw) < 6:
+    def parse(buffer, offset: int = 0) -> 'Frame':
+        """Разбирает фрейм, начинающийся в buffer[offset], без копирования данных.
+
+        data фрейма - memoryview в buffer, поэтому buffer нельзя изменять, пока
+        фрейм используется. Размер разобранного фрейма - frame.size().
+        """
+        if len(buffer) - offset < 6:
             raise ValueError("Кадр слишком короткий")
-        if raw[0] != Frame.START_BYTE or raw[-1] != Frame.STOP_BYTE:
+        if buffer[offset] != Frame.START_BYTE:
             raise ValueError("Неверные старт/стоп байты")
+        type_byte = buffer[offset + 3]
+        crc = _FLAG_CRCS.get(type_byte & ~Frame.TYPE_MASK)
+        if crc is None:
+            raise ValueError(f"Неизвестные флаги типа кадра: 0x{type_byte:02X}")
 
-        receiver = raw[1]
-        sender = raw[2]
-        frame_type = raw[3]
-        length = raw[4]
+        end = offset + 5 + buffer[offset + 4]
+        crc_end = end + CRC_SIZES[crc]
+        if len(buffer) <= crc_end:
+            raise ValueError(f"Длина кадра: {len(buffer) - offset}, ожидаемая: {crc_end + 1 - offset}")
+        if buffer[crc_end] != Frame.STOP_BYTE:
+            raise ValueError("Неверные старт/стоп байты")
 
-        if len(raw) != 6 + length:
-            raise ValueError(f"Длина кадра: {len(raw)}, ожидаемая: {6 + length}")
+        view = memoryview(buffer)
+        frame = Frame(buffer[offset + 1], buffer[offset + 2], type_byte & Frame.TYPE_MASK,
+                      view[offset + 5:end], crc)
+        if crc != CRC_NONE:
+            frame.crc_ok = compute(crc, view[offset:end]) == buffer[end:crc_end]
+        return frame
 
-        data = raw[5:-1]
-        return Frame(receiver, sender, frame_type, data)
+    @staticmethod
+    def from_bytes(raw: bytes) -> 'Frame':
+        """Разбирает буфер, содержащий ровно один фрейм; данные копируются в bytes."""
+        frame = Frame.parse(raw)
+        if frame.size() != len(raw):
+            raise ValueError(f"Длина кадра: {len(raw)}, ожидаемая: {frame.size()}")
+        frame.data = bytes(frame.data)
+        return frame
 
     def __repr__(self):
         return (f"Frame(to=0x{self.receiver:02X}, from=0x{self.sender:02X}, "
-                f"type=0x{self.frame_type:02X}, data={self.data})")
+                f"type=0x{self.frame_type:02X}, data={bytes(self.data)})")
+
+_CRC_FLAGS = {CRC_NONE: 0, CRC16: Frame.FLAG_CRC16, CRC32: Frame.FLAG_CRC32}
+_FLAG_CRCS = {flag: crc for crc, flag in _CRC_FLAGS.items()}
+_STOP = bytes([Frame.STOP_BYTE])
@@ -1,3 +1,5 @@
+from metrics import METRICS
+
 def encode_4bit(data: int) -> int:
     """Кодирует 4 бита в 7-битный код Хэмминга."""
     d1 = (data >> 0) & 1
@@ -9,8 +11,8 @@ def encode_4bit(data: int) -> int:
     p3 = d2 ^ d3 ^ d4
     return (p1 | (p2 << 1) | (d1 << 2) | (p3 << 3) | (d2 << 4) | (d3 << 5) | (d4 << 6))
 
-def decode_7bit(encoded: int) -> int:
-    """Декодирует 7-битный код Хэмминга в 4 бита."""
+def syndrome_7bit(encoded: int) -> int:
+    """Возвращает позицию ошибочного бита (1-7) или 0, если ошибки нет."""
     p1 = (encoded >> 0) & 1
     p2 = (encoded >> 1) & 1
     d1 = (encoded >> 2) & 1
@@ -22,9 +24,65 @@ def decode_7bit(encoded: int) -> int:
     s1 = p1 ^ d1 ^ d2 ^ d4
     s2 = p2 ^ d1 ^ d3 ^ d4
     s3 = p3 ^ d2 ^ d3 ^ d4
-    error_pos = s1 + (s2 << 1) + (s3 << 2)
+    return s1 + (s2 << 1) + (s3 << 2)
 
+def decode_7bit(encoded: int) -> int:
+    """Декодирует 7-битный код Хэмминга в 4 бита."""
+    error_pos = syndrome_7bit(encoded)
     if error_pos:
         encoded ^= (1 << (error_pos - 1))  # Исправляем ошибку
 
-    return (d1 << 0) | (d2 << 1) | (d3 << 2) | (d4 << 3) 
\ No newline at end of file
+    d1 = (encoded >> 2) & 1
+    d2 = (encoded >> 4) & 1
+    d3 = (encoded >> 5) & 1
+    d4 = (encoded >> 6) & 1
+    return (d1 << 0) | (d2 << 1) | (d3 << 2) | (d4 << 3)
+
+# Предвычисленные таблицы. Старший бит кода не несет информации,
+# поэтому таблицы декодирования строятся для 128 значений.
+ENCODE_TABLE = bytes(encode_4bit(n) for n in range(16))
+DECODE_TABLE = bytes(decode_7bit(c) for c in range(128))
+SYNDROME_TABLE = bytes(syndrome_7bit(c) for c in range(128))
+
+# Таблицы для bytes.translate: байт -> код старшего/младшего полубайта,
+# код (любой из 256, старший бит отбрасывается) -> полубайт на своем месте.
+_ENC_HI = bytes(ENCODE_TABLE[b >> 4] for b in range(256))
+_ENC_LO = bytes(ENCODE_TABLE[b & 0x0F] for b in range(256))
+_DEC_HI = bytes(DECODE_TABLE[c & 0x7F] << 4 for c in range(256))
+_DEC_LO = bytes(DECODE_TABLE[c & 0x7F] for c in range(256))
+_ERR_FLAG = bytes(1 if SYNDROME_TABLE[c & 0x7F] else 0 for c in range(256))
+
+def encode_bytes(data) -> bytes:
+    """Кодирует буфер: каждый байт превращается в два кода (старший полубайт первым)."""
+    data = bytes(data)
+    out = bytearray(2 * len(data))
+    out[0::2] = data.translate(_ENC_HI)
+    out[1::2] = data.translate(_ENC_LO)
+    return bytes(out)
+
+def decode_bytes(buffer) -> tuple[bytes, int, list[int]]:
+    """Декодирует буфер кодов в байты.
+
+    Возвращает (данные, число исправленных кодов, индексы исправленных кодов в буфере).
+    """
+    codes = bytes(buffer)
+    if len(codes) % 2:
+        raise ValueError("Нечетное количество кодов Хэмминга")
+
+    n = len(codes) // 2
+    # Полубайты не пересекаются, поэтому побайтовое ИЛИ можно сделать одним длинным целым
+    hi = int.from_bytes(codes[0::2].translate(_DEC_HI), 'little')
+    lo = int.from_bytes(codes[1::2].translate(_DEC_LO), 'little')
+    data = (hi | lo).to_bytes(n, 'little')
+
+    flags = codes.translate(_ERR_FLAG)
+    corrected = flags.count(1)
+    if METRICS.enabled:
+        METRICS.inc('hamming.codes_decoded', len(codes))
+        METRICS.inc('hamming.corrected', corrected)
+    positions = []
+    pos = flags.find(1)
+    while pos != -1:
+        positions.append(pos)
+        pos = flags.find(1, pos + 1)
+    return data, corrected, positions
@@ -0,0 +1,158 @@
+import struct
+import time
+from compress import compress, decompress
+from connection import Connection, MAX_PAYLOAD
+from metrics import METRICS
+
+# Флаги заголовка фрагмента (первый байт данных после номера последовательности)
+FLAG_FIRST = 0x01  # Первый фрагмент сообщения
+FLAG_LAST = 0x02   # Последний фрагмент сообщения
+FLAG_COMPRESSED = 0x04  # Сообщение сжато (compress.py); ставится на первом фрагменте
+
+# Первый фрагмент многофрагментного сообщения несет полную длину сообщения
+_LENGTH = struct.Struct('>I')
+
+class MessageChannel:
+    """Передача сообщений произвольного размера поверх Connection.
+
+    Сообщение режется на фрагменты, каждый из которых помещается в один I-кадр.
+    Connection доставляет кадры по порядку и без потерь, поэтому для сборки
+    достаточно флагов первого/последнего фрагмента и длины в первом фрагменте.
+    Если узлы согласовали сжатие, сообщение перед разбиением сжимается.
+    """
+
+    def __init__(self, connection: Connection, max_message_size: int = 16 * 1024 * 1024,
+                 reassembly_timeout: float = 60.0, mtu: int = MAX_PAYLOAD):
+        self.connection = connection
+        self.max_message_size = max_message_size
+        self.reassembly_timeout = reassembly_timeout
+        self.mtu = mtu  # Максимальный размер данных одного I-кадра
+        self.dropped = 0  # Сообщения, отброшенные при сборке
+        self._last_fragment = None
+        self.reset()
+
+    def reset(self):
+        """Отбрасывает незавершенное сообщение."""
+        self._buffer = None     # Буфер собираемого сообщения
+        self._view = None
+        self._received = 0      # Сколько байт уже собрано
+        self._skipping = False  # Пропускаем фрагменты отброшенного сообщения
+        self._compressed = False  # Собираемое сообщение сжато
+
+    def send(self, data):
+        """Режет сообщение на фрагменты и ставит их в очередь соединения."""
+        view = memoryview(data).cast('B')
+        if len(view) > self.max_message_size:
+            raise ValueError(f"Сообщение длиннее {self.max_message_size} байт")
+
+        first_flags = FLAG_FIRST
+        if self.connection.agreed_compressions:
+            packed = compress(view, self.connection.agreed_compressions)
+            if packed is not None:
+                if METRICS.enabled:
+                    METRICS.inc('message.compression_saved', len(view) - len(packed))
+                view = memoryview(packed)
+                first_flags |= FLAG_COMPRESSED
+
+        # Соединение может уменьшить размер кадра под качество линии
+        chunk = min(self.mtu, self.connection.mtu) - 1
+        if len(view) <= chunk:
+            self.connection.enqueue(bytes([first_flags | FLAG_LAST]) + view)
+            return
+
+        first = chunk - _LENGTH.size
+        self.connection.enqueue(bytes([first_flags]) + _LENGTH.pack(len(view)) + view[:first])
+        for offset in range(first, len(view), chunk):
+            end = offset + chunk
+            flags = FLAG_LAST if end >= len(view) else 0
+            self.connection.enqueue(bytes([flags]) + view[offset:end])
+
+    def receive(self) -> list[memoryview]:
+        """Собирает принятые фрагменты и возвращает завершенные сообщения."""
+        messages = []
+        for data in self.connection.poll_incoming():
+            message = self._feed(memoryview(data))
+            if message is not None:
+                messages.append(message)
+        return messages
+
+    def _feed(self, fragment: memoryview) -> memoryview | None:
+        """Добавляет фрагмент; возвращает сообщение, если оно собрано."""
+        if not fragment:
+            return None
+        flags, body = fragment[0], fragment[1:]
+        self._last_fragment = time.time()
+
+        if flags & FLAG_FIRST:
+            if self._buffer is not None:
+                self.dropped += 1  # Начало нового сообщения до конца предыдущего
+            self.reset()
+            self._compressed = bool(flags & FLAG_COMPRESSED)
+            if flags & FLAG_LAST:
+                # Сообщение в одном кадре - без копирования
+                return self._decompress(body) if self._compressed else body
+            if len(body) < _LENGTH.size:
+                self.dropped += 1
+                self._skipping = True
+                return None
+            (total,) = _LENGTH.unpack(body[:_LENGTH.size])
+            if total > self.max_message_size:
+                self.dropped += 1
+                self._skipping = True
+                return None
+            self._buffer = bytearray(total)
+            self._view = memoryview(self._buffer)
+            body = body[_LENGTH.size:]
+        elif self._buffer is None:
+            if not self._skipping:
+                self.dropped += 1
+            self._skipping = not flags & FLAG_LAST
+            return None
+
+        end = self._received + len(body)
+        if end > len(self._buffer):
+            self.dropped += 1
+            self.reset()
+            self._skipping = not flags & FLAG_LAST
+            return None
+        self._view[self._received:end] = body
+        self._received = end
+
+        if flags & FLAG_LAST:
+            message = self._view if end == len(self._buffer) else None
+            compressed = self._compressed
+            self.reset()
+            if message is None:
+                self.dropped += 1
+            elif compressed:
+                message = self._decompress(message)
+            return message
+        return None
+
+    def _decompress(self, message: memoryview) -> memoryview | None:
+        """Распаковывает сжатое сообщение; поврежденное отбрасывает."""
+        try:
+            return memoryview(decompress(message, self.max_message_size))
+        except ValueError:
+            self.dropped += 1
+            return None
+
+    def check_timeout(self) -> bool:
+        """Отбрасывает сообщение, фрагменты которого перестали приходить."""
+        if self._buffer is None or self._last_fragment is None:
+            return False
+        if time.time() - self._last_fragment > self.reassembly_timeout:
+            self.dropped += 1
+            self.reset()
+            return True
+        return False
+
+    def next_timeout(self) -> float | None:
+        """Время (time.time()), когда незавершенное сообщение будет отброшено."""
+        if self._buffer is None or self._last_fragment is None:
+            return None
+        return self._last_fragment + self.reassembly_timeout
+
+    def pending_bytes(self) -> int:
+        """Сколько байт незавершенного сообщения уже собрано."""
+        return self._received
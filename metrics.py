@@ -0,0 +1,161 @@
+import json
+import math
+import os
+import time
+
+class Histogram:
+    """Гистограмма с корзинами по степеням двойки: O(1) на наблюдение, память не растет."""
+
+    __slots__ = ('buckets', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.buckets = {}  # показатель степени двойки -> число наблюдений
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        exponent = math.frexp(value)[1]  # value < 2 ** exponent
+        self.buckets[exponent] = self.buckets.get(exponent, 0) + 1
+
+    def percentile(self, q: float) -> float:
+        """Оценка процентиля q (0-100) сверху: граница корзины, но не больше максимума."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for exponent in sorted(self.buckets):
+            seen += self.buckets[exponent]
+            if seen >= rank:
+                return min(math.ldexp(1.0, exponent), self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': self.total / self.count,
+            'min': self.min,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+class Metrics:
+    """Реестр метрик канала: счетчики, гистограммы и уровни очередей.
+
+    Точки сбора проверяют флаг перед вызовом:
+        if METRICS.enabled:
+            METRICS.inc('wire.frames_sent')
+    поэтому выключенный сбор стоит одну проверку атрибута.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        """Обнуляет все метрики."""
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}  # имя -> [текущее значение, максимум]
+
+    def inc(self, name: str, value: int = 1):
+        """Увеличивает счетчик."""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        """Добавляет наблюдение в гистограмму."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name: str, value: int):
+        """Запоминает текущий уровень (например, длину очереди) и его максимум."""
+        entry = self.gauges.get(name)
+        if entry is None:
+            self.gauges[name] = [value, value]
+        else:
+            entry[0] = value
+            if value > entry[1]:
+                entry[1] = value
+
+    def snapshot(self) -> dict:
+        """Текущее состояние всех метрик в виде словаря для JSON."""
+        return {
+            'time': time.time(),
+            'uptime': time.time() - self.started,
+            'counters': dict(sorted(self.counters.items())),
+            'histograms': {name: h.snapshot() for name, h in sorted(self.histograms.items())},
+            'gauges': {name: {'current': v[0], 'max': v[1]} for name, v in sorted(self.gauges.items())},
+        }
+
+    def dump(self, path: str):
+        """Записывает снимок в JSON-файл атомарно (через временный файл)."""
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, path)
+
+    def format(self) -> str:
+        """Снимок в виде текста для команды stats."""
+        lines = [f"Сбор статистики {'включен' if self.enabled else 'выключен'}, "
+                 f"за {time.time() - self.started:.0f} с:"]
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"  {name:<32} {value}")
+        sent, payload = self.counters.get('wire.bytes_sent', 0), self.counters.get('link.payload_sent', 0)
+        if sent:
+            lines.append(f"  {'эффективность отправки':<32} {payload / sent:.1%} полезных данных")
+        for name, value in sorted(self.gauges.items()):
+            lines.append(f"  {name:<32} {value[0]} (максимум {value[1]})")
+        for name, histogram in sorted(self.histograms.items()):
+            if histogram.count:
+                lines.append(f"  {name:<32} n={histogram.count} mean={histogram.total / histogram.count:.4g} "
+                             f"p50<={histogram.percentile(50):.4g} p99<={histogram.percentile(99):.4g} "
+                             f"max={histogram.max:.4g}")
+        return "\n".join(lines)
+
+# Общий реестр процесса
+METRICS = Metrics()
+
+# Периодическая запись снимков в JSON включается переменными окружения
+STATS_FILE_ENV = 'LINK_STATS_FILE'
+STATS_INTERVAL_ENV = 'LINK_STATS_INTERVAL'
+
+def dump_settings() -> tuple[str, float] | None:
+    """Файл и период записи снимков из окружения; если файл задан, включает сбор."""
+    path = os.environ.get(STATS_FILE_ENV)
+    if not path:
+        return None
+    interval = float(os.environ.get(STATS_INTERVAL_ENV, '10'))
+    if interval <= 0:
+        raise ValueError(f"{STATS_INTERVAL_ENV} должен быть положительным")
+    METRICS.enabled = True
+    return path, interval
+
+def stats_command(argument: str) -> str:
+    """Выполняет команду stats [on|off|reset] и возвращает текст для вывода."""
+    if argument == 'on':
+        METRICS.enabled = True
+        return "Сбор статистики включен"
+    if argument == 'off':
+        METRICS.enabled = False
+        return "Сбор статистики выключен"
+    if argument == 'reset':
+        METRICS.reset()
+        return "Статистика сброшена"
+    if argument:
+        raise ValueError("Использование: stats [on|off|reset]")
+    if not METRICS.enabled and not METRICS.counters:
+        return "Сбор статистики выключен. Включите командой 'stats on'"
+    return METRICS.format()
@@ -0,0 +1,68 @@
+# Параметры, согласуемые при установке соединения.
+# Данные кадров TYPE_LINK и ответного TYPE_ACK: никнейм, затем (необязательно)
+# байт 0x00 и список опций в формате тип (1 байт), длина (1 байт), значение.
+# Кадр TYPE_PARAM несет опции в том же формате с пустым никнеймом.
+
+OPT_CRC = 0x01    # Режимы контрольной суммы в порядке предпочтения / выбранный режим
+OPT_CODEC = 0x02  # Схемы кодирования на линии (fec.py) в порядке предпочтения / выбранная схема и остальные поддерживаемые
+OPT_MTU = 0x03    # Рекомендуемый размер данных I-кадра (в кадре TYPE_PARAM)
+OPT_COMPRESS = 0x04  # Методы сжатия сообщений (compress.py) в порядке предпочтения / принятые узлом
+OPT_BATCH = 0x05     # 1 - узел понимает кадры TYPE_BATCH / согласие узла (1) или отказ (0)
+OPT_BAUD = 0x06      # Скорости порта (бод) от большей к меньшей / выбранная скорость; в TYPE_PARAM - проверка скорости
+OPT_CREDIT = 0x07    # 1 - узел объявляет кредит в подтверждениях / согласие узла (1) или отказ (0)
+OPT_SESSION = 0x08   # Пусто - узел понимает сеансы, иначе идентификатор сеанса (4 байта) и номер следующего ожидаемого кадра
+OPT_WINDOW = 0x09    # Размер окна Selective Repeat узла / согласованный размер (меньший из двух)
+
+_SEPARATOR = b'\x00'
+_BAUD_SIZE = 4  # Скорость в опции OPT_BAUD - 4 байта, старший первым
+
+def pack_link_data(nick: str, options: dict[int, bytes]) -> bytes:
+    """Упаковывает никнейм и опции в данные кадра LINK/ACK."""
+    data = bytearray(nick.encode('utf-8'))
+    if options:
+        data += _SEPARATOR
+        for opt, value in options.items():
+            if len(value) > 255:
+                raise ValueError(f"Слишком длинное значение опции 0x{opt:02X}")
+            data += bytes([opt, len(value)]) + value
+    return bytes(data)
+
+def parse_link_data(data) -> tuple[str | None, dict[int, bytes]]:
+    """Разбирает данные кадра LINK/ACK. Никнейм None, если он не декодируется."""
+    data = bytes(data)
+    nick_raw, _, raw = data.partition(_SEPARATOR)
+    try:
+        nick = nick_raw.decode('utf-8') or None
+    except UnicodeDecodeError:
+        nick = None
+
+    options = {}
+    pos = 0
+    while pos + 2 <= len(raw):
+        opt, length = raw[pos], raw[pos + 1]
+        value = raw[pos + 2:pos + 2 + length]
+        if len(value) != length:
+            break  # Обрезанная опция - остальное игнорируем
+        options[opt] = value
+        pos += 2 + length
+    return nick, options
+
+def without_link_option(data, opt: int) -> bytes | None:
+    """Данные кадра LINK/ACK без опции opt или None, если ее нет.
+
+    Никнейм остается исходными байтами, даже если не декодируется.
+    """
+    data = bytes(data)
+    _, options = parse_link_data(data)
+    if options.pop(opt, None) is None:
+        return None
+    return data.partition(_SEPARATOR)[0] + pack_link_data('', options)
+
+def pack_baudrates(rates) -> bytes:
+    """Упаковывает список скоростей для опции OPT_BAUD."""
+    return b''.join(rate.to_bytes(_BAUD_SIZE, 'big') for rate in rates)
+
+def parse_baudrates(value) -> list[int]:
+    """Разбирает значение опции OPT_BAUD; неполный хвост игнорируется."""
+    return [int.from_bytes(value[i:i + _BAUD_SIZE], 'big')
+            for i in range(0, len(value) - _BAUD_SIZE + 1, _BAUD_SIZE)]
@@ -0,0 +1,73 @@
+from fec import CODEC_HAMMING74, CODEC_STRENGTH, preferred_codecs
+
+MIN_MTU = 16  # Меньше - заголовки фрагментов съедают почти весь кадр
+
+# Размер данных I-кадра в зависимости от оценки частоты битовых ошибок:
+# (верхняя граница BER, размер). Короткий кадр реже бракуется целиком.
+MTU_PROFILE = ((1e-4, 254), (1e-3, 128))
+NOISY_MTU = 64
+
+# Понижать защиту можно, только если ее допускает и вдвое большая частота ошибок
+DOWNGRADE_MARGIN = 2.0
+
+class LinkQuality:
+    """Скользящая оценка частоты ошибок по кадрам одного направления.
+
+    Копит число переданных бит и ошибочных событий (исправленный код,
+    испорченный или потерянный кадр). Когда накоплено больше window_bits,
+    оба счетчика делятся пополам, поэтому старые наблюдения затухают
+    экспоненциально, а память и время на замер постоянны.
+    """
+
+    def __init__(self, window_bits: int = 200_000, min_bits: int = 20_000):
+        self.window_bits = window_bits
+        self.min_bits = min_bits  # Меньше - оценке еще нельзя верить
+        self.reset()
+
+    def reset(self):
+        self.bits = 0.0
+        self.errors = 0.0
+
+    def record(self, bits: float, errors: float = 0):
+        """Учитывает переданные биты и ошибки в них."""
+        self.bits += bits
+        self.errors += errors
+        if self.bits > self.window_bits:
+            self.bits /= 2
+            self.errors /= 2
+
+    def bit_error_rate(self) -> float | None:
+        """Оценка BER или None, если данных мало."""
+        if self.bits < self.min_bits:
+            return None
+        return self.errors / self.bits
+
+def mtu_for(bit_error_rate: float, max_mtu: int = 254) -> int:
+    """Размер данных I-кадра для линии с данной частотой ошибок."""
+    for limit, mtu in MTU_PROFILE:
+        if bit_error_rate < limit:
+            return min(mtu, max_mtu)
+    return min(NOISY_MTU, max_mtu)
+
+def choose_profile(bit_error_rate: float, supported, current: tuple[int, int] | None = None) -> tuple[int, int]:
+    """Выбирает (схема кодирования, размер кадра) среди схем supported.
+
+    Если current задан, более слабая защита выбирается только с запасом
+    DOWNGRADE_MARGIN, чтобы профиль не колебался на границе порога.
+    """
+    def pick(ber):
+        codec = next((c for c in preferred_codecs(ber) if c in supported), CODEC_HAMMING74)
+        return codec, mtu_for(ber)
+
+    profile = pick(bit_error_rate)
+    if current is not None and is_weaker(profile, current):
+        cautious = pick(bit_error_rate * DOWNGRADE_MARGIN)
+        if not is_weaker(cautious, current):
+            return current
+        profile = cautious
+    return profile
+
+def is_weaker(profile: tuple[int, int], other: tuple[int, int]) -> bool:
+    """Дает ли profile меньшую защиту, чем other (слабее схема или длиннее кадр)."""
+    return (CODEC_STRENGTH.index(profile[0]) < CODEC_STRENGTH.index(other[0])
+            or (profile[0] == other[0] and profile[1] > other[1]))
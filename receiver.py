@@ -1,14 +1,17 @@
+import asyncio
 import os
 import glob
 import serial
 import serial.tools.list_ports
 import sys
-import time
 import random
-import select
-from hamming import decode_7bit, encode_4bit
+from engine import create_engine
 from frame import Frame
 from connection import Connection, ConnectionState
+from connection_table import ConnectionTable
+from message import MessageChannel
+from filetransfer import FileTransfers, RECEIVE_DIR
+from metrics import METRICS, dump_settings, stats_command
 from config import SerialConfig, configure_port, print_serial_config
 
 def generate_address() -> int:
@@ -31,60 +34,6 @@ def print_address_banner(addr: int, nickname: str):
 
 MY_ADDR = 0x01  # Адрес приёмника
 
-def read_byte(ser) -> int:
-    """Читает два 7-битных кода и собирает байт."""
-    data = []
-    while len(data) < 2:
-        byte = ser.read(1)
-        if not byte:
-            return None
-        if byte == b'\xFF':  # Старт кадра
-            encoded = ser.read(1)
-            stop_byte = ser.read(1)
-            if not encoded or stop_byte != b'\xFF':
-                continue  # Пропускаем ошибочные кадры
-            decoded = decode_7bit(encoded[0])
-            data.append(decoded)
-    return (data[0] << 4) | data[1]
-
-def read_frame(ser) -> Frame:
-    """Читает и собирает фрейм."""
-    buffer = bytearray()
-    while True:
-        byte = read_byte(ser)
-        if byte is None:
-            return None
-        
-        buffer.append(byte)
-        
-        # Проверяем, достаточно ли байт для заголовка фрейма
-        if len(buffer) >= 5:
-            try:
-                # Проверяем длину данных из заголовка
-                length = buffer[4]
-                if len(buffer) >= length + 6:  # заголовок + данные + стоп-байт
-                    return Frame.from_bytes(buffer)
-            except Exception as e:
-                print(f"Ошибка при разборе фрейма: {e}")
-                buffer.clear()
-
-def encode_and_send_byte(ser, byte: int):
-    """Кодирует и отправляет один байт."""
-    upper_nibble = (byte >> 4) & 0x0F
-    lower_nibble = byte & 0x0F
-    
-    encoded_upper = encode_4bit(upper_nibble)
-    encoded_lower = encode_4bit(lower_nibble)
-    
-    ser.write(bytes([0xFF, encoded_upper, 0xFF]))
-    ser.write(bytes([0xFF, encoded_lower, 0xFF]))
-    time.sleep(0.01)
-
-def send_frame(ser, frame: Frame):
-    """Отправляет фрейм."""
-    for byte in frame.to_bytes():
-        encode_and_send_byte(ser, byte)
-
 def get_frame_type_name(frame_type: int) -> str:
     """Возвращает текстовое описание типа фрейма."""
     types = {
@@ -92,7 +41,9 @@ def get_frame_type_name(frame_type: int) -> str:
         Frame.TYPE_LINK: "Установка соединения",
         Frame.TYPE_UPLINK: "Разрыв соединения",
         Frame.TYPE_ACK: "Подтверждение",
-        Frame.TYPE_RET: "Запрос повтора"
+        Frame.TYPE_RET: "Запрос повтора",
+        Frame.TYPE_PARAM: "Параметры канала",
+        Frame.TYPE_BATCH: "Пакет данных"
     }
     return types.get(frame_type, "Неизвестный тип")
 
@@ -132,6 +83,8 @@ def print_help():
     print("\n\033[1mДоступные команды:\033[0m")
     print("  \033[36mstatus\033[0m     - показать статус соединений")
     print("  \033[33mexit\033[0m       - выход")
+    print("  \033[36mstats\033[0m      - статистика канала (stats on|off|reset)")
+    print("  \033[36mrecvfile\033[0m   - принимать файлы в каталог (recvfile [каталог] | recvfile off)")
     print("  \033[36mhelp\033[0m       - показать эту справку")
     print("\033[1mВсе входящие сообщения будут отображаться автоматически.\033[0m\n")
 
@@ -144,6 +97,208 @@ def safe_input(prompt: str = "") -> str:
     except KeyboardInterrupt:
         return "exit"
 
+class ReceiverClient:
+    """Клиент получателя: принимает соединения от многих узлов через движок канала (engine.create_engine)."""
+
+    def __init__(self, ser, my_addr: int, nickname: str, line_rate: float | None = None,
+                 baudrate: int | None = None, baudrates: tuple[int, ...] = ()):
+        self.my_addr = my_addr
+        self.nickname = nickname
+        self.line_rate = line_rate  # Байт в секунду на линии, для таймеров повтора
+        self.baudrate = baudrate    # Исходная скорость порта
+        self.baudrates = baudrates  # Скорости для согласования (только при единственном соединении)
+        self.port_rate = baudrate   # Текущая скорость порта
+        # Соединения по паре адресов (отправитель, получатель)
+        self.connections = ConnectionTable()
+        self.channels = {}  # Сборка сообщений для каждого соединения
+        self.transfers = {}  # Передачи файлов для каждого соединения
+        self.receive_dir = None  # Каталог для входящих файлов; None - прием выключен
+        self.engine = create_engine(ser, self.on_frame, self.on_tick)
+
+    async def run(self):
+        """Работает до команды exit."""
+        dump = dump_settings()
+
+        def on_start():
+            self.engine.add_reader(sys.stdin, self.on_stdin)
+            if dump:
+                # Периодический снимок метрик в JSON (LINK_STATS_FILE, LINK_STATS_INTERVAL)
+                self.engine.every(dump[1], lambda: METRICS.dump(dump[0]))
+        try:
+            await self.engine.run(on_start=on_start)
+        finally:
+            if dump:
+                METRICS.dump(dump[0])
+
+    def on_stdin(self):
+        """Читает и выполняет команду пользователя."""
+        user_input = safe_input("\033[1;37m[READY]\033[0m> ").strip()
+        command = user_input.lower()
+        
+        if command == 'exit':
+            self.engine.stop()
+            
+        elif command == 'help':
+            print_help()
+            
+        elif command == 'status':
+            if self.connections:
+                print("\n=== Активные соединения ===")
+                for conn in self.connections:
+                    print(str(conn))
+                    for line in self.transfers[conn.remote_addr].status():
+                        print_status_message(line, "info")
+            else:
+                print_status_message("Нет активных соединений", "info")
+                
+        elif command == 'stats' or command.startswith('stats '):
+            try:
+                print(stats_command(command[len('stats'):].strip()))
+            except ValueError as e:
+                print_status_message(str(e), "error")
+
+        elif command == 'recvfile' or command.startswith('recvfile '):
+            directory = user_input[len('recvfile'):].strip()
+            if directory.lower() == 'off':
+                self.receive_dir = None
+                print_status_message("Прием файлов выключен", "info")
+            else:
+                self.receive_dir = os.path.expanduser(directory) if directory else RECEIVE_DIR
+                print_status_message(f"Входящие файлы сохраняются в {self.receive_dir}", "success")
+            for transfers in self.transfers.values():
+                transfers.receive_dir = self.receive_dir
+
+        elif command:
+            print_status_message("Неизвестная команда. Введите 'help' для справки.", "error")
+
+    def on_frame(self, frame: Frame):
+        """Обрабатывает входящий фрейм."""
+        # Проверяем, что фрейм предназначен нам
+        if frame.receiver != self.my_addr and frame.receiver != Frame.BROADCAST_ADDR:
+            return
+
+        connections = self.connections.lookup(frame)
+        if not connections:
+            # Адрес отправителя поврежденного кадра может быть искажен
+            if not frame.crc_ok or frame.receiver == Frame.BROADCAST_ADDR:
+                return
+            # Создаем объект соединения для нового узла
+            connection = self.connections.add(Connection(self.my_addr, frame.sender, local_nick=self.nickname,
+                                                             line_rate=self.line_rate, baudrate=self.baudrate))
+            self.channels[frame.sender] = MessageChannel(connection)
+            self.transfers[frame.sender] = FileTransfers(self.channels[frame.sender], print_status_message,
+                                                         self.receive_dir)
+            print_status_message(f"Новое соединение от узла 0x{frame.sender:02X}", "info")
+            connections = [connection]
+
+        for connection in connections:
+            self.handle_connection_frame(connection, frame)
+
+    def handle_connection_frame(self, connection: Connection, frame: Frame):
+        """Передает фрейм соединению, отправляет ответ и выводит сообщения."""
+        channel = self.channels[connection.remote_addr]
+        transfers = self.transfers[connection.remote_addr]
+        old_state = connection.state
+        if frame.frame_type == Frame.TYPE_LINK:
+            # Скорость порта общая для всех узлов: поднимаем ее, только если других соединений нет
+            others = any(c is not connection and c.is_connected() for c in self.connections)
+            connection.baudrates = () if others else self.baudrates
+        
+        # Обрабатываем фрейм и получаем ответ если нужен
+        response = connection.handle_frame(frame)
+        
+        # Логируем изменение состояния соединения
+        if old_state != connection.state:
+            if connection.state == ConnectionState.CONNECTED and connection.resumed:
+                print_status_message(f"Возобновлен сеанс с {connection.remote_nick} (0x{connection.remote_addr:02X})", "success")
+            elif connection.state == ConnectionState.CONNECTED:
+                print_status_message(f"Установлено соединение с {connection.remote_nick} (0x{connection.remote_addr:02X})", "success")
+            elif connection.state == ConnectionState.DISCONNECTED:
+                print_status_message(f"Разорвано соединение с {connection.remote_nick} (0x{connection.remote_addr:02X})", "warning")
+                transfers.close()
+                self.restore_baudrate(connection)
+        
+        if response:
+            print_status_message(f"Отправка {Frame.FRAME_TYPES.get(response.frame_type, f'0x{response.frame_type:02X}')} → {connection.remote_nick}", "info")
+            self.engine.send(response)
+        self.apply_baudrate(connection)
+        
+        # Выводим сообщения, принятые по порядку (повторы сюда не попадают)
+        for data in channel.receive():
+            if transfers.handle_message(data):
+                continue
+            try:
+                text = str(data, 'utf-8')
+                print(f"\033[1;32m[{connection.remote_nick} → {connection.local_nick}]\033[0m {text}")
+            except UnicodeDecodeError:
+                print_status_message(f"[{connection.remote_nick} → {connection.local_nick}] Ошибка декодирования сообщения", "error")
+        self.reschedule(connection)
+
+    def apply_baudrate(self, connection: Connection):
+        """Применяет к порту скорость, согласованную или возвращенную соединением."""
+        rate = connection.take_baudrate()
+        if rate is None or rate == self.port_rate:
+            return
+        if rate > self.port_rate:
+            print_status_message(f"Переход на скорость {rate} бод для {connection.remote_nick}", "info")
+        else:
+            print_status_message(f"Возврат к скорости {rate} бод", "warning")
+        self.port_rate = rate
+        self.engine.set_baudrate(rate)
+
+    def restore_baudrate(self, connection: Connection):
+        """После сеанса на согласованной скорости возвращает исходную, чтобы принимать новые соединения."""
+        if connection.baudrate != self.baudrate:
+            connection.set_baudrate(self.baudrate)
+
+    def reschedule(self, connection: Connection):
+        """Назначает ближайший срок проверки соединения и сборки его сообщений."""
+        channel = self.channels[connection.remote_addr]
+        deadlines = [d for d in (connection.next_timeout(), channel.next_timeout()) if d is not None]
+        self.connections.schedule(connection, min(deadlines, default=None))
+
+    def on_tick(self) -> float | None:
+        """Проверяет соединения, срок которых наступил; возвращает время следующей проверки."""
+        for connection in self.connections.expired():
+            channel = self.channels[connection.remote_addr]
+            if connection.state == ConnectionState.DISCONNECTED and not connection.can_resume():
+                self.forget(connection)  # Срок сохраненного сеанса истек
+                continue
+            if connection.is_connection_timeout():
+                print_status_message(f"Соединение с {connection.remote_nick} (0x{connection.remote_addr:02X}) разорвано по таймауту", "error")
+                connection.state = ConnectionState.DISCONNECTED
+                self.suspend(connection)
+                continue
+            if channel.check_timeout():
+                print_status_message(f"Сообщение от {connection.remote_nick} не собрано за {channel.reassembly_timeout:.0f} с", "warning")
+            old_state = connection.state
+            for frame in connection.poll_outgoing():
+                self.engine.send(frame)
+            if old_state == ConnectionState.CONNECTED and connection.state == ConnectionState.DISCONNECTED:
+                print_status_message(f"Узел {connection.remote_nick} не подтверждает данные после {connection.max_retries} попыток", "error")
+                self.suspend(connection)
+                continue
+            self.apply_baudrate(connection)
+            self.reschedule(connection)
+        return self.connections.next_deadline()
+
+    def suspend(self, connection: Connection):
+        """Оборвавшееся соединение: закрывает файлы, возвращает скорость порта и хранит сеанс до конца срока."""
+        self.transfers[connection.remote_addr].close()
+        self.restore_baudrate(connection)
+        self.apply_baudrate(connection)
+        if connection.can_resume():
+            print_status_message(f"Сеанс с {connection.remote_nick} сохранен на {connection.session_grace:.0f} с", "info")
+            self.reschedule(connection)
+        else:
+            self.forget(connection)
+
+    def forget(self, connection: Connection):
+        """Удаляет соединение вместе с его каналом и передачами."""
+        self.connections.remove(connection)
+        self.channels.pop(connection.remote_addr)
+        self.transfers.pop(connection.remote_addr).close()
+
 def main():
     # Генерируем случайный адрес для этого узла
     MY_ADDR = generate_address()
@@ -159,7 +314,8 @@ def main():
     if len(sys.argv) > 1:
         try:
             port_number = sys.argv[1]
-            port = f"/dev/ttys{port_number.zfill(3)}"
+            # Полный путь к порту или номер псевдотерминала /dev/ttysNNN (macOS)
+            port = port_number if '/' in port_number else f"/dev/ttys{port_number.zfill(3)}"
             if not os.path.exists(port):
                 print(f"Порт {port} не существует")
                 return
@@ -190,79 +346,11 @@ def main():
     print(f"Адрес узла: \033[1;33m0x{MY_ADDR:02X}\033[0m")
     print(f"Никнейм: \033[1;36m{nickname}\033[0m")
     
-    # Словарь соединений по адресам отправителей
-    connections = {}
     print_help()
+    client = ReceiverClient(ser, MY_ADDR, nickname, config.line_rate(), config.baudrate, config.supported_baudrates())
     
     try:
-        while True:
-            if sys.stdin in select.select([sys.stdin], [], [], 0)[0]:
-                command = safe_input("\033[1;37m[READY]\033[0m> ").strip().lower()
-                
-                if command == 'exit':
-                    raise KeyboardInterrupt
-                    
-                elif command == 'help':
-                    print_help()
-                    
-                elif command == 'status':
-                    if connections:
-                        print("\n=== Активные соединения ===")
-                        for addr, conn in connections.items():
-                            print(str(conn))
-                    else:
-                        print_status_message("Нет активных соединений", "info")
-                        
-                else:
-                    print_status_message("Неизвестная команда. Введите 'help' для справки.", "error")
-            
-            # Проверяем входящие данные
-            frame = read_frame(ser)
-            if frame:
-                # Проверяем, что фрейм предназначен нам
-                if frame.receiver != MY_ADDR and frame.receiver != Frame.BROADCAST_ADDR:
-                    continue
-                
-                # Получаем или создаем объект соединения
-                if frame.sender not in connections:
-                    connections[frame.sender] = Connection(MY_ADDR, frame.sender, local_nick=nickname)
-                    print_status_message(f"Новое соединение от узла 0x{frame.sender:02X}", "info")
-                
-                connection = connections[frame.sender]
-                old_state = connection.state
-                
-                # Обрабатываем фрейм и получаем ответ если нужен
-                response = connection.handle_frame(frame)
-                
-                # Логируем изменение состояния соединения
-                if old_state != connection.state:
-                    if connection.state == ConnectionState.CONNECTED:
-                        print_status_message(f"Установлено соединение с {connection.remote_nick} (0x{connection.remote_addr:02X})", "success")
-                    elif connection.state == ConnectionState.DISCONNECTED:
-                        print_status_message(f"Разорвано соединение с {connection.remote_nick} (0x{connection.remote_addr:02X})", "warning")
-                
-                if response:
-                    print_status_message(f"Отправка {Frame.FRAME_TYPES.get(response.frame_type, f'0x{response.frame_type:02X}')} → {connection.remote_nick}", "info")
-                    send_frame(ser, response)
-                
-                # Выводим сообщение если это информационный фрейм
-                if frame.frame_type == Frame.TYPE_I and connection.is_connected():
-                    try:
-                        text = frame.data.decode('utf-8')
-                        print(f"\033[1;32m[{connection.remote_nick} → {connection.local_nick}]\033[0m {text}")
-                    except UnicodeDecodeError:
-                        print_status_message(f"[{connection.remote_nick} → {connection.local_nick}] Ошибка декодирования сообщения", "error")
-            
-            # Проверяем все соединения на таймауты
-            for addr in list(connections.keys()):
-                connection = connections[addr]
-                if connection.is_connection_timeout():
-                    print_status_message(f"Соединение с {connection.remote_nick} (0x{connection.remote_addr:02X}) разорвано по таймауту", "error")
-                    connections.pop(addr)
-            
-            # Небольшая задержка для снижения нагрузки на процессор
-            time.sleep(0.1)
-            
+        asyncio.run(client.run())
     except KeyboardInterrupt:
         print_status_message("\nЗавершение работы...", "warning")
     finally:
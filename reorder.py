@@ -0,0 +1,67 @@
+class ReorderWindow:
+    """Окно приема Selective Repeat: кольцо на size ячеек и битовая карта.
+
+    Номера - байт по модулю modulo. Элемент с ожидаемым номером next
+    выдается сразу, элементы впереди него (не дальше size - 1) ждут в
+    кольце, пока дыра не закроется. Все, что позади окна или уже лежит
+    в кольце, - дубликат. Каждая операция O(1) на элемент, память
+    постоянна: size ячеек и одно целое.
+    """
+
+    __slots__ = ('size', 'modulo', 'next', '_slots', '_head', '_bitmap')
+
+    def __init__(self, size: int, modulo: int = 256):
+        if not 1 <= size <= modulo // 2:
+            raise ValueError(f"Размер окна должен быть в диапазоне 1-{modulo // 2}")
+        self.size = size
+        self.modulo = modulo
+        self._slots = [None] * size
+        self.reset()
+
+    def reset(self):
+        """Начинает прием с номера 0 (новый сеанс)."""
+        self.next = 0     # Следующий ожидаемый номер
+        self._head = 0    # Ячейка кольца для номера next
+        self._bitmap = 0  # Бит k - в кольце лежит номер next + 1 + k
+        for i in range(self.size):
+            self._slots[i] = None
+
+    def add(self, seq: int, item) -> list | None:
+        """Принимает элемент с номером seq.
+
+        Возвращает выданные по порядку элементы (начиная с item, если он
+        ожидался), пустой список, если item отложен до закрытия дыры, и
+        None для дубликата или номера вне окна.
+        """
+        offset = (seq - self.next) % self.modulo
+        if offset >= self.size:
+            return None
+        if offset:
+            bit = 1 << (offset - 1)
+            if self._bitmap & bit:
+                return None
+            self._bitmap |= bit
+            self._slots[(self._head + offset) % self.size] = item
+            return []
+
+        ready = [item]
+        self._advance()
+        while self._bitmap & 1:
+            self._bitmap >>= 1
+            ready.append(self._slots[self._head])
+            self._slots[self._head] = None
+            self._advance()
+        self._bitmap >>= 1
+        return ready
+
+    def _advance(self):
+        self.next = (self.next + 1) % self.modulo
+        self._head = (self._head + 1) % self.size
+
+    def pending(self) -> int:
+        """Сколько элементов ждет закрытия дыры."""
+        return self._bitmap.bit_count()
+
+    def sack(self) -> int:
+        """Битовая карта отложенных номеров: бит k - получен номер next + 1 + k."""
+        return self._bitmap
@@ -0,0 +1,221 @@
+"""Маршрутизатор между сегментами линии: несколько портов в одном процессе.
+
+Маршрутизатор не имеет своего адреса и не устанавливает соединений: он
+запоминает, на каком порту живет каждый адрес (по полю sender принятых
+кадров), и пересылает кадры, получатель которых находится в другом
+сегменте. Кадр для неизвестного адреса и широковещательный кадр уходят во
+все остальные порты. Соединение, подтверждения и повторы остаются делом
+конечных узлов.
+"""
+import argparse
+import queue
+import threading
+import time
+from connection import ACK_DATA_MARK
+from frame import Frame
+from metrics import METRICS, dump_settings
+from options import OPT_BAUD, without_link_option
+from wire import DELIMITER, FrameDecoder, encode_frame
+
+# Счетчики кадров, принятых портом; в METRICS попадают как router.<имя>
+COUNTERS = ('corrupt', 'local', 'forwarded', 'flooded', 'dropped', 'baud_stripped')
+
+class RouterPort:
+    """Порт маршрутизатора: свои потоки чтения и записи и ограниченная очередь на отправку.
+
+    Поток чтения сам разбирает кадры и раскладывает их по очередям других
+    портов, поэтому порты не ждут друг друга и общего диспетчера. Если
+    очередь порта переполнена, кадр отбрасывается: ждать нельзя - встанет
+    прием на порту-источнике, а потерю восстановит ARQ конечных узлов.
+    """
+
+    def __init__(self, router: 'Router', ser, name: str, max_outbound: int = 64):
+        self.router = router
+        self.ser = ser
+        self.name = name
+        self.decoder = FrameDecoder(keep_codes=True)
+        self.outbound = queue.Queue(max_outbound)  # Буферы для записи; None - конец работы
+        self.forwarded = 0  # Кадры, записанные в этот порт
+        # Судьба кадров, принятых этим портом (dropped - не поместились в очередь другого
+        # порта). Пишет только поток чтения порта, поэтому блокировка не нужна
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.threads = []
+
+    def start(self):
+        for target, role in ((self._read_loop, 'reader'), (self._write_loop, 'writer')):
+            thread = threading.Thread(target=target, name=f"router-{self.name}-{role}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, data: bytes) -> bool:
+        """Ставит кадр в очередь записи; False, если очередь полна и кадр отброшен."""
+        try:
+            self.outbound.put_nowait(data)
+        except queue.Full:
+            return False
+        return True
+
+    def stop(self):
+        """Останавливает потоки после записи уже поставленных в очередь кадров."""
+        self.outbound.put(None)
+        cancel = getattr(self.ser, 'cancel_read', None)
+        if cancel is not None:
+            cancel()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+
+    def _read_loop(self):
+        while not self.router.stopping.is_set():
+            try:
+                data = self.ser.read(max(1, self.ser.in_waiting))
+            except (OSError, TypeError, ValueError):
+                break  # Порт закрыт
+            for frame in self.decoder.feed(data):
+                self.router.route(self, frame, self.decoder.last_codes)
+
+    def _write_loop(self):
+        while True:
+            data = self.outbound.get()
+            if data is None:
+                return
+            self.ser.write(data)
+            self.ser.flush()
+            self.forwarded += 1
+
+class Router:
+    """Обучающийся мост между портами.
+
+    Таблица адрес -> порт общая для всех потоков чтения; запись одного
+    элемента словаря атомарна, поэтому блокировка не нужна. Запись
+    устаревает через max_age секунд без кадров от этого адреса, и узел,
+    переставленный в другой сегмент, находится заново. Сегменты должны
+    образовывать дерево: петля между портами размножит широковещательные
+    кадры.
+    """
+
+    def __init__(self, ports: dict, max_age: float = 300.0, max_outbound: int = 64):
+        self.max_age = max_age
+        self.stopping = threading.Event()
+        self.table = {}  # Адрес -> (порт, время последнего кадра)
+        self.ports = [RouterPort(self, ser, name, max_outbound) for name, ser in ports.items()]
+        self._published = dict.fromkeys(COUNTERS, 0)  # Уже перенесенные в METRICS суммы
+
+    def route(self, source: RouterPort, frame: Frame, codes: bytes):
+        """Запоминает порт отправителя и пересылает кадр в порт получателя."""
+        if not frame.crc_ok:
+            # Адреса поврежденного кадра ненадежны, а получатель его все равно отбросит
+            source.counts['corrupt'] += 1
+            return
+        now = time.time()
+        if frame.sender != Frame.BROADCAST_ADDR:
+            self.table[frame.sender] = (source, now)
+
+        entry = self.table.get(frame.receiver) if frame.receiver != Frame.BROADCAST_ADDR else None
+        if entry is not None and now - entry[1] > self.max_age:
+            entry = None
+        if entry is not None and entry[0] is source:
+            source.counts['local'] += 1  # Получатель в том же сегменте и слышит кадр сам
+            return
+
+        stripped = _without_baud(frame)
+        if stripped is not None:
+            data = encode_frame(stripped)
+            source.counts['baud_stripped'] += 1
+        elif frame.corrected:
+            data = encode_frame(frame)  # Не переносим исправленные ошибки в следующий сегмент
+        else:
+            data = bytes([DELIMITER]) + codes + bytes([DELIMITER])
+        if entry is not None:
+            source.counts['forwarded' if entry[0].put(data) else 'dropped'] += 1
+            return
+        for port in self.ports:
+            if port is not source and not port.put(data):
+                source.counts['dropped'] += 1
+        source.counts['flooded'] += 1
+
+    def addresses(self) -> dict[int, str]:
+        """Известные адреса и имена их портов."""
+        now = time.time()
+        return {addr: port.name for addr, (port, seen) in sorted(self.table.items())
+                if now - seen <= self.max_age}
+
+    def serve(self):
+        """Запускает потоки портов и ждет stop()."""
+        dump = dump_settings()
+        for port in self.ports:
+            port.start()
+        try:
+            while not self.stopping.wait(dump[1] if dump else None):
+                if METRICS.enabled:
+                    METRICS.gauge('router.table_size', len(self.table))
+                self.publish_counters()
+                METRICS.dump(dump[0])
+        finally:
+            self.stopping.set()
+            for port in self.ports:
+                port.stop()
+            self.publish_counters()
+            if dump:
+                METRICS.dump(dump[0])
+
+    def totals(self) -> dict[str, int]:
+        """Счетчики кадров, сложенные по всем портам."""
+        return {name: sum(port.counts[name] for port in self.ports) for name in COUNTERS}
+
+    def publish_counters(self):
+        """Переносит прирост счетчиков портов в METRICS (router.*)."""
+        if not METRICS.enabled:
+            return
+        for name, total in self.totals().items():
+            if total != self._published[name]:
+                METRICS.inc(f'router.{name}', total - self._published[name])
+                self._published[name] = total
+
+    def stop(self):
+        self.stopping.set()
+
+def _without_baud(frame: Frame) -> Frame | None:
+    """Копия кадра LINK или ответа на него без OPT_BAUD; None, если опции нет.
+
+    Порты маршрутизатора работают на скорости из конфигурации: согласовав
+    более высокую, узлы разных сегментов перестали бы слышать друг друга.
+    """
+    if frame.frame_type not in (Frame.TYPE_LINK, Frame.TYPE_ACK) or frame.data[:1] == bytes([ACK_DATA_MARK]):
+        return None
+    data = without_link_option(frame.data, OPT_BAUD)
+    if data is None:
+        return None
+    return Frame(frame.receiver, frame.sender, frame.frame_type, data, frame.crc, frame.codec)
+
+def main():
+    from config import SerialConfig, print_serial_config
+    import serial
+
+    parser = argparse.ArgumentParser(description="Маршрутизатор кадров между портами")
+    parser.add_argument('ports', nargs='+', help="пути к портам сегментов, например /dev/ttyUSB0 /dev/ttyUSB1")
+    parser.add_argument('--max-age', type=float, default=300.0,
+                        help="через сколько секунд без кадров забывать адрес (по умолчанию 300)")
+    args = parser.parse_args()
+    if len(args.ports) < 2:
+        parser.error("нужно хотя бы два порта")
+
+    config = SerialConfig.load()
+    print_serial_config(config)
+    ports = {}
+    try:
+        for path in args.ports:
+            ports[path] = serial.Serial(path, **config.to_dict())
+        router = Router(ports, args.max_age)
+        print(f"Маршрутизация между {', '.join(args.ports)}; Ctrl+C - выход")
+        try:
+            router.serve()
+        except KeyboardInterrupt:
+            router.stop()
+        for addr, name in router.addresses().items():
+            print(f"  0x{addr:02X} -> {name}")
+    finally:
+        for ser in ports.values():
+            ser.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,17 @@
+import asyncio
 import serial
 import serial.tools.list_ports
-import time
 import os
 import glob
 import sys
 import locale
-from hamming import encode_4bit, decode_7bit
+from engine import create_engine
 from frame import Frame
 from connection import Connection, ConnectionState
-import select
+from message import MessageChannel
+from filetransfer import FileTransfers, RECEIVE_DIR
+from fec import CODEC_NAMES, preferred_codecs
+from metrics import METRICS, dump_settings, stats_command
 import random
 from config import SerialConfig, configure_port, print_serial_config
 
@@ -55,61 +58,6 @@ def parse_address(addr_str: str) -> int | None:
         print_status_message("Неверный формат адреса. Используйте формат 0xXX или XX (hex)", "error")
         return None
 
-def encode_and_send_byte(ser, byte: int):
-    """Кодирует и отправляет один байт."""
-    upper_nibble = (byte >> 4) & 0x0F
-    lower_nibble = byte & 0x0F
-    
-    encoded_upper = encode_4bit(upper_nibble)
-    encoded_lower = encode_4bit(lower_nibble)
-    
-    # Отправляем каждую половину байта с маркерами
-    ser.write(bytes([0xFF, encoded_upper, 0xFF]))
-    ser.write(bytes([0xFF, encoded_lower, 0xFF]))
-    time.sleep(0.01)
-
-def send_frame(ser, frame: Frame):
-    """Отправляет фрейм."""
-    for byte in frame.to_bytes():
-        encode_and_send_byte(ser, byte)
-
-def read_byte(ser) -> int:
-    """Читает два 7-битных кода и собирает байт."""
-    data = []
-    while len(data) < 2:
-        byte = ser.read(1)
-        if not byte:
-            return None
-        if byte == b'\xFF':  # Старт кадра
-            encoded = ser.read(1)
-            stop_byte = ser.read(1)
-            if not encoded or stop_byte != b'\xFF':
-                continue  # Пропускаем ошибочные кадры
-            decoded = decode_7bit(encoded[0])
-            data.append(decoded)
-    return (data[0] << 4) | data[1]
-
-def read_frame(ser) -> Frame:
-    """Читает и собирает фрейм."""
-    buffer = bytearray()
-    while True:
-        byte = read_byte(ser)
-        if byte is None:
-            return None
-        
-        buffer.append(byte)
-        
-        # Проверяем, достаточно ли байт для заголовка фрейма
-        if len(buffer) >= 5:
-            try:
-                # Проверяем длину данных из заголовка
-                length = buffer[4]
-                if len(buffer) >= length + 6:  # заголовок + данные + стоп-байт
-                    return Frame.from_bytes(buffer)
-            except Exception as e:
-                print(f"Ошибка при разборе фрейма: {e}")
-                buffer.clear()
-
 def list_serial_ports():
     """Возвращает список доступных COM-портов, включая виртуальные от socat."""
     ports = list(serial.tools.list_ports.comports())
@@ -160,53 +108,337 @@ def print_help():
     print("  \033[31mdisconnect\033[0m - разорвать соединение")
     print("  \033[36mstatus\033[0m     - показать статус соединения")
     print("  \033[36mconfig\033[0m     - настроить параметры порта")
+    print("  \033[32msendfile\033[0m   - отправить файл (sendfile <путь>), после разрыва передача продолжится")
+    print("  \033[36mrecvfile\033[0m   - принимать файлы в каталог (recvfile [каталог] | recvfile off)")
     print("  \033[33mexit\033[0m       - выход")
+    print("  \033[36mstats\033[0m      - статистика канала (stats on|off|reset)")
     print("  \033[36mhelp\033[0m       - показать эту справку")
     print("\033[1mЧтобы отправить сообщение, просто введите текст.\033[0m\n")
 
-def check_for_response(ser, connection):
-    """Проверяет наличие ответа от получателя."""
-    if ser.in_waiting:
-        frame = read_frame(ser)
-        if frame:
-            if frame.frame_type == Frame.TYPE_ACK:
+class SenderClient:
+    """Интерактивный клиент отправителя: команды из stdin, обмен через движок канала (engine.create_engine)."""
+
+    def __init__(self, ser, config: SerialConfig, nickname: str):
+        self.config = config
+        self.nickname = nickname
+        self.connection = None
+        self.channel = None
+        self.suspended = None      # Оборвавшееся соединение и его канал, пока сеанс можно возобновить
+        self.transfers = None      # Передачи файлов текущего соединения
+        self.receive_dir = None    # Каталог для входящих файлов; None - прием выключен
+        self.port_rate = config.baudrate  # Текущая скорость порта (может быть согласована выше)
+        self.engine = create_engine(ser, self.on_frame, self.on_tick)
+
+    async def run(self):
+        """Работает до команды exit."""
+        dump = dump_settings()
+
+        def on_start():
+            self.engine.add_reader(sys.stdin, self.on_stdin)
+            if dump:
+                # Периодический снимок метрик в JSON (LINK_STATS_FILE, LINK_STATS_INTERVAL)
+                self.engine.every(dump[1], lambda: METRICS.dump(dump[0]))
+        try:
+            await self.engine.run(on_start=on_start)
+        finally:
+            if dump:
+                METRICS.dump(dump[0])
+
+    def close_connection(self, keep_session: bool = False):
+        """Забывает текущее соединение; журналы передач остаются для докачки.
+
+        keep_session - соединение оборвалось: его сеанс сохраняется, и connect
+        к тому же узлу возобновит его без потери неподтвержденных данных.
+        """
+        connection = self.connection
+        if self.transfers:
+            self.transfers.close()
+        self.suspended = None
+        if keep_session and connection.can_resume():
+            self.suspended = (connection, self.channel)
+            print_status_message(f"Сеанс с {connection.remote_nick} сохранен на {connection.session_grace:.0f} с: "
+                                 f"connect {connection.remote_addr:02X} продолжит его", "info")
+        self.transfers = None
+        self.connection = None
+        self.channel = None
+        # Сеанс на согласованной скорости закончился - узел ждет новых соединений на исходной
+        if self.port_rate != self.config.baudrate:
+            self.set_port_rate(self.config.baudrate)
+        if self.suspended and connection.baudrate != self.config.baudrate:
+            connection.set_baudrate(self.config.baudrate)  # Возобновленный сеанс начнется на исходной скорости
+
+    def open_connection(self, remote_addr: int):
+        """Устанавливает соединение с узлом или возобновляет сохраненный сеанс с ним."""
+        if self.suspended and self.suspended[0].remote_addr == remote_addr and self.suspended[0].can_resume():
+            connection, channel = self.suspended
+            print_status_message(f"Возобновление сеанса с {connection.remote_nick}...", "info")
+        else:
+            # Схему кодирования предлагаем по уже наблюдавшейся частоте ошибок на приеме
+            connection = Connection(MY_ADDR, remote_addr, local_nick=self.nickname,
+                                    line_rate=self.config.line_rate(),
+                                    codecs=preferred_codecs(self.engine.decoder.bit_error_rate()),
+                                    baudrate=self.config.baudrate, baudrates=self.config.supported_baudrates())
+            channel = MessageChannel(connection)
+        try:
+            frame = connection.connect()
+            print_status_message(f"Отправка запроса на соединение с 0x{connection.remote_addr:02X}...", "info")
+            self.engine.send(frame)
+        except ValueError as e:
+            print_status_message(f"Ошибка: {e}", "error")
+            return
+        self.suspended = None
+        self.connection = connection
+        self.channel = channel
+        self.transfers = FileTransfers(self.channel, print_status_message, self.receive_dir)
+
+    def set_port_rate(self, rate: int):
+        """Переводит порт на скорость rate после уже поставленных в очередь фреймов."""
+        if rate > self.port_rate:
+            print_status_message(f"Переход на скорость {rate} бод", "info")
+        else:
+            print_status_message(f"Возврат к скорости {rate} бод", "warning")
+        self.port_rate = rate
+        self.engine.set_baudrate(rate)
+
+    def apply_baudrate(self, connection: Connection):
+        """Применяет к порту скорость, согласованную или возвращенную соединением."""
+        rate = connection.take_baudrate()
+        if rate is not None and rate != self.port_rate:
+            self.set_port_rate(rate)
+
+    def on_frame(self, frame: Frame):
+        """Обрабатывает ответ от получателя."""
+        connection = self.connection
+        if not connection:
+            return
+        old_state = connection.state
+        unacked = connection.unacked_count()
+        response = connection.handle_frame(frame)
+
+        if frame.frame_type == Frame.TYPE_ACK:
+            if old_state == ConnectionState.CONNECTING:
+                print_status_message(f"Получено подтверждение установки соединения от {connection.remote_nick}", "success")
+            elif old_state == ConnectionState.DISCONNECTING:
+                print_status_message(f"Получено подтверждение разрыва соединения от {connection.remote_nick}", "success")
+            elif unacked > connection.unacked_count():
+                delivered = unacked - connection.unacked_count()
+                print_status_message(f"Подтверждено кадров от {connection.remote_nick}: {delivered}", "success")
+        elif frame.frame_type == Frame.TYPE_RET:
+            print_status_message(f"{connection.remote_nick} запросил повтор кадра", "warning")
+        elif frame.frame_type == Frame.TYPE_PARAM:
+            print_status_message(f"Параметры канала: кодирование {CODEC_NAMES.get(connection.codec, connection.codec)}, "
+                                 f"до {connection.mtu} байт в кадре", "info")
+        else:
+            print_status_message(f"Получен ответ типа 0x{frame.frame_type:02X} от {connection.remote_nick}", "info")
+
+        if response:
+            self.engine.send(response)
+        self.apply_baudrate(connection)
+        for data in self.channel.receive():
+            if self.transfers.handle_message(data):
+                continue
+            print(f"\033[1;32m[{connection.remote_nick}]\033[0m {str(data, 'utf-8', errors='replace')}")
+        
+        if old_state != connection.state:
+            if connection.state == ConnectionState.CONNECTED and connection.resumed:
+                print_status_message(f"Сеанс с {connection.remote_nick} возобновлен, повторяем неподтвержденных "
+                                     f"кадров: {connection.unacked_count()}", "success")
+                for transfer in self.transfers.resume():
+                    print_status_message(f"Возобновляем передачу файла {transfer.name}", "info")
+            elif connection.state == ConnectionState.CONNECTED:
+                print_status_message(f"Соединение с {connection.remote_nick} установлено!", "success")
+                for transfer in self.transfers.resume():
+                    print_status_message(f"Возобновляем передачу файла {transfer.name}", "info")
+            elif connection.state == ConnectionState.DISCONNECTED:
+                print_status_message(f"Соединение с {connection.remote_nick} закрыто", "warning")
+                self.close_connection()
+
+    def on_tick(self) -> float | None:
+        """Обслуживает таймауты и очередь отправки; возвращает время следующей проверки."""
+        connection = self.connection
+        if not connection:
+            return None
+
+        # Проверяем таймаут соединения
+        if connection.is_connection_timeout():
+            print_status_message(f"Соединение с {connection.remote_nick} разорвано по таймауту", "warning")
+            self.close_connection(keep_session=True)
+            return None
+
+        # Повторяем запросы установки/разрыва соединения
+        old_state = connection.state
+        retry_frame = connection.check_timeout()
+        if retry_frame:
+            print_status_message(f"Повторная попытка {connection.retry_count} из {connection.max_retries}...", "warning")
+            self.engine.send(retry_frame)
+        elif connection.state == ConnectionState.DISCONNECTED and old_state != ConnectionState.DISCONNECTED:
+            print_status_message(f"Узел 0x{connection.remote_addr:02X} недоступен после {connection.max_retries} попыток", "error")
+            self.close_connection(keep_session=True)
+            return None
+
+        # Отбрасываем сообщение, которое перестало собираться
+        if self.channel.check_timeout():
+            print_status_message(f"Сообщение от {connection.remote_nick} не собрано за {self.channel.reassembly_timeout:.0f} с", "warning")
+
+        # Досылаем куски файлов и отправляем данные из очереди, пока есть место в окне
+        self.transfers.pump()
+        for frame in connection.poll_outgoing():
+            self.engine.send(frame)
+        self.apply_baudrate(connection)
+        if connection.state == ConnectionState.DISCONNECTED:
+            print_status_message(f"Узел {connection.remote_nick} не подтверждает данные после {connection.max_retries} попыток", "error")
+            # Данные не доставлены - сразу пробуем возобновить сеанс, LINK повторяется с отсрочкой
+            self.close_connection(keep_session=True)
+            if self.suspended:
+                self.open_connection(connection.remote_addr)
+                return self.on_tick()
+            return None
+
+        deadlines = [d for d in (connection.next_timeout(), self.channel.next_timeout(),
+                                 self.transfers.next_timeout()) if d is not None]
+        return min(deadlines, default=None)
+
+    def on_stdin(self):
+        """Читает и выполняет команду пользователя."""
+        prompt = get_status_prompt(self.connection) if self.connection else "\033[1;37m[READY]\033[0m"
+        try:
+            user_input = safe_input(f"{prompt}> ").strip()
+        except EOFError:
+            user_input = 'exit'
+        if user_input:
+            self.handle_command(user_input)
+            self.engine.wakeup()
+
+    def handle_command(self, user_input: str):
+        """Выполняет одну команду или отправляет сообщение."""
+        connection = self.connection
+        # Команду приводим к нижнему регистру для проверки
+        command = user_input.lower()
+            
+        if command == 'exit':
+            if connection and connection.state == ConnectionState.CONNECTED:
+                print_status_message("Разрываем соединение перед выходом...", "warning")
+                self.engine.send(connection.disconnect())
+            self.engine.stop()
+            
+        elif command == 'help':
+            print_help()
+            
+        elif command == 'status':
+            if connection:
+                print("\n" + str(connection))
                 if connection.state == ConnectionState.CONNECTING:
-                    print_status_message(f"Получено подтверждение установки соединения от {connection.remote_nick}", "success")
-                elif connection.state == ConnectionState.DISCONNECTING:
-                    print_status_message(f"Получено подтверждение разрыва соединения от {connection.remote_nick}", "success")
-                else:
-                    print_status_message(f"Сообщение доставлено {connection.remote_nick}", "success")
+                    print_status_message(f"Попытка {connection.retry_count} из {connection.max_retries}", "info")
+                for line in self.transfers.status():
+                    print_status_message(line, "info")
             else:
-                print_status_message(f"Получен ответ типа 0x{frame.frame_type:02X} от {connection.remote_nick}", "info")
+                print_status_message(f"Нет активного соединения. Ваш адрес: 0x{MY_ADDR:02X}", "info")
+                if self.suspended and self.suspended[0].can_resume():
+                    print_status_message(f"Сеанс с {self.suspended[0].remote_nick} можно возобновить командой "
+                                         f"connect {self.suspended[0].remote_addr:02X}", "info")
             
-            old_state = connection.state
-            connection.handle_frame(frame)
+        elif command in ('stats', 'stats on', 'stats off', 'stats reset'):
+            try:
+                print(stats_command(command[len('stats'):].strip()))
+            except ValueError as e:
+                print_status_message(str(e), "error")
+
+        elif command == 'config':
+            # Сохраняем текущие настройки
+            old_config = self.config
             
-            if old_state != connection.state:
-                if connection.state == ConnectionState.CONNECTED:
-                    print_status_message(f"Соединение с {connection.remote_nick} установлено!", "success")
-                elif connection.state == ConnectionState.DISCONNECTED:
-                    print_status_message(f"Соединение с {connection.remote_nick} закрыто", "warning")
-                    return True  # Сигнализируем, что соединение закрыто
-    return False
-
-def check_connection_timeout(ser, connection) -> bool:
-    """Проверяет таймауты соединения и возвращает True, если все попытки исчерпаны."""
-    retry_frame = connection.check_timeout()
-    if retry_frame:
-        if connection.retry_count >= connection.max_retries:
-            print_status_message(f"Узел 0x{connection.remote_addr:02X} недоступен после {connection.max_retries} попыток", "error")
-            return True
-        print_status_message(f"Повторная попытка {connection.retry_count} из {connection.max_retries}...", "warning")
-        send_frame(ser, retry_frame)
-    return False
+            # Настраиваем новые параметры
+            new_config = configure_port()
+            if new_config:
+                # Если конфигурация изменилась
+                if new_config != old_config:
+                    # Сохраняем новую конфигурацию
+                    new_config.save()
+                    self.config = new_config
+                    print_status_message("Конфигурация сохранена", "success")
+                    print_status_message("Для применения новых настроек перезапустите программу", "warning")
+                else:
+                    print_status_message("Конфигурация не изменилась", "info")
+            
+        elif command.startswith('connect'):
+            if connection:
+                print_status_message("Уже есть активное соединение", "error")
+                return
+                
+            # Парсим адрес из команды или запрашиваем его
+            parts = command.split()
+            if len(parts) > 1:
+                remote_addr = parse_address(parts[1])
+            else:
+                addr_input = safe_input("Введите адрес узла (в формате 0xXX): ")
+                remote_addr = parse_address(addr_input)
+            
+            if remote_addr is None:
+                return
+            self.open_connection(remote_addr)
+                
+        elif command == 'sendfile' or command.startswith('sendfile '):
+            path = user_input[len('sendfile'):].strip()
+            if not path:
+                print_status_message("Укажите путь к файлу: sendfile <путь>", "error")
+                return
+            if not connection or not connection.is_connected():
+                print_status_message("Ошибка: соединение не установлено", "error")
+                return
+            try:
+                transfer = self.transfers.send_file(os.path.expanduser(path))
+            except (OSError, ValueError) as e:
+                print_status_message(f"Ошибка: {e}", "error")
+                return
+            print_status_message(f"Предлагаем файл {transfer.name} узлу {connection.remote_nick}...", "info")
+
+        elif command == 'recvfile' or command.startswith('recvfile '):
+            directory = user_input[len('recvfile'):].strip()
+            if directory.lower() == 'off':
+                self.receive_dir = None
+                print_status_message("Прием файлов выключен", "info")
+            else:
+                self.receive_dir = os.path.expanduser(directory) if directory else RECEIVE_DIR
+                print_status_message(f"Входящие файлы сохраняются в {self.receive_dir}", "success")
+            if self.transfers:
+                self.transfers.receive_dir = self.receive_dir
+
+        elif command == 'disconnect':
+            if not connection:
+                print_status_message("Нет активного соединения", "error")
+                return
+                
+            try:
+                frame = connection.disconnect()
+                print_status_message(f"Отправка запроса на разрыв соединения с 0x{connection.remote_addr:02X}...", "warning")
+                self.engine.send(frame)
+            except ValueError as e:
+                print_status_message(f"Ошибка: {e}", "error")
+                
+        else:
+            if not connection:
+                print_status_message("Ошибка: нет активного соединения", "error")
+                return
+                
+            if not connection.is_connected():
+                print_status_message("Ошибка: соединение не установлено", "error")
+                return
+                
+            # Используем оригинальный текст user_input для отправки сообщения
+            try:
+                self.channel.send(user_input.encode('utf-8'))
+            except ValueError as e:
+                print_status_message(f"Ошибка: {e}", "error")
+                return
+            print_status_message(f"Отправка [0x{connection.local_addr:02X} → 0x{connection.remote_addr:02X}]: {user_input}", "info")
 
 def main():
     # Проверяем аргументы командной строки
     if len(sys.argv) > 1:
         try:
             port_number = sys.argv[1]
-            port = f"/dev/ttys{port_number.zfill(3)}"
+            # Полный путь к порту или номер псевдотерминала /dev/ttysNNN (macOS)
+            port = port_number if '/' in port_number else f"/dev/ttys{port_number.zfill(3)}"
             if not os.path.exists(port):
                 print(f"Порт {port} не существует")
                 return
@@ -242,118 +474,11 @@ def main():
     print(f"Ваш адрес: \033[1;33m0x{MY_ADDR:02X}\033[0m")
     print(f"Ваш никнейм: \033[1;36m{nickname}\033[0m")
     
-    connection = None
     print_help()
+    client = SenderClient(ser, config, nickname)
     
     try:
-        while True:
-            # Проверяем таймауты если есть активное соединение
-            if connection:
-                # Проверяем таймаут соединения
-                if connection.is_connection_timeout():
-                    print_status_message(f"Соединение с {connection.remote_nick} разорвано по таймауту", "warning")
-                    connection = None
-                    continue
-                
-                # Проверяем ответы
-                if check_for_response(ser, connection):
-                    connection = None  # Обнуляем соединение если оно было закрыто
-            
-            # Проверяем ввод пользователя
-            if sys.stdin in select.select([sys.stdin], [], [], 0)[0]:
-                prompt = get_status_prompt(connection) if connection else "\033[1;37m[READY]\033[0m"
-                user_input = safe_input(f"{prompt}> ").strip()
-                if not user_input:
-                    continue
-                
-                # Команду приводим к нижнему регистру для проверки
-                command = user_input.lower()
-                    
-                if command == 'exit':
-                    if connection and connection.state == ConnectionState.CONNECTED:
-                        print_status_message("Разрываем соединение перед выходом...", "warning")
-                        send_frame(ser, connection.disconnect())
-                    break
-                    
-                elif command == 'help':
-                    print_help()
-                    
-                elif command == 'status':
-                    if connection:
-                        print("\n" + str(connection))
-                        if connection.state == ConnectionState.CONNECTING:
-                            print_status_message(f"Попытка {connection.retry_count} из {connection.max_retries}", "info")
-                    else:
-                        print_status_message(f"Нет активного соединения. Ваш адрес: 0x{MY_ADDR:02X}", "info")
-                    
-                elif command == 'config':
-                    # Сохраняем текущие настройки
-                    old_config = config
-                    
-                    # Настраиваем новые параметры
-                    new_config = configure_port()
-                    if new_config:
-                        # Если конфигурация изменилась
-                        if new_config != old_config:
-                            # Сохраняем новую конфигурацию
-                            new_config.save()
-                            config = new_config
-                            print_status_message("Конфигурация сохранена", "success")
-                            print_status_message("Для применения новых настроек перезапустите программу", "warning")
-                        else:
-                            print_status_message("Конфигурация не изменилась", "info")
-                    
-                elif command.startswith('connect'):
-                    if connection:
-                        print_status_message("Уже есть активное соединение", "error")
-                        continue
-                        
-                    # Парсим адрес из команды или запрашиваем его
-                    parts = command.split()
-                    if len(parts) > 1:
-                        remote_addr = parse_address(parts[1])
-                    else:
-                        addr_input = safe_input("Введите адрес узла (в формате 0xXX): ")
-                        remote_addr = parse_address(addr_input)
-                    
-                    if remote_addr is None:
-                        continue
-                        
-                    connection = Connection(MY_ADDR, remote_addr, local_nick=nickname)
-                    try:
-                        frame = connection.connect()
-                        print_status_message(f"Отправка запроса на соединение с 0x{connection.remote_addr:02X}...", "info")
-                        send_frame(ser, frame)
-                    except ValueError as e:
-                        print_status_message(f"Ошибка: {e}", "error")
-                        connection = None
-                        
-                elif command == 'disconnect':
-                    if not connection:
-                        print_status_message("Нет активного соединения", "error")
-                        continue
-                        
-                    try:
-                        frame = connection.disconnect()
-                        print_status_message(f"Отправка запроса на разрыв соединения с 0x{connection.remote_addr:02X}...", "warning")
-                        send_frame(ser, frame)
-                    except ValueError as e:
-                        print_status_message(f"Ошибка: {e}", "error")
-                        
-                else:
-                    if not connection:
-                        print_status_message("Ошибка: нет активного соединения", "error")
-                        continue
-                        
-                    if not connection.is_connected():
-                        print_status_message("Ошибка: соединение не установлено", "error")
-                        continue
-                        
-                    # Используем оригинальный текст user_input для отправки сообщения
-                    frame = connection.create_frame(Frame.TYPE_I, user_input.encode('utf-8'))
-                    print_status_message(f"Отправка [0x{frame.sender:02X} → 0x{frame.receiver:02X}]: {user_input}", "info")
-                    send_frame(ser, frame)
-            
+        asyncio.run(client.run())
     except KeyboardInterrupt:
         print_status_message("\nЗавершение работы...", "warning")
     finally:
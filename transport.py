@@ -0,0 +1,247 @@
+"""Виртуальные последовательные порты для тестов и замеров без socat.
+
+Порты повторяют ту часть интерфейса serial.Serial, которой пользуются
+wire, engine и CLI: read/write/flush/in_waiting/fileno/cancel_read/close, атрибуты
+timeout и baudrate, apply_settings/get_settings. fileno() возвращает
+дескриптор канала уведомлений, который готов к чтению, пока во входном
+буфере есть данные, поэтому порты работают с loop.add_reader и select.
+"""
+import heapq
+import math
+import os
+import random
+import threading
+import time
+
+class LoopbackPort:
+    """Один конец виртуальной пары портов в памяти."""
+
+    def __init__(self, baudrate: int = 9600, timeout: float | None = None, bits_per_byte: int = 10):
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.bits_per_byte = bits_per_byte  # Старт, 8 бит данных, стоп (8N1)
+        self.is_open = True
+        self.peer = None  # Куда уходят записанные данные: другой порт или линия с искажениями
+        self._buffer = bytearray()
+        self._cancelled = False
+        self._cond = threading.Condition()
+        self._notify_r, self._notify_w = os.pipe()
+        os.set_blocking(self._notify_r, False)
+        os.set_blocking(self._notify_w, False)
+
+    @property
+    def in_waiting(self) -> int:
+        with self._cond:
+            return len(self._buffer)
+
+    def fileno(self) -> int:
+        return self._notify_r
+
+    def write(self, data) -> int:
+        if not self.is_open:
+            raise OSError("Порт закрыт")
+        data = bytes(data)
+        self.peer.deliver(data, self)
+        return len(data)
+
+    def flush(self):
+        """Ждет, пока записанные данные уйдут в линию."""
+        drain = getattr(self.peer, 'drain', None)
+        if drain is not None:
+            drain(self)
+
+    def read(self, size: int = 1) -> bytes:
+        """Читает до size байт, ожидая не дольше timeout (None - без ограничения)."""
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._cond:
+            while not self._buffer and self.is_open and not self._cancelled:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return b''
+                self._cond.wait(remaining)
+            if not self.is_open or self._cancelled:
+                self._cancelled = False
+                return b''
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            if not self._buffer:
+                self._drain_notify()
+            return data
+
+    def cancel_read(self):
+        """Прерывает ожидающий read() из другого потока (как serial.Serial.cancel_read)."""
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._buffer.clear()
+            self._drain_notify()
+
+    def get_settings(self) -> dict:
+        return {'baudrate': self.baudrate, 'timeout': self.timeout}
+
+    def apply_settings(self, settings: dict):
+        """Меняет настройки открытого порта (поддерживаются baudrate и timeout)."""
+        if 'baudrate' in settings:
+            self.baudrate = settings['baudrate']
+        if 'timeout' in settings:
+            self.timeout = settings['timeout']
+
+    def close(self):
+        if not self.is_open:
+            return
+        if isinstance(self.peer, ImpairedLine):
+            self.peer.close()
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+        os.close(self._notify_r)
+        os.close(self._notify_w)
+
+    def deliver(self, data: bytes, source=None):
+        """Кладет данные во входной буфер (вызывается противоположной стороной)."""
+        with self._cond:
+            if not self.is_open:
+                return
+            if not self._buffer and data:
+                os.write(self._notify_w, b'\x01')
+            self._buffer += data
+            self._cond.notify_all()
+
+    def _drain_notify(self):
+        try:
+            os.read(self._notify_r, 64)
+        except BlockingIOError:
+            pass
+
+def loopback_pair(**kwargs) -> tuple[LoopbackPort, LoopbackPort]:
+    """Создает пару соединенных портов без задержек и искажений."""
+    a, b = LoopbackPort(**kwargs), LoopbackPort(**kwargs)
+    a.peer, b.peer = b, a
+    return a, b
+
+class ImpairedLine:
+    """Линия в одну сторону с эмуляцией скорости и искажениями.
+
+    Время передачи считается по baudrate и bits_per_byte передающего порта,
+    данные появляются у получателя, когда последний байт записи "дошел".
+    Если скорости портов не совпадают, получатель видит мусор, как на
+    настоящей линии. Искажения применяются к каждой записи (write):
+      bit_error_rate - вероятность инверсии каждого бита;
+      burst_rate, burst_length - вероятность пакета ошибок и его длина в битах;
+      drop_rate, duplicate_rate - вероятность потерять или продублировать запись.
+    """
+
+    def __init__(self, target: LoopbackPort, bit_error_rate: float = 0.0, burst_rate: float = 0.0,
+                 burst_length: int = 16, drop_rate: float = 0.0, duplicate_rate: float = 0.0,
+                 emulate_timing: bool = True, rng: random.Random | None = None):
+        self.target = target
+        self.bit_error_rate = bit_error_rate
+        self.burst_rate = burst_rate
+        self.burst_length = burst_length
+        self.drop_rate = drop_rate
+        self.duplicate_rate = duplicate_rate
+        self.emulate_timing = emulate_timing
+        self.rng = rng or random.Random()
+        self.stats = {'writes': 0, 'bytes': 0, 'bit_errors': 0, 'bursts': 0, 'dropped': 0, 'duplicated': 0}
+        self._line_free_at = 0.0  # Когда линия освободится от уже записанного
+        self._queue = []          # (время доставки, номер, данные)
+        self._counter = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def deliver(self, data: bytes, source: LoopbackPort):
+        self.stats['writes'] += 1
+        self.stats['bytes'] += len(data)
+        now = time.monotonic()
+        duration = 0.0
+        if self.emulate_timing and source.baudrate:
+            duration = len(data) * source.bits_per_byte / source.baudrate
+        with self._cond:
+            start = max(now, self._line_free_at)
+            self._line_free_at = start + duration
+            arrival = self._line_free_at
+
+            if self.rng.random() < self.drop_rate:
+                self.stats['dropped'] += 1
+                return
+            if source.baudrate != self.target.baudrate:
+                data = bytes(self.rng.getrandbits(8) for _ in data)
+            else:
+                data = self._corrupt(data)
+            copies = 2 if self.rng.random() < self.duplicate_rate else 1
+            self.stats['duplicated'] += copies - 1
+            for _ in range(copies):
+                heapq.heappush(self._queue, (arrival, self._counter, data))
+                self._counter += 1
+            self._cond.notify_all()
+
+    def drain(self, source: LoopbackPort):
+        """Блокирует, пока линия не передаст все записанное (аналог tcdrain)."""
+        while True:
+            with self._cond:
+                remaining = self._line_free_at - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _corrupt(self, data: bytes) -> bytes:
+        """Вносит одиночные и пакетные ошибки."""
+        nbits = len(data) * 8
+        flips = []
+        if self.bit_error_rate > 0 and nbits:
+            # Пропуски между ошибками распределены геометрически - не перебираем каждый бит
+            log_q = math.log1p(-self.bit_error_rate) if self.bit_error_rate < 1 else None
+            pos = -1
+            while True:
+                if log_q is None:
+                    pos += 1
+                else:
+                    pos += 1 + int(math.log(1.0 - self.rng.random()) / log_q)
+                if pos >= nbits:
+                    break
+                flips.append(pos)
+        if self.burst_rate > 0 and nbits and self.rng.random() < self.burst_rate:
+            self.stats['bursts'] += 1
+            start = self.rng.randrange(nbits)
+            flips.extend(bit for bit in range(start, min(nbits, start + self.burst_length))
+                         if self.rng.random() < 0.5)
+        if not flips:
+            return data
+        self.stats['bit_errors'] += len(flips)
+        corrupted = bytearray(data)
+        for bit in flips:
+            corrupted[bit >> 3] ^= 1 << (bit & 7)
+        return bytes(corrupted)
+
+    def _run(self):
+        """Поток доставки: отдает данные получателю в момент их прихода."""
+        with self._cond:
+            while not self._closed:
+                if not self._queue:
+                    self._cond.wait()
+                    continue
+                delay = self._queue[0][0] - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                _, _, data = heapq.heappop(self._queue)
+                self.target.deliver(data)
+
+def impaired_pair(baudrate: int = 9600, timeout: float | None = None, **impairments) -> tuple[LoopbackPort, LoopbackPort]:
+    """Создает пару портов, соединенных двумя линиями ImpairedLine с одинаковыми параметрами."""
+    seed = impairments.pop('seed', None)
+    rng = random.Random(seed)
+    a, b = LoopbackPort(baudrate, timeout), LoopbackPort(baudrate, timeout)
+    a.peer = ImpairedLine(b, rng=random.Random(rng.random()), **impairments)
+    b.peer = ImpairedLine(a, rng=random.Random(rng.random()), **impairments)
+    return a, b
@@ -0,0 +1,149 @@
+from frame import Frame
+from fec import decode_body, encode_body
+from metrics import METRICS
+
+# Разделитель кадров на линии. Внутри тела кадра 0xFF не встречается:
+# коды Хэмминга (7,4) занимают 7 бит, остальные схемы используют стаффинг (fec.py).
+DELIMITER = 0xFF
+
+# Максимум байт тела кадра: заголовок, 255 байт данных, контрольная сумма
+# и стоп-байт в самой избыточной схеме с худшим случаем стаффинга, с запасом
+MAX_FRAME_CODES = 2048
+
+def encode_frame(frame: Frame) -> bytes:
+    """Кодирует фрейм целиком в буфер для отправки: разделитель, тело в схеме frame.codec, разделитель."""
+    data = bytes([DELIMITER]) + encode_body(frame.codec, frame.to_bytes()) + bytes([DELIMITER])
+    if METRICS.enabled:
+        METRICS.inc('wire.frames_sent')
+        METRICS.inc('wire.bytes_sent', len(data))
+    return data
+
+def send_frame(ser, frame: Frame):
+    """Отправляет фрейм одной записью.
+
+    Темп передачи задает сам порт (скорость и управление потоком из SerialConfig),
+    flush() дожидается, пока буфер передатчика опустеет.
+    """
+    ser.write(encode_frame(frame))
+    ser.flush()
+
+class FrameDecoder:
+    """Инкрементальный разборщик потока байт с линии.
+
+    Принимает куски произвольной длины (то, что вернул ser.read) и выдает
+    готовые фреймы. Незавершенный кадр сохраняется между вызовами feed().
+    Коды копируются в заранее выделенный буфер, который переиспользуется
+    для каждого кадра, поэтому разбор не выделяет память на каждый байт.
+
+    С keep_codes=True после выдачи каждого фрейма в last_codes лежит копия
+    его кодов с линии (без разделителей) - для пересылки кадра без
+    повторного кодирования.
+    """
+
+    def __init__(self, capacity: int = MAX_FRAME_CODES, keep_codes: bool = False):
+        self.keep_codes = keep_codes
+        self.last_codes = b''
+        self._codes = bytearray(capacity)
+        self._view = memoryview(self._codes)
+        self._size = 0
+        self._started = False   # Видели разделитель, собираем кадр
+        self._overflow = False  # Текущий кадр не влез в буфер, ждем следующий разделитель
+        self.frames = 0         # Успешно разобранные фреймы
+        self.errors = 0         # Отброшенные кадры
+        self.bytes = 0          # Принятые байты
+        self.corrected = 0      # Исправленные коды
+        self.crc_errors = 0     # Кадры с неверной контрольной суммой (выдаются с crc_ok=False)
+
+    def reset(self):
+        """Сбрасывает состояние незавершенного кадра."""
+        self._size = 0
+        self._started = False
+        self._overflow = False
+
+    def feed(self, chunk):
+        """Разбирает очередной кусок данных и выдает завершенные фреймы."""
+        if not isinstance(chunk, (bytes, bytearray)):
+            chunk = bytes(chunk)
+        self.bytes += len(chunk)
+        if METRICS.enabled:
+            METRICS.inc('wire.bytes_received', len(chunk))
+        view = memoryview(chunk)
+        pos = 0
+        end = len(chunk)
+        while pos < end:
+            delim = chunk.find(DELIMITER, pos)
+            if delim == -1:
+                if self._started:
+                    self._append(view[pos:end])
+                break
+
+            if self._started:
+                self._append(view[pos:delim])
+            # Разделитель закрывает текущий кадр и одновременно может открывать следующий
+            frame = self._finish()
+            if frame is not None:
+                yield frame
+            self._started = True
+            pos = delim + 1
+
+    def _append(self, codes: memoryview):
+        """Дописывает коды в буфер текущего кадра."""
+        if self._overflow:
+            return
+        size = self._size + len(codes)
+        if size > len(self._codes):
+            self._overflow = True
+            return
+        self._view[self._size:size] = codes
+        self._size = size
+
+    def _finish(self) -> Frame | None:
+        """Декодирует накопленный кадр и сбрасывает буфер."""
+        size, overflow = self._size, self._overflow
+        self._size = 0
+        self._overflow = False
+        if overflow:
+            self.errors += 1
+            if METRICS.enabled:
+                METRICS.inc('wire.framing_errors')
+            return None
+        if not size:
+            return None  # Пустой промежуток между разделителями
+        try:
+            codec, data, corrected = decode_body(self._view[:size])
+            # data - новый буфер для каждого кадра, поэтому данные фрейма на него ссылаются без копии
+            frame = Frame.parse(data)
+            if frame.size() != len(data):
+                raise ValueError(f"Длина кадра: {len(data)}, ожидаемая: {frame.size()}")
+        except ValueError:
+            self.errors += 1
+            if METRICS.enabled:
+                METRICS.inc('wire.framing_errors')
+            return None
+        frame.codec = codec
+        frame.corrected = corrected
+        if self.keep_codes:
+            self.last_codes = bytes(self._view[:size])
+        self.corrected += corrected
+        self.frames += 1
+        if not frame.crc_ok:
+            self.crc_errors += 1
+        if METRICS.enabled:
+            METRICS.inc('wire.frames_received')
+            if not frame.crc_ok:
+                METRICS.inc('wire.crc_errors')
+        return frame
+
+    def bit_error_rate(self, min_bytes: int = 4096) -> float | None:
+        """Грубая оценка частоты битовых ошибок на приеме (None, пока данных мало).
+
+        Исправленный код - одна ошибка, отброшенный или не прошедший
+        контрольную сумму кадр - не меньше двух.
+        """
+        if self.bytes < min_bytes:
+            return None
+        return (self.corrected + 2 * (self.errors + self.crc_errors)) / (8 * self.bytes)
+
+def read_frames(ser, decoder: FrameDecoder):
+    """Читает все, что накопилось в порту (или ждет хотя бы байт), и выдает фреймы."""
+    return decoder.feed(ser.read(ser.in_waiting or 1))